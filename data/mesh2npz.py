@@ -1,14 +1,13 @@
-from dolfin import *
 import sys
 import numpy as np
+from unray.io import read
 filename = sys.argv[1]
-mesh = Mesh(filename)
-cells = mesh.cells()
-coordinates = mesh.coordinates()
-npname = filename.replace(".xml.gz", ".npz")
-np.savez_compressed(npname, cells=cells, points=coordinates)
+# Reads dolfin .xml/.xml.gz and .vtu files without needing dolfin
+data = read(filename)
+npname = filename.replace(".xml.gz", ".npz").replace(".xml", ".npz").replace(".vtu", ".npz")
+# Uncompressed, such that unray.io can memory map the arrays
+np.savez(npname, cells=data["cells"], points=data["points"])
 
 # Load like this:
-#obj = np.load(npname)
-#cells = obj["cells"]
-#points = obj["points"]
+#from unray.io import load_mesh
+#mesh = load_mesh(npname)
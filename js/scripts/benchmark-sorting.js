@@ -0,0 +1,133 @@
+'use strict';
+
+// Measure per-frame cost of view dependent cell sorting.
+// Run after `npm run build:lib`, or use `npm run benchmark:sorting`.
+
+const {
+    create_sorting_workspace, sort_cells,
+    create_topological_workspace, topological_sort_cells
+} = require('../lib/sorting');
+
+// Build a unit cube mesh with n^3 subcubes split into 6 tetrahedra each
+function create_box_mesh(n) {
+    const m = n + 1;
+    const coordinates = new Float32Array(3 * m * m * m);
+    for (let k = 0, v = 0; k < m; ++k) {
+        for (let j = 0; j < m; ++j) {
+            for (let i = 0; i < m; ++i, v += 3) {
+                coordinates[v] = i / n;
+                coordinates[v + 1] = j / n;
+                coordinates[v + 2] = k / n;
+            }
+        }
+    }
+    const tets = [
+        [0, 1, 3, 7], [0, 1, 5, 7], [0, 2, 3, 7],
+        [0, 2, 6, 7], [0, 4, 5, 7], [0, 4, 6, 7],
+    ];
+    const cells = new Int32Array(4 * 6 * n * n * n);
+    let c = 0;
+    for (let k = 0; k < n; ++k) {
+        for (let j = 0; j < n; ++j) {
+            for (let i = 0; i < n; ++i) {
+                const v0 = i + m * (j + m * k);
+                const corners = [
+                    v0, v0 + 1, v0 + m, v0 + m + 1,
+                    v0 + m * m, v0 + m * m + 1, v0 + m * m + m, v0 + m * m + m + 1,
+                ];
+                for (let t of tets) {
+                    for (let r = 0; r < 4; ++r) {
+                        cells[c++] = corners[t[r]];
+                    }
+                }
+            }
+        }
+    }
+    return { cells, coordinates };
+}
+
+// Compute cell adjacency by sorting faces by their vertices with
+// a counting sort per vertex (like unray.meshutils.compute_cell_neighbors)
+function compute_cell_neighbors(cells, num_vertices) {
+    const face_vertices = [[1, 2, 3], [0, 3, 2], [0, 1, 3], [0, 2, 1]];
+    const num_faces = cells.length;
+    const faces = new Int32Array(3 * num_faces);
+    for (let f = 0; f < num_faces; ++f) {
+        const i = f - f % 4;
+        const v = face_vertices[f % 4].map(r => cells[i + r]).sort((a, b) => a - b);
+        faces.set(v, 3 * f);
+    }
+
+    let order = new Uint32Array(num_faces);
+    let tmp = new Uint32Array(num_faces);
+    for (let f = 0; f < num_faces; ++f) {
+        order[f] = f;
+    }
+    const counts = new Uint32Array(num_vertices + 1);
+    for (let r = 2; r >= 0; --r) {
+        counts.fill(0);
+        for (let f = 0; f < num_faces; ++f) {
+            ++counts[faces[3 * f + r] + 1];
+        }
+        for (let v = 0; v < num_vertices; ++v) {
+            counts[v + 1] += counts[v];
+        }
+        for (let q = 0; q < num_faces; ++q) {
+            const f = order[q];
+            tmp[counts[faces[3 * f + r]]++] = f;
+        }
+        [order, tmp] = [tmp, order];
+    }
+
+    const neighbors = new Int32Array(num_faces).fill(-1);
+    for (let q = 1; q < num_faces; ++q) {
+        const f = order[q - 1];
+        const g = order[q];
+        if (faces[3 * f] === faces[3 * g] && faces[3 * f + 1] === faces[3 * g + 1]
+                && faces[3 * f + 2] === faces[3 * g + 2]) {
+            neighbors[f] = Math.floor(g / 4);
+            neighbors[g] = Math.floor(f / 4);
+        }
+    }
+    return neighbors;
+}
+
+function benchmark(target_cells, repeats) {
+    const n = Math.round(Math.cbrt(target_cells / 6));
+    const { cells, coordinates } = create_box_mesh(n);
+    const num_cells = cells.length / 4;
+    const neighbors = compute_cell_neighbors(cells, coordinates.length / 3);
+    const ordering = new Float32Array(num_cells);
+
+    const sorters = {
+        depth: (workspace, pos, dir, perspective) => sort_cells(
+            ordering, cells, coordinates, pos, dir, perspective, workspace),
+        topological: (workspace, pos, dir, perspective) => topological_sort_cells(
+            ordering, cells, neighbors, coordinates, pos, dir, perspective, workspace),
+    };
+    const workspaces = {
+        depth: create_sorting_workspace(num_cells),
+        topological: create_topological_workspace(num_cells),
+    };
+
+    for (let name in sorters) {
+        for (let perspective of [true, false]) {
+            // Rotate camera around the mesh between frames
+            const start = Date.now();
+            for (let r = 0; r < repeats; ++r) {
+                const angle = 2 * Math.PI * r / repeats;
+                const dir = [Math.cos(angle), Math.sin(angle), 0.3];
+                const pos = [0.5 - 3 * dir[0], 0.5 - 3 * dir[1], 0.5 - 3 * dir[2]];
+                sorters[name](workspaces[name], pos, dir, perspective);
+            }
+            const ms = (Date.now() - start) / repeats;
+            const projection = perspective ? "perspective" : "orthographic";
+            console.log(`${num_cells} cells, ${name}, ${projection}: ${ms.toFixed(1)} ms/frame`);
+        }
+    }
+}
+
+if (require.main === module) {
+    benchmark(1e6, 10);
+    benchmark(1e7, 5);
+}
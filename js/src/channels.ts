@@ -1,5 +1,6 @@
 "use strict";
 
+import * as _ from "underscore";
 import * as THREE from "three";
 
 import {
@@ -7,7 +8,7 @@ import {
 } from "./managers";
 
 import {
-    delete_undefined, Method, IPlotData
+    delete_undefined, Method, IPlotData, AttributeDict, TypedArray
 } from "./utils";
 
 import {
@@ -49,6 +50,46 @@ function compute_texture_shape(size: number) {
     return [width, height];
 }
 
+// Float32 textures and attributes represent integers exactly up to
+// 2^24, which webgl1 limits vertex indices to. Beyond that vertex
+// coordinates are stored in rows of split_index_width vertices,
+// and vertex indices are split into their column and row.
+export
+const max_exact_index = 1 << 24;
+
+export
+const split_index_width = 1 << 12;
+
+export
+function compute_vertex_texture_shape(num_vertices: number) {
+    if (num_vertices > max_exact_index) {
+        return [split_index_width, Math.ceil(num_vertices / split_index_width)];
+    }
+    return compute_texture_shape(num_vertices);
+}
+
+/**
+ * Split indices into the low and high parts of index = high * split_index_width + low,
+ * or return null if all indices are represented exactly as float32.
+ */
+export
+function split_indices(indices: TypedArray): { low: Int32Array, high: Int32Array } | null {
+    let max = 0;
+    for (let i = 0; i < indices.length; ++i) {
+        max = Math.max(max, indices[i]);
+    }
+    if (max < max_exact_index) {
+        return null;
+    }
+    const low = new Int32Array(indices.length);
+    const high = new Int32Array(indices.length);
+    for (let i = 0; i < indices.length; ++i) {
+        high[i] = Math.floor(indices[i] / split_index_width);
+        low[i] = indices[i] - high[i] * split_index_width;
+    }
+    return { low, high };
+}
+
 const default_defines: { [key: string]: IDefines} = {
     surface: {
         ENABLE_SURFACE_MODEL: 1,
@@ -179,7 +220,12 @@ export
 interface IShaderOptions {
     uniforms: IUniformMap;
     defines: IDefines;
-    attributes?: any;
+    attributes: AttributeDict;
+}
+
+export
+interface IChannelDataMap {
+    [channel: string]: IShaderOptions;
 }
 
 export
@@ -188,6 +234,24 @@ interface IHandlerOptions {
     managers: IManagers;
 }
 
+/**
+ * Gather the items of array at the given item indices,
+ * for drawing a subset of the cells of a mesh.
+ */
+export
+function gather_items(array: TypedArray, indices: TypedArray, item_size: number): TypedArray {
+    const ArrayType = array.constructor as { new(size: number): TypedArray };
+    const result = new ArrayType(indices.length * item_size);
+    for (let i = 0; i < indices.length; ++i) {
+        const src = indices[i] * item_size;
+        const dst = i * item_size;
+        for (let j = 0; j < item_size; ++j) {
+            result[dst + j] = array[src + j];
+        }
+    }
+    return result;
+}
+
 export
 type ChannelHandler = (shaderOptions: IShaderOptions,
                        desc: encodings.IEncodingEntry,
@@ -201,24 +265,50 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
             throw new Error("Missing required cells field");
         }
         const key = desc.field;
-        const array = data[key];
-
-        const num_tetrahedrons = array.length / 4;
-        const texture_shape = compute_texture_shape(num_tetrahedrons);
 
-        uniforms['u_cell_texture_shape'] = { value: [...texture_shape] };
-
-        const prev = get_attrib<THREE.DataTexture>(uniforms['t_cells'], "value");
-        const value = managers.array_texture.update(
-            key,
-            {array: array, dtype: "int32", item_size: 4, texture_shape: texture_shape},
-            prev);
-        uniforms['t_cells'] = { value };
-
-        if (0) {  // Use attributes if unsorted: c_cells, c_ordering
-            //attributes.c_cells = managers.buffers.update(
-            //    desc.field, data[desc.field], attributes.c_cells);
-            // attributes.c_ordering = FIXME;
+        if (defines['ENABLE_CELL_ORDERING']) {
+            // Cells are looked up in texture via the c_ordering attribute
+            const array = data[key];
+            const num_tetrahedrons = array.length / 4;
+            const texture_shape = compute_texture_shape(num_tetrahedrons);
+
+            uniforms['u_cell_texture_shape'] = { value: [...texture_shape] };
+
+            // Vertex indices beyond 2^24 are split over two textures
+            const split = split_indices(array);
+            const prev = get_attrib<THREE.DataTexture>(uniforms['t_cells'], "value");
+            const value = managers.array_texture.update(
+                key,
+                {array: split ? split.low : array, dtype: "int32", item_size: 4, texture_shape: texture_shape},
+                prev);
+            uniforms['t_cells'] = { value };
+            if (split) {
+                const prev_high = get_attrib<THREE.DataTexture>(uniforms['t_cells_high'], "value");
+                const high = managers.array_texture.update(
+                    `${key}:high`,
+                    {array: split.high, dtype: "int32", item_size: 4, texture_shape: texture_shape},
+                    prev_high);
+                uniforms['t_cells_high'] = { value: high };
+                defines['ENABLE_SPLIT_VERTEX_INDICES'] = 1;
+            }
+        } else {
+            // Unsorted, pass cells directly as instanced attribute,
+            // or only the subset of cells to draw if given
+            const subset = desc.subset ? data[desc.subset] : undefined;
+            const subset_key = subset ? `${key}[${desc.subset}]` : key;
+            const array = subset ? gather_items(data[key], subset, 4) : data[key];
+
+            // Vertex indices beyond 2^24 are split over two attributes
+            const split = split_indices(array);
+            attributes.c_cells = managers.cells_buffer.update(
+                subset_key, {array: split ? split.low : array, dtype: "int32", item_size: 4},
+                attributes.c_cells as THREE.InstancedBufferAttribute);
+            if (split) {
+                attributes.c_cells_high = managers.cells_buffer.update(
+                    `${subset_key}:high`, {array: split.high, dtype: "int32", item_size: 4},
+                    attributes.c_cells_high as THREE.InstancedBufferAttribute);
+                defines['ENABLE_SPLIT_VERTEX_INDICES'] = 1;
+            }
         }
     },
     coordinates: (shaderOptions: IShaderOptions, desc: encodings.ICellsEncodingEntry, handlerOptions: IHandlerOptions) => {
@@ -231,7 +321,7 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
         const array = data[key];
 
         const num_vertices = array.length / 3;
-        const texture_shape = compute_texture_shape(num_vertices);
+        const texture_shape = compute_vertex_texture_shape(num_vertices);
         uniforms['u_vertex_texture_shape'] = { value: [...texture_shape] };
 
         const prev = get_attrib<THREE.DataTexture>(uniforms['t_coordinates'], "value");
@@ -257,20 +347,28 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
             const array = data[key];
             const dtype = "int32";
             const item_size = 1;
-            const texture_shape = compute_texture_shape(array.length / item_size);
-            const spec = {array, dtype, item_size, texture_shape};
 
-            const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
-
-            const value = managers.array_texture.update(key, spec, prev);
-            uniforms[uname] = { value };
+            if (defines['ENABLE_CELL_ORDERING']) {
+                const texture_shape = compute_texture_shape(array.length / item_size);
+                const spec = {array, dtype, item_size, texture_shape};
+
+                const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
+
+                const value = managers.array_texture.update(key, spec, prev);
+                uniforms[uname] = { value };
+            } else {
+                // Unsorted, pass indicators directly as instanced attribute,
+                // gathered for the same subset of cells as c_cells
+                const subset = desc.subset ? data[desc.subset] : undefined;
+                attributes.c_cell_indicators = managers.cells_buffer.update(
+                    subset ? `${key}[${desc.subset}]` : key,
+                    {array: subset ? gather_items(array, subset, item_size) : array, dtype, item_size},
+                    attributes.c_cell_indicators as THREE.InstancedBufferAttribute);
+            }
 
             uniforms['u_cell_indicator_value'] = { value: desc.value };
 
             defines['ENABLE_CELL_INDICATORS'] = 1;
-
-            // FIXME: If not sorted, use attributes instead:
-            // attributes.c_cell_indicators = managers.buffers.update(key, array, attributes.c_cell_indicators);
         }
     },
     wireframe: (shaderOptions: IShaderOptions, desc: encodings.IWireframeEncodingEntry) => {
@@ -300,7 +398,8 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
             const array = data[key];
             const dtype = "float32";
             const item_size = 1;
-            const texture_shape = compute_texture_shape(array.length / item_size);
+            // Same layout as coordinates, looked up by vertex uv
+            const texture_shape = compute_vertex_texture_shape(array.length / item_size);
             const spec = {array, dtype, item_size, texture_shape};
 
             const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
@@ -335,6 +434,25 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
 
             defines['ENABLE_DENSITY_LUT'] = 1;
         }
+
+        // Pre-integrated lut is only needed when values vary along rays
+        if (desc.lut_preintegrated && defines['ENABLE_DENSITY_BACK']) {
+            const key = desc.lut_preintegrated;
+            const uname = "t_density_preintegrated";
+
+            const array = data[key];
+            const item_size = 1;
+            const dtype = "float32";
+            const size = Math.round(Math.sqrt(array.length / item_size));
+            const spec = {array, dtype, item_size, texture_shape: [size, size]};
+
+            const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
+
+            const value = managers.lut_texture.update(key, spec, prev);
+            uniforms[uname] = { value };
+
+            defines['ENABLE_DENSITY_PREINTEGRATED'] = 1;
+        }
     },
     emission: (shaderOptions: IShaderOptions, desc: encodings.IEmissionEncodingEntry, handlerOptions: IHandlerOptions) => {
         const {uniforms, defines} = shaderOptions;
@@ -348,7 +466,8 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
             const array = data[key];
             const item_size = 1;
             const dtype = "float32";
-            const texture_shape = compute_texture_shape(array.length / item_size);
+            // Same layout as coordinates, looked up by vertex uv
+            const texture_shape = compute_vertex_texture_shape(array.length / item_size);
             const spec = {array, dtype, item_size, texture_shape};
 
             const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
@@ -383,11 +502,30 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
             defines['ENABLE_EMISSION_LUT'] = 1;
         }
 
+        if (desc.lut_preintegrated && defines['ENABLE_EMISSION_BACK']) {
+            const key = desc.lut_preintegrated;
+            const uname = "t_emission_preintegrated";
+
+            const array = data[key];
+            const item_size = 3;
+            const dtype = "float32";
+            const size = Math.round(Math.sqrt(array.length / item_size));
+            const spec = {array, dtype, item_size, texture_shape: [size, size]};
+
+            const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
+
+            const value = managers.lut_texture.update(key, spec, prev);
+            uniforms[uname] = { value };
+
+            defines['ENABLE_EMISSION_PREINTEGRATED'] = 1;
+        }
+
         // This should always have a valid value
         uniforms['u_emission_color'] = { value: new THREE.Color(desc.color) };
     },
-    isovalues: (shaderOptions: IShaderOptions, desc: encodings.IIsoValuesEncodingEntry) => {
+    isovalues: (shaderOptions: IShaderOptions, desc: encodings.IIsoValuesEncodingEntry, handlerOptions: IHandlerOptions) => {
         const {uniforms, defines} = shaderOptions;
+        const {data, managers} = handlerOptions;
         uniforms['u_isovalue'] = { value: desc.value };
 
         const scale_modes = ["linear", "log", "power"];
@@ -412,11 +550,37 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
                 return { USING_ISOSURFACE_MODE_LOG: 1 };
             case "power":
                 return { USING_ISOSURFACE_MODE_POWER: 1 };
+            case "list":
+                return { USING_ISOSURFACE_MODE_LIST: 1 };
             default:
                 throw new Error(`Invalid isovalue mode ${mode}.`);
             }
         };
         Object.assign(defines, mode2define(desc.mode));
+
+        // Explicit isovalues are looked up in a table from python
+        if (desc.mode === "list") {
+            if (!desc.table) {
+                throw new Error("Missing isosurface table for isovalue mode list.");
+            }
+            const key = desc.table;
+            const uname = "t_isosurface";
+
+            const array = data[key];
+            const item_size = 4;
+            const dtype = "float32";
+            const size = Math.round(Math.sqrt(array.length / item_size));
+            const spec = {array, dtype, item_size, texture_shape: [size, size]};
+
+            const prev = get_attrib<THREE.DataTexture>(uniforms[uname], "value");
+
+            const value = managers.array_texture.update(key, spec, prev);
+            uniforms[uname] = { value };
+
+            if (desc.table_colors) {
+                defines['ENABLE_ISOSURFACE_COLORS'] = 1;
+            }
+        }
     },
     extinction: (shaderOptions: IShaderOptions, desc: encodings.IExtinctionEncodingEntry) => {
         const {uniforms} = shaderOptions;
@@ -426,68 +590,142 @@ const channel_handlers: {[key: string]: ChannelHandler} = {
         const {uniforms} = shaderOptions;
         uniforms['u_exposure'] = { value: Math.pow(2.0, desc.value) };
     },
+    ordering: (shaderOptions: IShaderOptions, desc: encodings.IOrderingEncodingEntry) => {
+        // Cells are ordered before each render in plotstate,
+        // the shader only sees the resulting c_ordering attribute
+    },
 };
 
+/**
+ * Combine encoding with fallback values from the default encoding of method
+ */
 export
-function create_three_data(method: Method,
-                           encoding: encodings.IPartialEncoding,
-                           data: IHandlerOptions['data']) {
-    // const cell_texture_shape = compute_texture_shape(num_tetrahedrons);
-    // const vertex_texture_shape = compute_texture_shape(num_vertices);
-
-    // Initialize new set of uniforms
-    //const defaults = default_uniforms();
-
-    // Combine encoding with fallback values from default_encoding
+function resolve_encoding(method: Method, encoding: encodings.IPartialEncoding): encodings.IPartialEncoding {
     const default_encoding = encodings.default_encodings[method];
-    const user_encoding = encoding;
-    encoding = {} as encodings.IPartialEncoding;
+    const resolved = {} as encodings.IPartialEncoding;
     for (const channel in default_encoding) {
         // FIXME: Make this deep copy? Or perhaps we'll only read from this anyway?
-        encoding[channel] = Object.assign({}, default_encoding[channel], user_encoding[channel]);
+        resolved[channel] = Object.assign({}, default_encoding[channel], encoding[channel]);
+    }
+    return resolved;
+}
+
+/**
+ * Find channels of a resolved encoding that differ from a previous
+ * encoding, either in the channel description or by having new
+ * data arrays referenced by the description.
+ */
+export
+function find_changed_channels(encoding: encodings.IPartialEncoding, data: IPlotData,
+                               prev_encoding: encodings.IPartialEncoding, prev_data: IPlotData): string[] {
+    const changed: string[] = [];
+    for (const channel in encoding) {
+        const desc = encoding[channel];
+        const prev_desc = prev_encoding[channel];
+        // Data ids are the string values found in data
+        const data_changed = _.some(desc as any, (v: any) =>
+            typeof v === "string" && data[v] !== prev_data[v]);
+        if (data_changed || !_.isEqual(desc, prev_desc)) {
+            changed.push(channel);
+        }
+    }
+    for (const channel in prev_encoding) {
+        if (!(channel in encoding)) {
+            changed.push(channel);
+        }
+    }
+    return changed;
+}
+
+/**
+ * Compute uniforms, defines and attributes for a single channel
+ */
+export
+function create_channel_data(method: Method, channel: string,
+                             desc: encodings.IPartialEncodingEntry,
+                             data: IHandlerOptions['data']): IShaderOptions {
+    const update_uniforms = channel_handlers[channel];
+    if (!update_uniforms) {
+        throw new Error(`Missing channel handler for channel ${channel}`);
     }
 
+    // Handlers see the method defaults, e.g. ENABLE_CELL_ORDERING
+    const out_state = {
+        uniforms: {} as IUniformMap,
+        defines: Object.assign({}, default_defines[method]) as IDefines,
+        attributes: {} as AttributeDict,
+    };
+    update_uniforms(out_state, desc as encodings.IEncodingEntry, { data, managers });
+
+    // Remove undefined attributes
+    delete_undefined(out_state.uniforms);
+    delete_undefined(out_state.defines);
+    delete_undefined(out_state.attributes);
+
+    return out_state;
+}
+
+/**
+ * Release the managed textures and buffers of a channel,
+ * called when the channel is replaced or the plot is closed
+ */
+export
+function release_channel_data(channel_data: IShaderOptions) {
+    for (const name in channel_data.uniforms) {
+        const value = channel_data.uniforms[name].value;
+        if (value instanceof THREE.DataTexture) {
+            managers.array_texture.release(value) || managers.lut_texture.release(value);
+        }
+    }
+    for (const name in channel_data.attributes) {
+        managers.cells_buffer.release(channel_data.attributes[name] as THREE.InstancedBufferAttribute);
+    }
+}
+
+/**
+ * Merge uniforms, defines and attributes of all channels,
+ * not including the automatically updated uniforms
+ */
+export
+function combine_channel_data(method: Method, channels: IChannelDataMap): IShaderOptions {
     // Define initial default defines based on method
     const defines: IDefines = Object.assign({}, default_defines[method]);
 
-    // TODO: ENABLE_CELL_ORDERING should be determined by need for sorting based on method
-    defines['ENABLE_CELL_ORDERING'] = 1;
+    // NB! ENABLE_CELL_ORDERING is only in the defaults for methods
+    // that depend on drawing order, other methods get per-cell data
+    // from instanced attributes and skip the cell texture lookups
 
     // Should be updated by camera type in pre-render step:
     defines['ENABLE_PERSPECTIVE_PROJECTION'] = 1;
 
-    // Initialize uniforms that are set by time and view changes
-    const uniforms = default_automatic_uniforms();
-
-    const attributes = {
-        // FIXME: ?
-    };
-
-    // State that the handlers shouldn't touch
-    const in_state = {
-        method, encoding, data, managers //, defaults
-    };
+    const uniforms: IUniformMap = {};
+    const attributes: AttributeDict = {};
+    for (const channel in channels) {
+        const c = channels[channel];
+        Object.assign(uniforms, c.uniforms);
+        Object.assign(defines, c.defines);
+        Object.assign(attributes, c.attributes);
+    }
+    return { uniforms, defines, attributes };
+}
 
-    // State that the handlers will modify in place
-    const out_state = {
-        uniforms, defines, attributes
-    };
+export
+function create_three_data(method: Method,
+                           encoding: encodings.IPartialEncoding,
+                           data: IHandlerOptions['data']) {
+    // Combine encoding with fallback values from default_encoding
+    encoding = resolve_encoding(method, encoding);
 
-    // Map channels to uniforms
-    for (let channel in encoding) {
-        // This modifies uniforms in place
-        const update_uniforms = channel_handlers[channel];
-        const desc = encoding[channel]!;
-        if (!update_uniforms) {
-            throw new Error(`Missing channel handler for channel ${channel}`);
-        }
-        update_uniforms(out_state, desc, in_state);
+    // Map each channel to uniforms, defines and attributes separately,
+    // such that later updates can recompute only changed channels
+    const channels: IChannelDataMap = {};
+    for (const channel in encoding) {
+        channels[channel] = create_channel_data(method, channel, encoding[channel]!, data);
     }
+    const { uniforms, defines, attributes } = combine_channel_data(method, channels);
 
-    // Remove undefined attributes
-    delete_undefined(uniforms);
-    delete_undefined(defines);
-    delete_undefined(attributes);
+    // Initialize uniforms that are set by time and view changes
+    Object.assign(uniforms, default_automatic_uniforms());
 
-    return { uniforms, defines, attributes };
+    return { uniforms, defines, attributes, encoding, channels };
 }
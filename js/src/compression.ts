@@ -0,0 +1,154 @@
+"use strict";
+
+import * as ndarray from "ndarray";
+
+import {
+    data_union_serialization
+} from "jupyter-dataserializers";
+
+import * as widgets from "@jupyter-widgets/base";
+
+import {
+    mark_padded
+} from "./utils";
+
+// Decoders for the compact array encodings in unray/compression.py.
+// Encoded arrays arrive as
+// { compression, shape, dtype, buffer: DataView, ...parameters }
+// and are decoded to plain ndarrays of the given dtype.
+
+export
+interface ICompressedArray {
+    compression: "varint" | "float16" | "uint16" | "uint8" | "padded";
+    shape: number[];
+    dtype: "int32" | "float32";
+    buffer: DataView;
+    offset?: number[];
+    scale?: number[];
+}
+
+/**
+ * View the first size values of a float32 array padded to its texture
+ * size, marked such that textures can use the padded buffer directly.
+ */
+export
+function view_padded(buffer: DataView, size: number): Float32Array {
+    // Typed array views must be aligned to their element size
+    const aligned = buffer.byteOffset % 4 === 0;
+    const bytes = aligned ? buffer.buffer : aligned_bytes(buffer);
+    const offset = aligned ? buffer.byteOffset : 0;
+    const padded = new Float32Array(bytes, offset, buffer.byteLength / 4);
+    return mark_padded(padded.subarray(0, size), padded.length);
+}
+
+// Copy bytes of buffer to get an aligned typed array view
+function aligned_bytes(buffer: DataView): ArrayBuffer {
+    return buffer.buffer.slice(buffer.byteOffset, buffer.byteOffset + buffer.byteLength);
+}
+
+/**
+ * Decode zigzag mapped deltas packed in LEB128 varints.
+ */
+export
+function decode_varint(bytes: Uint8Array, size: number): Int32Array {
+    const values = new Int32Array(size);
+    let value = 0;
+    let i = 0;
+    let k = 0;
+    while (i < size) {
+        // Accumulate with multiplication rather than
+        // bit shifts to handle more than 32 bits
+        let zigzag = 0;
+        let scale = 1;
+        let b: number;
+        do {
+            b = bytes[k++];
+            zigzag += (b & 0x7f) * scale;
+            scale *= 128;
+        } while (b & 0x80);
+        const delta = zigzag % 2 ? -(zigzag + 1) / 2 : zigzag / 2;
+        value += delta;
+        values[i++] = value;
+    }
+    return values;
+}
+
+/**
+ * Convert half precision floats given as uint16 bit patterns to float32.
+ */
+export
+function decode_float16(halfs: Uint16Array): Float32Array {
+    const values = new Float32Array(halfs.length);
+    for (let i = 0; i < halfs.length; ++i) {
+        const h = halfs[i];
+        const sign = h & 0x8000 ? -1 : 1;
+        const exponent = (h >> 10) & 0x1f;
+        const fraction = h & 0x3ff;
+        if (exponent === 0) {
+            // Zero or subnormal
+            values[i] = sign * Math.pow(2, -14) * (fraction / 1024);
+        } else if (exponent === 0x1f) {
+            values[i] = fraction ? NaN : sign * Infinity;
+        } else {
+            values[i] = sign * Math.pow(2, exponent - 15) * (1 + fraction / 1024);
+        }
+    }
+    return values;
+}
+
+/**
+ * Map quantized values back to float32 with values = offset + q * scale,
+ * with separate offset and scale for each component of an item.
+ */
+export
+function dequantize(q: Uint8Array | Uint16Array, offset: number[], scale: number[]): Float32Array {
+    const item_size = offset.length;
+    const values = new Float32Array(q.length);
+    for (let i = 0; i < q.length; ++i) {
+        const j = i % item_size;
+        values[i] = offset[j] + q[i] * scale[j];
+    }
+    return values;
+}
+
+/**
+ * Decode a compressed array to a flat typed array.
+ */
+export
+function decode_array(obj: ICompressedArray): Int32Array | Float32Array {
+    const size = obj.shape.reduce((a, b) => a * b, 1);
+    switch (obj.compression) {
+    case "varint":
+        return decode_varint(new Uint8Array(obj.buffer.buffer, obj.buffer.byteOffset, obj.buffer.byteLength), size);
+    case "float16":
+        return decode_float16(new Uint16Array(aligned_bytes(obj.buffer)));
+    case "uint16":
+        return dequantize(new Uint16Array(aligned_bytes(obj.buffer)), obj.offset!, obj.scale!);
+    case "padded":
+        return view_padded(obj.buffer, size);
+    case "uint8":
+        return dequantize(new Uint8Array(obj.buffer.buffer, obj.buffer.byteOffset, obj.buffer.byteLength), obj.offset!, obj.scale!);
+    default:
+        throw new Error(`Invalid array compression ${obj.compression}.`);
+    }
+}
+
+export
+function isCompressedArray(obj: any): obj is ICompressedArray {
+    return obj !== null && typeof obj === "object" && typeof obj.compression === "string";
+}
+
+/**
+ * Serializers for data unions that may arrive compressed,
+ * anything else is handled by data_union_serialization.
+ */
+export
+const compressed_union_serialization = {
+    deserialize(obj: any, manager?: widgets.ManagerBase<any>) {
+        if (isCompressedArray(obj)) {
+            return ndarray(decode_array(obj), obj.shape);
+        }
+        return data_union_serialization.deserialize(obj, manager);
+    },
+    serialize: data_union_serialization.serialize,
+};
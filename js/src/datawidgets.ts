@@ -12,6 +12,10 @@ import {
     ISerializers
 } from './utils';
 
+import {
+    compressed_union_serialization
+} from './compression';
+
 
 export
 class BaseModel extends widgets.WidgetModel {
@@ -86,8 +90,11 @@ class MeshModel extends BaseModel {
         return Object.assign(super.defaults(), module_defaults, {
             _model_name : "MeshModel",
             auto_orient: true,
+            oriented: false,
             cells: null,  // ndarray
             points: null,  // ndarray
+            neighbors: null,  // ndarray
+            hashes: {},  // content hash of each array computed by python
         });
     }
 
@@ -96,14 +103,15 @@ class MeshModel extends BaseModel {
         // This will ensure changes to the data in these trigger a change event
         // regardless of whether they are arrays or datawidgets:
         // The change events will trigger a rerender when object is added to scene
-        this.datawidget_properties.push("cells", "points");
+        this.datawidget_properties.push("cells", "points", "neighbors");
     }
 
     static serializers: ISerializers = Object.assign({},
         BaseModel.serializers,
         {
-            cells: data_union_serialization,
-            points: data_union_serialization,
+            cells: compressed_union_serialization,
+            points: compressed_union_serialization,
+            neighbors: data_union_serialization,
         }
     );
 }
@@ -120,6 +128,8 @@ class FieldModel extends BaseModel {
             mesh: null,  // MeshModel
             values: null,  // ndarray
             space: "P1",
+            range: null,  // [min, max] computed by python
+            hashes: {},  // content hash of values computed by python
         });
     }
 
@@ -133,12 +143,111 @@ class FieldModel extends BaseModel {
         BaseModel.serializers,
         {
             mesh: { deserialize: widgets.unpack_models },
-            values: data_union_serialization,
+            values: compressed_union_serialization,
         }
     );
 }
 
 
+export
+class FieldSeriesModel extends BaseModel {
+    get isFieldSeries() { return true; }
+
+    defaults() {
+        return Object.assign(super.defaults(),
+            module_defaults, {
+            _model_name : "FieldSeriesModel",
+            mesh: null,  // MeshModel
+            space: "P1",
+            frame: 0,
+            shape: [0, 0],  // [num_frames, num_values]
+            range: null,  // [min, max] over all frames computed by python
+        });
+    }
+
+    initialize(attributes: any, options: {model_id: string, comm?: any, widget_manager: widgets.ManagerBase<any>}) {
+        super.initialize(attributes, options);
+        this.allocateFrames();
+        this.on('change:shape', this.allocateFrames, this);
+        this.on('msg:custom', this.onCustomMessage, this);
+
+        // Frames are streamed in custom messages separate
+        // from the model state, ask for them once listening
+        this.send({ event: "request_frames" }, {});
+    }
+
+    createPropertiesArrays() {
+        super.createPropertiesArrays();
+        this.child_model_properties.push("mesh");
+    }
+
+    allocateFrames() {
+        // All frames are kept in one contiguous buffer,
+        // initially zero until received from python
+        const [num_frames, num_values] = this.get("shape");
+        this.frames = new Float32Array(num_frames * num_values);
+        this.frameViews = [];
+        for (let i = 0; i < num_frames; ++i) {
+            this.frameViews.push(this.frames.subarray(i * num_values, (i + 1) * num_values));
+        }
+    }
+
+    onCustomMessage(content: any, buffers: DataView[]) {
+        if (content.event !== "frames") {
+            return;
+        }
+        const [num_frames, num_values] = this.get("shape");
+        const { start, count, shape } = content;
+        if (shape[0] !== num_frames || shape[1] !== num_values) {
+            // Stale chunk from before a change of values
+            return;
+        }
+
+        // Copy bytes, buffers are not necessarily aligned for float32 views
+        const buffer = buffers[0];
+        const bytes = new Uint8Array(this.frames.buffer, 4 * start * num_values, 4 * count * num_values);
+        bytes.set(new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength));
+
+        // New views for the updated frames let plots
+        // see that the values of these frames changed
+        for (let i = start; i < start + count; ++i) {
+            this.frameViews[i] = this.frames.subarray(i * num_values, (i + 1) * num_values);
+        }
+
+        const frame = this.get("frame");
+        if (start <= frame && frame < start + count) {
+            this.trigger('childchange', this);
+        }
+    }
+
+    /**
+     * Get values of frame i, clamped to the available frames
+     */
+    getFrame(i: number): Float32Array | null {
+        const num_frames = this.frameViews.length;
+        if (num_frames === 0) {
+            return null;
+        }
+        return this.frameViews[Math.max(0, Math.min(num_frames - 1, i))];
+    }
+
+    frames: Float32Array;
+    frameViews: Float32Array[];
+
+    static serializers: ISerializers = Object.assign({},
+        BaseModel.serializers,
+        {
+            mesh: { deserialize: widgets.unpack_models },
+        }
+    );
+}
+
+export
+function isFieldSeries(model: any): model is FieldSeriesModel {
+    return model.isFieldSeries;
+}
+
+
 export
 class IndicatorFieldModel extends BaseModel {
     get isIndicatorField() { return true; }
@@ -150,6 +259,7 @@ class IndicatorFieldModel extends BaseModel {
             mesh: null,  // MeshModel
             values: null,  // ndarray
             space: "I3",
+            hashes: {},  // content hash of values computed by python
         });
     }
 
@@ -197,11 +307,12 @@ class IsovalueParamsModel extends BaseModel {
             module_defaults, {
             _model_name : "IsovalueParamsModel",
 
-            mode: "single", // "single", "linear", "log", "power", "sweep"
+            mode: "single", // "single", "linear", "log", "power", "sweep", "list"
             value: 0.0,
             num_intervals: 0,
             spacing: 1.0,
             period: 3.0,
+            values: [],
         });
     }
 }
@@ -216,19 +327,21 @@ class ArrayScalarMapModel extends BaseModel {
             module_defaults, {
             _model_name : "ArrayScalarMapModel",
             values: null,  // ndarray
+            preintegrated: null,  // ndarray
             //space: "linear",
         });
     }
 
     createPropertiesArrays() {
         super.createPropertiesArrays();
-        this.datawidget_properties.push("values");
+        this.datawidget_properties.push("values", "preintegrated");
     }
 
     static serializers: ISerializers = Object.assign({},
         BaseModel.serializers,
         {
             values: data_union_serialization,
+            preintegrated: data_union_serialization,
         }
     );
 }
@@ -243,19 +356,21 @@ class ArrayColorMapModel extends BaseModel {
             module_defaults, {
             _model_name : "ArrayColorMapModel",
             values: null,  // ndarray
+            preintegrated: null,  // ndarray
             space: "rgb",
         });
     }
 
     createPropertiesArrays() {
         super.createPropertiesArrays();
-        this.datawidget_properties.push("values");
+        this.datawidget_properties.push("values", "preintegrated");
     }
 
     static serializers: ISerializers = Object.assign({},
         BaseModel.serializers,
         {
             values: data_union_serialization,
+            preintegrated: data_union_serialization,
         }
     );
 }
@@ -305,7 +420,7 @@ class ScalarFieldModel extends BaseModel {
         return Object.assign(super.defaults(),
             module_defaults, {
             _model_name : "ScalarFieldModel",
-            field: null,  // FieldModel (maps x -> scalar)
+            field: null,  // FieldModel | FieldSeriesModel (maps x -> scalar)
             lut: null,  // ArrayScalarMapModel (maps scalar -> scalar)
         });
     }
@@ -401,7 +516,7 @@ class ColorFieldModel extends BaseModel {
         return Object.assign(super.defaults(),
             module_defaults, {
             _model_name : "ColorFieldModel",
-            field: null,  // FieldModel
+            field: null,  // FieldModel | FieldSeriesModel
             lut: null,  // ArrayColorMapModel | NamedColorMapModel
         });
     }
@@ -6,6 +6,8 @@ function create_default_encodings(): IEncodingMap {
     // Reusable channel defaults
     const cells = {
         field: null,
+        oriented: false,
+        neighbors: null,
     };
     const coordinates = {
         field: null,
@@ -22,6 +24,7 @@ function create_default_encodings(): IEncodingMap {
         space: "P1",
         range: "auto",
         lut_field: null,
+        lut_preintegrated: null,
         // TODO: Handle linear/log scaled LUTs somehow:
         // lut_space: "linear",
     };
@@ -32,6 +35,7 @@ function create_default_encodings(): IEncodingMap {
         space: "P1",
         range: "auto",
         lut_field: null,
+        lut_preintegrated: null,
         // TODO: Handle linear/log scaled LUTs somehow:
         // lut_space: "linear",
     };
@@ -42,11 +46,13 @@ function create_default_encodings(): IEncodingMap {
         opacity: 1.0,
     };
     const isovalues = {
-        mode: "single", // "single", "linear", "log", "power", "sweep"
+        mode: "single", // "single", "linear", "log", "power", "sweep", "list"
         value: 0.0,
         num_intervals: 0,
         spacing: 1.0,
         period: 3.0,
+        table: null,
+        table_colors: false,
     };
     const light = {
         emission_intensity_range: [0.5, 1.0],
@@ -55,6 +61,7 @@ function create_default_encodings(): IEncodingMap {
     };
     const extinction = { value: 1.0 };
     const exposure = { value: 0.0 };
+    const ordering = { method: "depth" };
 
     // Compose method defaults from channels
     const default_encodings = {
@@ -64,7 +71,7 @@ function create_default_encodings(): IEncodingMap {
         sum: { cells, coordinates, indicators, emission, exposure } as ISumEncoding,
         min: { cells, coordinates, indicators, emission } as IMinEncoding,
         max: { cells, coordinates, indicators, emission } as IMaxEncoding,
-        volume: { cells, coordinates, indicators, density, emission, extinction, exposure } as IVolumeEncoding,
+        volume: { cells, coordinates, indicators, density, emission, extinction, exposure, ordering } as IVolumeEncoding,
     };
 
     return default_encodings;
@@ -92,6 +99,10 @@ type IndicatorFieldType = "I0" | "I1" | "I2" | "I3";
 export
 interface ICellsEncodingEntry {
     field: string | null;
+    oriented?: boolean;
+    neighbors?: string | null;
+    // Indices of the cells to draw, all cells if not given
+    subset?: string | null;
 }
 
 /**
@@ -111,6 +122,8 @@ interface IIndicatorsEncodingEntry {
     value: number;
     lut_field: string | null;
     space: IndicatorFieldType,
+    // Must match the cells subset, if any
+    subset?: string | null;
 }
 
 /**
@@ -123,6 +136,8 @@ interface IDensityEncodingEntry {
     space: FieldType;
     range: 'auto' | number[];
     lut_field: string | null;
+    // Mean of lut between any two values, for volume rendering
+    lut_preintegrated: string | null;
 }
 
 /**
@@ -136,6 +151,8 @@ interface IEmissionEncodingEntry {
     space: FieldType;
     range: 'auto' | number[];
     lut_field: string | null;
+    // Mean of lut between any two values, for volume rendering
+    lut_preintegrated: string | null;
     // TODO: Handle linear/log scaled LUTs somehow:
     // lut_space: "linear",
 }
@@ -156,11 +173,14 @@ interface IWireframeEncodingEntry {
  */
 export
 interface IIsoValuesEncodingEntry {
-    mode: "single" | "linear" | "log" | "power" | "sweep";
+    mode: "single" | "linear" | "log" | "power" | "sweep" | "list";
     value: number;
     num_intervals: number;
     spacing: number;
     period: number;
+    // Table of isovalues for mode "list", with precomposed colors if table_colors
+    table: string | null;
+    table_colors: boolean;
 }
 
 /**
@@ -190,13 +210,22 @@ interface IExposureEncodingEntry {
 }
 
 
+/**
+ * Encoding entry for cell ordering
+ */
+export
+interface IOrderingEncodingEntry {
+    method: "depth" | "topological";
+}
+
+
 /**
  * Any encoding entry interface type
  */
 export
 type IEncodingEntry = ICellsEncodingEntry | ICoordinatesEncodingEntry | IIndicatorsEncodingEntry |
      IDensityEncodingEntry | IEmissionEncodingEntry | IWireframeEncodingEntry | IIsoValuesEncodingEntry |
-     ILightEncodingEntry | IExtinctionEncodingEntry | IExposureEncodingEntry;
+     ILightEncodingEntry | IExtinctionEncodingEntry | IExposureEncodingEntry | IOrderingEncodingEntry;
 
 /**
  * Any partial encoding entry interface type
@@ -206,7 +235,8 @@ type IPartialEncodingEntry = Partial<ICellsEncodingEntry> | Partial<ICoordinates
     Partial<IIndicatorsEncodingEntry> | Partial<IDensityEncodingEntry> |
     Partial<IEmissionEncodingEntry> | Partial<IWireframeEncodingEntry> |
     Partial<IIsoValuesEncodingEntry> | Partial<ILightEncodingEntry> |
-    Partial<IExtinctionEncodingEntry> | Partial<IExposureEncodingEntry>;
+    Partial<IExtinctionEncodingEntry> | Partial<IExposureEncodingEntry> |
+    Partial<IOrderingEncodingEntry>;
 
 
 
@@ -256,6 +286,7 @@ export interface IVolumeEntries {
     emission: IEmissionEncodingEntry;
     extinction: IExtinctionEncodingEntry;
     exposure: IExposureEncodingEntry;
+    ordering: IOrderingEncodingEntry;
 }
 
 
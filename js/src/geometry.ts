@@ -66,25 +66,17 @@ function create_cell_ordering_attribute(num_tetrahedrons: number): THREE.Instanc
 }
 
 export
-function create_cells_attribute(cells: Int32Array): THREE.InstancedBufferAttribute {
-    return new THREE.InstancedBufferAttribute(cells, 4, 1);
-}
-
-export
-function create_geometry(sorted: boolean, cells: Int32Array, coordinates: Float32Array): THREE.InstancedBufferGeometry {
-    // Assuming tetrahedral mesh
-    const num_tetrahedrons = cells.length / 4;
-
+function orient_cells(cells: Int32Array, coordinates: Float32Array) {
     // Reorient tetrahedral cells (NB! this happens in place!)
-    // TODO: We want cells to be reoriented _once_ if they're
-    //       reused because this is a bit expensive
     const reorient = compute_tetrahedron_cell_orientations(cells, coordinates);
     reorient_tetrahedron_cells(cells, reorient);
-    // TODO: Reorient on copy somewhere else, maybe in manager
-    // copy_reoriented(dst, cells, reorient);
+}
 
+export
+function create_geometry(sorted: boolean, num_tetrahedrons: number, coordinates: Float32Array,
+                         cell_attributes: AttributeDict): THREE.InstancedBufferGeometry {
     // Setup cells of geometry (using textures or attributes)
-    const attributes: AttributeDict = {};
+    const attributes: AttributeDict = Object.assign({}, cell_attributes);
     if (sorted) {
         // Need ordering, let ordering be instanced and read cells from texture
         // Initialize ordering array with contiguous indices,
@@ -92,9 +84,8 @@ function create_geometry(sorted: boolean, cells: Int32Array, coordinates: Float3
         // When assigned a range of integers, the c_ordering instance attribute
         // can be used as a replacement for gl_InstanceID which requires webgl2.
         attributes['c_ordering'] = create_cell_ordering_attribute(num_tetrahedrons);
-    } else {
-        // Don't need ordering, pass cells as instanced buffer attribute instead
-        attributes['c_cells'] = create_cells_attribute(cells);
+    } else if (!attributes['c_cells']) {
+        throw new Error("Expecting c_cells attribute for unsorted geometry.");
     }
 
     // Configure instanced geometry, each tetrahedron is an instance
@@ -24,7 +24,11 @@
     float density_back = v_density + depth * dot(v_density_gradient, view_direction);
     float scaled_density_back = (density_back - u_density_range.x) * u_density_range.w;
     
-  #ifdef ENABLE_DENSITY_LUT
+  #if defined(ENABLE_DENSITY_PREINTEGRATED)
+    // Mean of mapped density along the ray segment through the cell,
+    // replaces the lookup of mapped_density_back
+    float preintegrated_density = texture2D(t_density_preintegrated, vec2(scaled_density, scaled_density_back)).a;
+  #elif defined(ENABLE_DENSITY_LUT)
     float mapped_density_back = texture2D(t_density_lut, vec2(scaled_density_back, 0.5)).a;
   #else
     float mapped_density_back = scaled_density_back;
@@ -25,7 +25,11 @@
     float emission_back = v_emission + depth * dot(v_emission_gradient, view_direction);
     float scaled_emission_back = (emission_back - u_emission_range.x) * u_emission_range.w;
 
-  #ifdef ENABLE_EMISSION_LUT
+  #if defined(ENABLE_EMISSION_PREINTEGRATED)
+    // Mean of mapped emission along the ray segment through the cell,
+    // replaces the lookup of mapped_emission_back
+    vec3 preintegrated_emission = texture2D(t_emission_preintegrated, vec2(scaled_emission, scaled_emission_back)).xyz;
+  #elif defined(ENABLE_EMISSION_LUT)
     vec3 mapped_emission_back = texture2D(t_emission_lut, vec2(scaled_emission_back, 0.5)).xyz;
   #else
     vec3 mapped_emission_back = u_emission_color * scaled_emission_back;
@@ -4,9 +4,9 @@ compile_error();  // Isosurface needs front and back values
 #endif
 
 
-// Select values from emission or density field
-// TODO: If both are present, use density for isovalue selection
-//       and corresponding emission for coloring
+// Select values from emission or density field,
+// if both are present density selects the isovalues
+// and the corresponding emission is used for coloring
 #if defined(ENABLE_DENSITY_BACK)
 float front = v_density;
 float back = density_back;
@@ -54,6 +54,18 @@ float value;
 if (!find_isovalue_power_spacing(value, back, front, u_isovalue, u_isovalue_spacing, tolerance)) {
     discard;
 }
+#elif defined(USING_ISOSURFACE_MODE_LIST)
+// Explicit surfaces, first isovalue from front towards back looked up
+// in a table, which is exact unless isovalues are close together
+vec2 scaled_interval = (vec2(front, back) - value_range.x) * value_range.w;
+vec4 isosurface = texture2D(t_isosurface, scaled_interval);
+if (isosurface.a < 0.0) {
+    discard;
+}
+float value = value_range.x + isosurface.a / value_range.w;
+if (is_outside_interval(value, back, front, tolerance)) {
+    discard;
+}
 #else
 compile_error(); // Missing valid USING_ISOSURFACE_* define
 #endif
@@ -61,7 +73,28 @@ compile_error(); // Missing valid USING_ISOSURFACE_* define
 
 // Map value through color lut
 float scaled_value = (value - value_range.x) * value_range.w;
+#if defined(ENABLE_ISOSURFACE_COLORS)
+// Color lut precomposed in isosurface table
+vec3 C = isosurface.rgb;
+#elif defined(ENABLE_DENSITY_BACK) && defined(ENABLE_EMISSION_FIELD)
+// Isosurface of the density field colored by the emission field
+// where the ray crosses it, e.g. a plane slice through a field
 #if defined(ENABLE_EMISSION_BACK)
+float crossing = back != front ? clamp((value - front) / (back - front), 0.0, 1.0) : 0.0;
+float emission_value = mix(v_emission, emission_back, crossing);
+#else
+float emission_value = v_emission;
+#endif
+float scaled_emission_value = (emission_value - u_emission_range.x) * u_emission_range.w;
+#ifdef ENABLE_EMISSION_LUT
+vec3 C = texture2D(t_emission_lut, vec2(scaled_emission_value, 0.5)).xyz;
+#else
+vec3 C = u_emission_color * scaled_emission_value;
+#endif
+#elif defined(ENABLE_DENSITY_BACK) && defined(ENABLE_EMISSION)
+// Constant color
+vec3 C = mapped_emission;
+#elif defined(ENABLE_EMISSION_BACK)
 #ifdef ENABLE_EMISSION_LUT
 vec3 C = texture2D(t_emission_lut, vec2(scaled_value, 0.5)).xyz; // CHECKME
 #else
@@ -69,9 +102,9 @@ vec3 C = u_emission_color * scaled_value; // CHECKME
 #endif
 #elif defined(ENABLE_DENSITY_BACK)
 #ifdef ENABLE_DENSITY_LUT
-float C = u_emission_color * texture2D(t_density_lut, vec2(scaled_value, 0.5)).a;
+vec3 C = u_emission_color * texture2D(t_density_lut, vec2(scaled_value, 0.5)).a;
 #else
-float C = u_emission_color * scaled_value;
+vec3 C = u_emission_color * scaled_value;
 #endif
 #endif
 
@@ -79,7 +112,9 @@ float C = u_emission_color * scaled_value;
 // Apply some shading
 #if defined(ENABLE_SURFACE_LIGHT) && (defined(ENABLE_EMISSION) || defined(ENABLE_DENSITY))
 // Gradient of source function is parallel to the normal of the isosurface
-#if defined(ENABLE_EMISSION)
+#if defined(ENABLE_DENSITY_BACK)
+vec3 surface_normal = normalize(v_density_gradient);
+#elif defined(ENABLE_EMISSION)
 vec3 surface_normal = normalize(v_emission_gradient);
 #elif defined(ENABLE_DENSITY)
 vec3 surface_normal = normalize(v_density_gradient);
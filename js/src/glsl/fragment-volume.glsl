@@ -10,7 +10,11 @@ compile_error();  // Volume model requires emission
 //#if defined(ENABLE_DENSITY_BACK) && defined(ENABLE_EMISSION_BACK)
 // TODO: Implement Moreland partial pre-integration
 
-#if defined(ENABLE_DENSITY_BACK)
+#if defined(ENABLE_DENSITY_PREINTEGRATED)
+// Exact mean density along the ray for density linear in the cell,
+// variant (III) in TODO.md
+float rho = preintegrated_density;
+#elif defined(ENABLE_DENSITY_BACK)
 // TODO: Currently only using average density, more accurate options exist.
 float rho = mix(mapped_density, mapped_density_back, 0.5); // CHECKME
 #else
@@ -18,7 +22,10 @@ float rho = mapped_density; // CHECKME
 #endif
 
 
-#if defined(ENABLE_EMISSION_BACK)
+#if defined(ENABLE_EMISSION_PREINTEGRATED)
+// Mean color along the ray
+vec3 L = preintegrated_emission;
+#elif defined(ENABLE_EMISSION_BACK)
 // TODO: Currently only using average color, more accurate options exist.
 vec3 L = mix(mapped_emission, mapped_emission_back, 0.5); // CHECKME
 #else
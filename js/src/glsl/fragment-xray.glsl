@@ -9,7 +9,10 @@ compile_error();  // Xray model requires density
 
 
 // Compute density
-#if defined(ENABLE_DENSITY_BACK)
+#if defined(ENABLE_DENSITY_PREINTEGRATED)
+// This is exact assuming the field linear along a ray segment
+float rho = preintegrated_density;
+#elif defined(ENABLE_DENSITY_BACK)
 // This is exact assuming rho linear along a ray segment
 float rho = mix(mapped_density, mapped_density_back, 0.5);
 #elif defined(ENABLE_DENSITY_FIELD)
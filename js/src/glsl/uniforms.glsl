@@ -30,6 +30,10 @@ uniform sampler2D t_coordinates;
 
     // Vertex indices for each cell
     uniform sampler2D t_cells;
+    #ifdef ENABLE_SPLIT_VERTEX_INDICES
+        // High parts of vertex indices, with low parts in t_cells
+        uniform sampler2D t_cells_high;
+    #endif
     #ifdef ENABLE_CELL_INDICATORS
         // Cell indicator value for each cell
         uniform sampler2D t_cell_indicators;
@@ -52,6 +56,9 @@ uniform sampler2D t_coordinates;
     #ifdef ENABLE_DENSITY_LUT
         uniform sampler2D t_density_lut;
     #endif
+    #ifdef ENABLE_DENSITY_PREINTEGRATED
+        uniform sampler2D t_density_preintegrated;
+    #endif
 #endif
 
 #ifdef ENABLE_EMISSION
@@ -64,6 +71,9 @@ uniform sampler2D t_coordinates;
     #ifdef ENABLE_EMISSION_LUT
         uniform sampler2D t_emission_lut;
     #endif
+    #ifdef ENABLE_EMISSION_PREINTEGRATED
+        uniform sampler2D t_emission_preintegrated;
+    #endif
 #endif
 
 // 
@@ -97,4 +107,8 @@ uniform float u_isovalue;
 uniform float u_isovalue_spacing;
 // Time period for sweep modes
 uniform float u_isovalue_sweep_period;
+#ifdef USING_ISOSURFACE_MODE_LIST
+// First isovalue and its color between two scaled values
+uniform sampler2D t_isosurface;
+#endif
 #endif
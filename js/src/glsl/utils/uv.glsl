@@ -10,3 +10,13 @@ vec2 index_to_uv(int index, ivec2 shape)
         (0.5 + float(v)) / float(shape.y)
     );
 }
+
+// Map a 1D index split as index = high * shape.x + low
+// to UV coordinates, exact in float beyond 2^24
+vec2 split_index_to_uv(float low, float high, ivec2 shape)
+{
+    return vec2(
+        (0.5 + low) / float(shape.x),
+        (0.5 + high) / float(shape.y)
+    );
+}
@@ -46,6 +46,10 @@ attribute vec4 a_barycentric_coordinates;
 
     // Vertex indices for this cell
     attribute vec4 c_cells;                          // webgl2 required for ivec4 attributes
+    #ifdef ENABLE_SPLIT_VERTEX_INDICES
+        // High parts of vertex indices, with low parts in c_cells
+        attribute vec4 c_cells_high;
+    #endif
     #ifdef ENABLE_CELL_INDICATORS
         // Cell indicator value for this cell
         attribute float c_cell_indicators;           // webgl2 required for int attributes
@@ -117,7 +121,17 @@ void main()
 #endif
 
 
-#ifdef ENABLE_CELL_ORDERING
+#if defined(ENABLE_SPLIT_VERTEX_INDICES)
+    // Vertex indices beyond 2^24 are not exact in float, and
+    // are split into their texture column (low) and row (high)
+  #ifdef ENABLE_CELL_ORDERING
+    vec4 cell_low = texture2D(t_cells, cell_uv);
+    vec4 cell_high = texture2D(t_cells_high, cell_uv);
+  #else
+    vec4 cell_low = c_cells;
+    vec4 cell_high = c_cells_high;
+  #endif
+#elif defined(ENABLE_CELL_ORDERING)
     // Using computed texture location to lookup cell
     ivec4 cell = ivec4(texture2D(t_cells, cell_uv));
 #else
@@ -130,10 +144,20 @@ void main()
     // Map all vertex indices to texture locations for vertex data lookup
     vec2 vertex_uv[4];
     for (int i = 0; i < 4; ++i) {
+  #ifdef ENABLE_SPLIT_VERTEX_INDICES
+        vertex_uv[i] = split_index_to_uv(cell_low[i], cell_high[i], u_vertex_texture_shape);
+  #else
         vertex_uv[i] = index_to_uv(cell[i], u_vertex_texture_shape);
+  #endif
     }
     // Get vertex texture location for the current vertex
     vec2 this_vertex_uv = getitem(vertex_uv, local_vertex_id);
+#elif defined(ENABLE_SPLIT_VERTEX_INDICES)
+    // Get vertex texture location for the current vertex
+    vec2 this_vertex_uv = split_index_to_uv(
+        getitem(cell_low, local_vertex_id),
+        getitem(cell_high, local_vertex_id),
+        u_vertex_texture_shape);
 #else
     // Global index of the current vertex
     int global_vertex_id = getitem(cell, local_vertex_id);
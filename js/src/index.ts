@@ -7,3 +7,6 @@ export { version } from './version';
 // Export widget models and views
 export * from "./datawidgets";
 export * from "./plotwidgets";
+
+// Export texture and buffer memory statistics and cache control
+export { get_memory_stats, set_cache_budget } from "./managers";
@@ -2,10 +2,10 @@
 
 import * as THREE from "three";
 
-import {ObjectManager} from "./object_manager";
+import {ObjectManager, IObjectManagerStats} from "./object_manager";
 
 import {
-    TypedArray
+    TypedArray, padded_length
 } from './utils';
 
 export
@@ -37,8 +37,22 @@ const itemsize2threeformat: { [key: number]: THREE.PixelFormat} = {
     4: THREE.RGBAFormat
 };
 
+// Textures using the buffer of a received array as their data
+const wrapping_textures = new WeakSet<THREE.DataTexture>();
+
+/**
+ * View of the buffer of data as texture data of the given size
+ * if it's a float32 array received padded to the texture size.
+ */
+function padded_view(data: TypedArray | undefined, size: number): Float32Array | null {
+    if (!(data instanceof Float32Array) || padded_length(data) < size) {
+        return null;
+    }
+    return new Float32Array(data.buffer, data.byteOffset, size);
+}
+
 export
-function allocate_array_texture(dtype: string, item_size: number, texture_shape: number[]): THREE.DataTexture {
+function allocate_array_texture(dtype: string, item_size: number, texture_shape: number[], data?: TypedArray): THREE.DataTexture {
     // Textures using Int32Array and Uint32Array require webgl2,
     // so currently just ignoring the dtype during prototyping.
     // Some redesign may be in order once the prototype is working,
@@ -48,7 +62,9 @@ function allocate_array_texture(dtype: string, item_size: number, texture_shape:
     // const type = dtype2threetype[dtype];
 
     const size = texture_shape[0] * texture_shape[1] * item_size;
-    const padded_data = new Float32Array(size);
+    // Arrays received padded to the texture size are used without copying
+    const view = padded_view(data, size);
+    const padded_data = view || new Float32Array(size);
     const format = itemsize2threeformat[item_size];
     const type = dtype2threetype["float32"];  // NB! See comment above
 
@@ -57,6 +73,12 @@ function allocate_array_texture(dtype: string, item_size: number, texture_shape:
         texture_shape[0], texture_shape[1],
         format, type);
 
+    if (view) {
+        wrapping_textures.add(texture);
+        texture.needsUpdate = true;
+    } else if (data) {
+        update_array_texture(texture, data);
+    }
     return texture;
 }
 
@@ -92,6 +114,20 @@ function allocate_lut_texture(dtype: string, item_size: number, texture_shape: n
 
 export
 function update_array_texture(texture: THREE.DataTexture, data: TypedArray) {
+    const size = (texture.image.data as TypedArray).length;
+    const view = padded_view(data, size);
+    if (view) {
+        // Upload directly from the received buffer
+        texture.image.data = view as any;
+        wrapping_textures.add(texture);
+        texture.needsUpdate = true;
+        return;
+    }
+    if (wrapping_textures.has(texture)) {
+        // Never write into the buffer of a received array
+        texture.image.data = new Float32Array(size) as any;
+        wrapping_textures.delete(texture);
+    }
     try {
         // Note that input data may be Int32Array or Uint32Array
         // here while image.data is currently always Float32Array
@@ -107,6 +143,16 @@ function update_array_texture(texture: THREE.DataTexture, data: TypedArray) {
     texture.needsUpdate = true;
 }
 
+function dispose_texture(texture: THREE.DataTexture) {
+    // Releases the gl texture, the data is
+    // garbage collected with the texture
+    texture.dispose();
+}
+
+function texture_size(texture: THREE.DataTexture): number {
+    return (texture.image.data as TypedArray).byteLength;
+}
+
 
 export
 interface IArrayTextureKey {
@@ -121,6 +167,8 @@ interface ILutTextureKey {
     array: TypedArray;
     dtype: string;
     item_size: number;
+    // Defaults to a single row, 2D for pre-integrated tables
+    texture_shape?: number[];
 }
 
 export
@@ -147,19 +195,20 @@ const managers: IManagers = {
     array_texture: new ObjectManager<IArrayTextureKey, THREE.DataTexture>(
         // Create
         ({array, dtype, item_size, texture_shape}) => {
-            const texture = allocate_array_texture(dtype, item_size, texture_shape);
-            update_array_texture(texture, array);
-            return texture;
+            return allocate_array_texture(dtype, item_size, texture_shape, array);
         },
         // Update
         (texture, {array, dtype, item_size, texture_shape}) => {
             update_array_texture(texture, array);
         },
+        // Deleted
+        dispose_texture,
+        texture_size,
     ),
     lut_texture: new ObjectManager<ILutTextureKey, THREE.DataTexture>(
         // Create
-        ({array, dtype, item_size}) => {
-            const texture_shape = [array.length / item_size, 1];
+        ({array, dtype, item_size, texture_shape}) => {
+            texture_shape = texture_shape || [array.length / item_size, 1];
             const texture = allocate_lut_texture(dtype, item_size, texture_shape);
             update_array_texture(texture, array);
             return texture;
@@ -168,19 +217,62 @@ const managers: IManagers = {
         (texture, {array}) => {
             update_array_texture(texture, array);
         },
+        // Deleted
+        dispose_texture,
+        texture_size,
     ),
     cells_buffer: new ObjectManager<ICellsBufferKey, THREE.InstancedBufferAttribute>(
         // Create
         ({array, dtype, item_size}) => {
-            const buffer = new THREE.InstancedBufferAttribute(array, item_size, 1);
+            // Integer attributes require webgl2, so like the array
+            // textures the buffer is float32 regardless of dtype
+            const buffer = new THREE.InstancedBufferAttribute(new Float32Array(array), item_size, 1);
             //buffer.setDynamic(true);
             return buffer;
         },
         // Update
         (buffer, {array, dtype, item_size}) => {
-            // Cast due to imprecise typing int @types/three
-            (buffer.array as TypedArray).set(array);
+            if (buffer.array.length !== array.length) {
+                // Number of cells changed, e.g. a different subset
+                // of cells is drawn, so reallocate the buffer. The
+                // geometry using it detects the new array and frees
+                // its gl buffer, see attach_cell_attributes in plotstate.
+                buffer.setArray(new Float32Array(array));
+            } else {
+                // Cast due to imprecise typing int @types/three
+                (buffer.array as TypedArray).set(array);
+            }
             buffer.needsUpdate = true;
-        }
+        },
+        // Deleted, nothing to do as geometries free the gl buffer
+        // of an attribute as soon as they detach it or are disposed,
+        // such that unused buffers only hold their array here
+        undefined,
+        (buffer) => (buffer.array as TypedArray).byteLength,
     ),
 };
+
+/**
+ * Report the number and total size of objects in use
+ * and unused objects kept in the cache for each manager.
+ */
+export
+function get_memory_stats(): {[name: string]: IObjectManagerStats} {
+    return {
+        array_texture: managers.array_texture.stats(),
+        lut_texture: managers.lut_texture.stats(),
+        cells_buffer: managers.cells_buffer.stats(),
+    };
+}
+
+/**
+ * Set the size in bytes of unused textures and buffers to keep
+ * for reuse by each manager, 0 (the default) releases them
+ * as soon as no plot uses them.
+ */
+export
+function set_cache_budget(bytes: number) {
+    managers.array_texture.setBudget(bytes);
+    managers.lut_texture.setBudget(bytes);
+    managers.cells_buffer.setBudget(bytes);
+}
@@ -1,40 +1,93 @@
 "use strict";
 
+export
+interface IObjectManagerStats {
+    // Objects currently in use and their total size
+    objects: number;
+    bytes: number;
+    // Unused objects kept in the cache and their total size
+    cached: number;
+    cached_bytes: number;
+}
+
+/**
+ * Key for objects created from content with the given hash.
+ * The content under such keys never changes, so objects
+ * found under them are reused without being updated.
+ */
+export
+function content_key(hash: string): string {
+    return "hash:" + hash;
+}
+
+function is_content_key(key: string): boolean {
+    return /^hash:[0-9a-f]+$/.test(key);
+}
+
+/**
+ * Reference counted cache of objects created from specs,
+ * such as textures, shared by plots under the same key.
+ *
+ * Objects are deleted when their count drops to zero, unless
+ * a cache budget in bytes is set, in which case the least
+ * recently released objects are deleted when the total size
+ * of unused objects exceeds the budget.
+ */
 export
 class ObjectManager<T, U> {
-    constructor(create: (spec: T) => U, update: (object: U, spec: T) => void, deleted?: (object: U) => void) {
+    constructor(create: (spec: T) => U, update: (object: U, spec: T) => void, deleted?: (object: U) => void,
+                size?: (object: U) => number) {
         this.createCb = create;
         this.updateCb = update;
         this.deletedCb = deleted;
+        this.sizeCb = size;
     }
 
     increment(object: U): void {
-        this.objectCount.set(object, (this.objectCount.get(object) || 0) + 1);
+        const count = this.objectCount.get(object) || 0;
+        if (count === 0 && this.unused.has(object)) {
+            // Reused from cache
+            this.unusedBytes -= this.unused.get(object)!;
+            this.unused.delete(object);
+        }
+        this.objectCount.set(object, count + 1);
     }
 
     decrement(object: U): number {
         const count = (this.objectCount.get(object) || 0) - 1;
         if (count === 0) {
-            const key = this.object2key.get(object)!;
-
-            this.object2key.delete(object);
-            this.key2object.delete(key);
-            this.objectCount.delete(object);
-
-            if (this.deletedCb) {
-                this.deletedCb(object);
-            }
+            this.objectCount.set(object, 0);
+            // Map preserves insertion order, oldest first
+            const size = this.sizeOf(object);
+            this.unused.set(object, size);
+            this.unusedBytes += size;
+            this.evict();
         } else {
             this.objectCount.set(object, count);
         }
         return count;
     }
 
+    /**
+     * Decrement count of object if it is managed here.
+     * Returns true if the object was managed here.
+     */
+    release(object: U): boolean {
+        if ((this.objectCount.get(object) || 0) <= 0) {
+            return false;
+        }
+        this.decrement(object);
+        return true;
+    }
+
     update(key: string, spec: T, previousObject?: U): U {
         let object = this.key2object.get(key);
         if (object) {
-            // Update object in place if it's in the cache
-            this.updateCb(object, spec);
+            // Update object in place if it's in the cache,
+            // unless it holds the same content already
+            if (!is_content_key(key)) {
+                this.updateCb(object, spec);
+            }
         } else {
             // Create object if it's not in the cache
             object = this.createCb(spec);
@@ -44,21 +97,77 @@ class ObjectManager<T, U> {
             this.key2object.set(key, object);
             this.objectCount.set(object, 0);
         }
-        // Count new users of object
+        // Count new users of object, replacing previous object
         if (object !== previousObject) {
             this.increment(object);
-        //     if (previousObject) {
-        //         this.decrement(previousObject);
-        //     }
+            if (previousObject) {
+                this.release(previousObject);
+            }
         }
         return object;
     }
 
+    /**
+     * Set the total size in bytes of unused objects to keep,
+     * deleting the least recently released objects beyond it.
+     */
+    setBudget(bytes: number): void {
+        this.budget = bytes;
+        this.evict();
+    }
+
+    stats(): IObjectManagerStats {
+        let objects = 0;
+        let bytes = 0;
+        this.objectCount.forEach((count, object) => {
+            if (count > 0) {
+                objects += 1;
+                bytes += this.sizeOf(object);
+            }
+        });
+        return { objects, bytes, cached: this.unused.size, cached_bytes: this.unusedBytes };
+    }
+
+    protected sizeOf(object: U): number {
+        return this.sizeCb ? this.sizeCb(object) : 0;
+    }
+
+    protected evict(): void {
+        for (const [object, size] of Array.from(this.unused)) {
+            if (this.budget > 0 && this.unusedBytes <= this.budget) {
+                break;
+            }
+            this.unused.delete(object);
+            this.unusedBytes -= size;
+            this.remove(object);
+        }
+    }
+
+    protected remove(object: U): void {
+        const key = this.object2key.get(object)!;
+
+        this.object2key.delete(object);
+        this.key2object.delete(key);
+        this.objectCount.delete(object);
+
+        if (this.deletedCb) {
+            this.deletedCb(object);
+        }
+    }
+
     createCb: (spec: T) => U;
     updateCb: (object: U, spec: T) => void;
     deletedCb?: (object: U) => void;
+    sizeCb?: (object: U) => number;
 
     object2key = new Map<U, string>();
     key2object = new Map<string, U>();
     objectCount = new Map<U, number>();
+
+    // Cache budget in bytes for unused objects, 0 deletes them right away
+    budget = 0;
+
+    // Sizes of unused objects in order of release, oldest first
+    unused = new Map<U, number>();
+    unusedBytes = 0;
 };
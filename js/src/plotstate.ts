@@ -11,51 +11,130 @@ import {
 } from "./boundinggeometry";
 
 import {
-    create_three_data
+    create_three_data, resolve_encoding, find_changed_channels,
+    create_channel_data, combine_channel_data, release_channel_data, IChannelDataMap
 } from "./channels";
 
 import {
-    create_geometry
+    create_geometry, create_cell_ordering_attribute, orient_cells
 } from "./geometry";
 
 import {
     create_material
 } from "./material";
 
-// import {
-//     sort_cells
-// } from "./sorting";
+import {
+    sort_cells, create_sorting_workspace, ISortingWorkspace,
+    topological_sort_cells, create_topological_workspace, ITopologicalWorkspace
+} from "./sorting";
 
 import {
-    IEncoding, IPartialEncoding
+    IEncoding, IPartialEncoding, IPartialVolumeEncoding
 } from './encodings';
 
 import {
-    Method, IPlotData, TypedArray
+    Method, IPlotData, TypedArray, AttributeDict
 } from './utils';
 
-// TODO: Use this in prerender and improve sorting
-// when unsorted methods are working well
-function update_ordering(geometry: THREE.BufferGeometry, material: THREE.ShaderMaterial) {
+// Minimal camera movement before cells are sorted again.
+// Position changes are relative to the bounding sphere radius,
+// direction changes are measured as 1 - cos(angle).
+const sort_position_threshold = 1e-3;
+const sort_direction_threshold = 1e-5;
+
+// Camera state the current cell ordering was computed for,
+// with cell adjacency if topological ordering is enabled
+interface IOrderingState {
+    workspace: ISortingWorkspace | ITopologicalWorkspace;
+    cells: TypedArray | null;
+    neighbors: TypedArray | null;
+    perspective: boolean | null;
+    camera_position: THREE.Vector3;
+    view_direction: THREE.Vector3;
+}
+
+function create_ordering_state(num_cells: number): IOrderingState {
+    return {
+        workspace: create_sorting_workspace(num_cells),
+        cells: null,
+        neighbors: null,
+        perspective: null,  // null forces sorting on next render
+        camera_position: new THREE.Vector3(),
+        view_direction: new THREE.Vector3(),
+    };
+}
+
+// Select ordering method from encoding, falling back to depth
+// sorting until cell adjacency has arrived from the mesh
+function configure_ordering(state: IOrderingState, encoding: IPartialVolumeEncoding, data: IPlotData) {
+    // Sorting uses the cells data, as the cells texture
+    // holds split vertex indices for very large meshes
+    state.cells = data[encoding.cells.field!];
+
+    const method = encoding.ordering ? encoding.ordering.method : "depth";
+    const field = encoding.cells.neighbors;
+    const neighbors = method === "topological" && field ? data[field] : undefined;
+    state.neighbors = neighbors || null;
+
+    // Workspaces hold buffers for a fixed number of cells,
+    // reallocated when the mesh is replaced by one of another size
+    const num_cells = state.cells.length / 4;
+    if (num_cells !== state.workspace.depths.length) {
+        state.workspace = state.neighbors ?
+            create_topological_workspace(num_cells) : create_sorting_workspace(num_cells);
+    } else if (state.neighbors && !("front" in state.workspace)) {
+        state.workspace = create_topological_workspace(num_cells);
+    }
+
+    // Force sorting on next render
+    state.perspective = null;
+}
+
+function update_ordering(geometry: THREE.BufferGeometry, material: THREE.ShaderMaterial, state: IOrderingState) {
     const u = material.uniforms;
 
-    // TODO: Benchmark use of reordering array vs reordering
-    //       cell data and uploading those larger buffers.
-    const dir = u['u_local_view_direction'].value;
+    const perspective = !!material.defines['ENABLE_PERSPECTIVE_PROJECTION'];
+    const dir = u['u_local_view_direction'].value as THREE.Vector3;
+    const pos = u['u_local_camera_position'].value as THREE.Vector3;
+
+    // Skip sorting unless the camera has moved noticeably since last time,
+    // with perspective projection only the camera position matters
+    // and with orthographic projection only the view direction matters
+    if (perspective === state.perspective) {
+        if (perspective) {
+            const radius = geometry.boundingSphere.radius;
+            if (pos.distanceTo(state.camera_position) <= sort_position_threshold * radius) {
+                return;
+            }
+        } else {
+            if (1.0 - dir.dot(state.view_direction) <= sort_direction_threshold) {
+                return;
+            }
+        }
+    }
 
-    // Get cells and coordinates from texture data
-    const cells = (u['t_cells'].value as THREE.DataTexture).image.data;
+    // Get coordinates from texture data
+    const cells = state.cells!;
     const coordinates = (u['t_coordinates'].value as THREE.DataTexture).image.data;
 
     // NB! Number of cells === ordering.array.length,
-    // !== cells.length / 4 which includes texture padding.
+    // !== coordinates.length / 3 which includes texture padding.
 
     // Compute cell reordering in place in geometry attribute array
     // Casting due to incorrect typing in @types/three:
     const ordering = (geometry.attributes as any)['c_ordering'] as THREE.BufferAttribute;
-    // FIXME: Update function, and ensure signature is met:
-    //sort_cells(ordering.array as TypedArray, cells, coordinates, dir);
+    if (state.neighbors) {
+        topological_sort_cells(ordering.array as TypedArray, cells, state.neighbors, coordinates,
+            pos.toArray(), dir.toArray(), perspective, state.workspace as ITopologicalWorkspace);
+    } else {
+        sort_cells(ordering.array as TypedArray, cells, coordinates,
+            pos.toArray(), dir.toArray(), perspective, state.workspace);
+    }
     ordering.needsUpdate = true;
+
+    state.perspective = perspective;
+    state.camera_position.copy(pos);
+    state.view_direction.copy(dir);
 }
 
 function prerender_update(renderer: THREE.WebGLRenderer, scene: THREE.Scene, camera: THREE.Camera, geometry: THREE.BufferGeometry, material: THREE.ShaderMaterial, group: THREE.Group, mesh: THREE.Mesh) {
@@ -138,17 +217,30 @@ function create_mesh(method: Method, encoding: IPartialEncoding, data: IPlotData
         throw new Error("Cannot create mesh, missing coordinates in data.")
     }
 
-    // Determine whether cells should be sorted based on view direction
-    // const sorted = method === "volume";
-    const sorted = true;  // FIXME: Enable the non-sorted branch
+    // Cells from a Mesh with auto_orient enabled are reoriented
+    // once on the Python side, only fall back to doing it here
+    if (!encoding.cells.oriented) {
+        orient_cells(cells, coordinates);
+    }
 
-    // Initialize uniforms, including textures
-    const {uniforms, defines, attributes} = create_three_data(method, encoding, data);
+    // Initialize uniforms, including textures, and per-cell
+    // attributes for methods that don't need cell ordering
+    const {uniforms, defines, attributes, channels, encoding: resolved} = create_three_data(method, encoding, data);
+
+    // Only the volume method depends on the drawing order of cells,
+    // for the other methods cells are passed as instanced attributes
+    const sorted = !!defines['ENABLE_CELL_ORDERING'];
+    // Unsorted methods may draw only a subset of the cells
+    const num_tetrahedrons = sorted ? cells.length / 4 : attributes.c_cells.count;
+    const ordering_state = sorted ? create_ordering_state(num_tetrahedrons) : undefined;
+    if (ordering_state) {
+        configure_ordering(ordering_state, encoding as IPartialVolumeEncoding, data);
+    }
 
     // Initialize geometry
-    // TODO: Currently not reusing cell attributes between models
     // TODO: Currently computing bounding objects from coordinates for each geometry
-    const geometry = create_geometry(sorted, cells, coordinates);
+    const geometry = create_geometry(sorted, num_tetrahedrons, coordinates, attributes);
+    remember_cell_attributes(geometry);
 
     // Configure material (shader)
     const material = create_material(method, uniforms, defines);
@@ -159,33 +251,157 @@ function create_mesh(method: Method, encoding: IPartialEncoding, data: IPlotData
 
     mesh.onBeforeRender = (renderer, scene, camera, geometry: THREE.BufferGeometry, material: THREE.ShaderMaterial, group) => {
         prerender_update(renderer, scene, camera, geometry, material, group, mesh);
+        if (ordering_state) {
+            update_ordering(geometry, material, ordering_state);
+        }
     };
 
-    // If needed, we can attach properties to the mesh.userData object,
-    // doing it now merely for the debugging convenience:
-    Object.assign(mesh.userData, { method, encoding });
+    // The resolved encoding, data and per-channel state are attached
+    // to mesh.userData such that update_mesh can compute changes
+    Object.assign(mesh.userData, { method, encoding: resolved, data, channels, ordering_state });
 
     return mesh;
 }
 
+// Channels affecting the cell ordering
+const ordering_channels = ["cells", "coordinates", "ordering"];
+
 function update_mesh(mesh: THREE.Mesh, method: Method, encoding: IPartialEncoding, data: IPlotData) {
-    // Recompute uniforms and defines (this also updates texture values etc)
-    const {uniforms, defines, attributes} = create_three_data(method, encoding, data);
+    const prev = mesh.userData as { encoding: IPartialEncoding, data: IPlotData, channels: IChannelDataMap };
+
+    // Only recompute uniforms, defines and attributes for channels that have
+    // changed (this also updates texture values etc for changed data only)
+    const resolved = resolve_encoding(method, encoding);
+    const changed = find_changed_channels(resolved, data, prev.encoding, prev.data);
+    const channels: IChannelDataMap = Object.assign({}, prev.channels);
+    for (let channel of changed) {
+        if (resolved[channel]) {
+            channels[channel] = create_channel_data(method, channel, resolved[channel]!, data);
+        } else {
+            delete channels[channel];
+        }
+        // Released after acquiring the new data, such that
+        // textures reused under the same key are kept
+        if (prev.channels[channel]) {
+            release_channel_data(prev.channels[channel]);
+        }
+    }
+    const {defines, attributes} = combine_channel_data(method, channels);
+    Object.assign(mesh.userData, { encoding: resolved, data, channels });
 
-    // Update material (let three.js determine if recompilation is necessary)
+    // Projection define is managed by prerender_update
     const mat = mesh.material as THREE.ShaderMaterial;
-    Object.keys(mat.uniforms).forEach(k => { delete mat.uniforms[k]; });
-    Object.assign(mat.uniforms, uniforms);
-    Object.keys(mat.defines).forEach(k => { delete mat.defines[k]; });
-    Object.assign(mat.defines, defines);
-    mat.needsUpdate = true;
-
-    // TODO: Is it necessary to update geometry? If attributes can change it is.
-    if (Object.keys(attributes).length > 0) {
-        console.warn("Ignoring newly created attributes in update_mesh.", attributes);
+    if (mat.defines['ENABLE_PERSPECTIVE_PROJECTION']) {
+        defines['ENABLE_PERSPECTIVE_PROJECTION'] = 1;
+    } else {
+        delete defines['ENABLE_PERSPECTIVE_PROJECTION'];
+    }
+
+    // Update material, only flagging it for update if the set of
+    // uniforms or defines changed (let three.js determine if
+    // recompilation is necessary), uniform values are simply
+    // uploaded on next render
+    let needsUpdate = !_.isEqual(defines, mat.defines);
+    if (needsUpdate) {
+        Object.keys(mat.defines).forEach(k => { delete mat.defines[k]; });
+        Object.assign(mat.defines, defines);
+    }
+    for (let channel of changed) {
+        const prev_uniforms = prev.channels[channel] ? prev.channels[channel].uniforms : {};
+        const uniforms = channels[channel] ? channels[channel].uniforms : {};
+        for (let name in prev_uniforms) {
+            if (!(name in uniforms)) {
+                delete mat.uniforms[name];
+                needsUpdate = true;
+            }
+        }
+        for (let name in uniforms) {
+            if (mat.uniforms[name]) {
+                mat.uniforms[name].value = uniforms[name].value;
+            } else {
+                mat.uniforms[name] = uniforms[name];
+                needsUpdate = true;
+            }
+        }
+    }
+    if (needsUpdate) {
+        mat.needsUpdate = true;
+    }
+
+    // Data or ordering method may have changed, this forces sorting on next render
+    const ordering_state = mesh.userData.ordering_state as IOrderingState | undefined;
+    if (ordering_state && _.intersection(changed, ordering_channels).length > 0) {
+        configure_ordering(ordering_state, resolved as IPartialVolumeEncoding, data);
+    }
+
+    const geometry = mesh.geometry as THREE.InstancedBufferGeometry;
+    if (ordering_state) {
+        // One ordering index per cell, reallocated with the workspace
+        // when the number of cells changed
+        const num_cells = ordering_state.workspace.depths.length;
+        let ordering = (geometry.attributes as any)['c_ordering'] as THREE.InstancedBufferAttribute;
+        if (ordering.count !== num_cells) {
+            ordering = create_cell_ordering_attribute(num_cells);
+        }
+        attributes['c_ordering'] = ordering;
+        geometry.maxInstancedCount = num_cells;
+    }
+    attach_cell_attributes(geometry, attributes);
+    if (attributes.c_cells) {
+        geometry.maxInstancedCount = attributes.c_cells.count;
+    }
+}
+
+// Per-cell attributes a geometry may hold
+const cell_attribute_names = ["c_cells", "c_cells_high", "c_cell_indicators", "c_ordering"];
+
+// Array of each per-cell attribute when last attached to a geometry,
+// to detect attributes reallocated in place for another number of cells
+const attached_arrays = new WeakMap<THREE.BufferAttribute | THREE.InterleavedBufferAttribute, ArrayLike<number>>();
+
+function remember_cell_attributes(geometry: THREE.BufferGeometry) {
+    for (let name of cell_attribute_names) {
+        const attribute = (geometry.attributes as any)[name] as THREE.BufferAttribute | undefined;
+        if (attribute) {
+            attached_arrays.set(attribute, attribute.array);
+        }
     }
-    //const geo = mesh.geometry;
-    //geo.attributes.addAttribute();
+}
+
+// Swap in per-cell attributes that changed identity,
+// and drop those no longer in use (e.g. indicators)
+function attach_cell_attributes(geometry: THREE.BufferGeometry, attributes: AttributeDict) {
+    // three.js only frees the gl buffers of a geometry when the geometry
+    // is disposed, and updates a buffer in place assuming its size is
+    // unchanged. When a per-cell attribute is replaced, dropped or resized,
+    // dispose the geometry first so that the old buffers are freed. The
+    // attributes still in use are uploaded again on the next render.
+    const current = geometry.attributes as any;
+    const stale = cell_attribute_names.some(name => {
+        const prev = current[name] as THREE.BufferAttribute | undefined;
+        return prev !== attributes[name] || (prev !== undefined && attached_arrays.get(prev) !== prev.array);
+    });
+    if (stale) {
+        geometry.dispose();
+    }
+    for (let name of cell_attribute_names) {
+        if (attributes[name] && current[name] !== attributes[name]) {
+            geometry.addAttribute(name, attributes[name]);
+        } else if (current[name] && !attributes[name]) {
+            geometry.removeAttribute(name);
+        }
+    }
+    remember_cell_attributes(geometry);
+}
+
+function dispose_mesh(mesh: THREE.Mesh) {
+    const channels = mesh.userData.channels as IChannelDataMap;
+    for (let channel in channels) {
+        release_channel_data(channels[channel]);
+    }
+    mesh.geometry.dispose();
+    (mesh.material as THREE.Material).dispose();
+    mesh.userData = {};
 }
 
 function create_debugging_geometries(mesh: THREE.Mesh) {
@@ -247,6 +463,11 @@ interface IPlotState {
      */
     update(encoding: IPartialEncoding, data?: IPlotData): void;
 
+    /**
+     * Called when the plot is closed, releases textures and buffers
+     */
+    dispose(): void;
+
     /**
      * Function to get suggestion for background color
      */
@@ -287,6 +508,26 @@ function create_plot_state(root: THREE.Group, method: Method): IPlotState {
             // console.log("Updated plot mesh:", mesh);
         },
 
+        // Called when the plot is closed
+        dispose() {
+            for (let child of this.root.children.slice()) {
+                if (child instanceof THREE.Mesh && child.userData.channels) {
+                    dispose_mesh(child);
+                } else {
+                    // Debugging geometries
+                    child.traverse((obj: any) => {
+                        if (obj.geometry) {
+                            obj.geometry.dispose();
+                        }
+                        if (obj.material) {
+                            obj.material.dispose();
+                        }
+                    });
+                }
+                this.root.remove(child);
+            }
+        },
+
         // Method specific suggestion for background color
         bgcolor: method_backgrounds[method] || new THREE.Color(1, 1, 1),
 
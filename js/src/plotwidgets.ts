@@ -2,7 +2,7 @@
 
 import * as THREE from "three";
 import * as widgets from "@jupyter-widgets/base";
-import { getArray } from "jupyter-dataserializers";
+import { getArray, data_union_serialization } from "jupyter-dataserializers";
 
 //import _ from "underscore";
 
@@ -10,6 +10,8 @@ import { module_defaults } from "./version";
 
 import { create_plot_state, IPlotState } from "./plotstate";
 
+import { content_key } from "./object_manager";
+
 import * as datamodels from './datawidgets';
 
 import {
@@ -27,7 +29,7 @@ declare class ThreeModel extends widgets.WidgetModel {
     createThreeObjectAsync(): Promise<any>;
     constructThreeObject(): any | Promise<any>;
     onCustomMessage(content: any, buffers: any): void;
-    syncToThreeObj(): void;
+    syncToThreeObj(force?: boolean): void;
     syncToModel(): void;
 
     obj: any;
@@ -56,17 +58,37 @@ function getNotNull<T>(model: widgets.WidgetModel, key: string): T {
     return value;
 }
 
+// Arrays are identified by content hash if computed by python,
+// such that textures are shared between widgets with equal arrays,
+// otherwise by the model id of the array widget or of the parent
 function getIdentifiedValue(parent: widgets.WidgetModel, name: string) {
     const dataunion = getNotNull<widgets.WidgetModel>(parent, name);
     const array = getArray(dataunion);
     if (array === null) {
         throw new Error(`Array "${name}" is null!`);
     }
-    const id: string = dataunion.model_id || parent.model_id + "_" + name;
+    const hashes = parent.get("hashes");
+    const hash: string | undefined = hashes ? hashes[name] : undefined;
+    const id: string = hash ? content_key(hash) : dataunion.model_id || parent.model_id + "_" + name;
     return { id, value: array.data };
 }
 
 
+// Get values of a field, or of the current frame of a field series.
+// All frames of a series share the same id, such that they reuse the
+// same texture and switching frames just updates its values.
+function getFieldValues(field: datamodels.FieldModel | datamodels.FieldSeriesModel) {
+    if (datamodels.isFieldSeries(field)) {
+        const value = field.getFrame(field.get("frame"));
+        if (value === null) {
+            throw new Error(`Field series has no frames!`);
+        }
+        return { id: field.model_id, value };
+    }
+    return getIdentifiedValue(field, "values");
+}
+
+
 interface IPartialEncodingEntriesAndData {
     encoding: {[key: string]: encodings.IPartialEncodingEntry | undefined};
     data?: IPlotData;
@@ -96,11 +118,22 @@ function createMeshEncoding(mesh: datamodels.MeshModel): IPartialEncodingAndData
     const points = getIdentifiedValue(mesh, "points");
     data[points.id] = points.value;
 
+    // Skip reorientation in the frontend if already done
+    // on the Python side or disabled by the user
+    const oriented = mesh.get("oriented") || !mesh.get("auto_orient");
+
     const encoding: encodings.IMeshEncoding = {
-        cells: { field: cells.id },
+        cells: { field: cells.id, oriented },
         coordinates: { field: points.id },
     };
 
+    // Cell adjacency is only present if requested by some plot
+    if (mesh.get("neighbors")) {
+        const neighbors = getIdentifiedValue(mesh, "neighbors");
+        data[neighbors.id] = neighbors.value;
+        encoding.cells.neighbors = neighbors.id;
+    }
+
     return { encoding: encoding, data };
 }
 
@@ -213,22 +246,27 @@ function createDensityConstantEncoding(density: datamodels.ScalarConstantModel):
     return { encoding, data };
 }
 
-function createDensityFieldEncoding(density: datamodels.ScalarFieldModel): IPartialEncodingEntriesAndData {
+function createDensityFieldEncoding(density: datamodels.ScalarFieldModel, preintegrate: boolean): IPartialEncodingEntriesAndData {
     const desc: Partial<encodings.IDensityEncodingEntry> = {};
     const data: IPlotData = {};
 
     // Top level traits
-    const field = getNotNull<datamodels.FieldModel>(density, "field");
+    const field = getNotNull<datamodels.FieldModel | datamodels.FieldSeriesModel>(density, "field");
     const lut = density.get("lut");
 
     // Non-optional field values
-    const values = getIdentifiedValue(field, "values");
+    const values = getFieldValues(field);
     if (values.value) {
         const { id, value } = values;
         data[id] = value;
         desc.field = id;
         desc.space = field.get("space");
-        // desc.range = field.get("range"); // FIXME
+        // Use precomputed range if available, or fall back to
+        // scanning the values in the frontend with range "auto"
+        const range = field.get("range");
+        if (range) {
+            desc.range = range;
+        }
     } else {
         throw new Error(`Missing values in field.`);
     }
@@ -246,6 +284,11 @@ function createDensityFieldEncoding(density: datamodels.ScalarFieldModel): IPart
             } else {
                 throw new Error(`Missing values in array LUT.`);
             }
+            if (preintegrate && lut.get("preintegrated")) {
+                const { id, value } = getIdentifiedValue(lut, "preintegrated");
+                data[id] = value;
+                desc.lut_preintegrated = id;
+            }
         } else {
             throw new Error(`"Invalid scalar LUT ${lut}`);
         }
@@ -255,12 +298,14 @@ function createDensityFieldEncoding(density: datamodels.ScalarFieldModel): IPart
     return { encoding, data };
 }
 
-function createDensityEncoding(density: datamodels.ScalarFieldModel | datamodels.ScalarConstantModel): IPartialEncodingEntriesAndData {
+// Volume rendering methods integrating along rays through cells
+// use the pre-integrated lookup tables if available
+function createDensityEncoding(density: datamodels.ScalarFieldModel | datamodels.ScalarConstantModel, preintegrate = false): IPartialEncodingEntriesAndData {
     if (density) {
         if (datamodels.isScalarConstant(density)) {
             return createDensityConstantEncoding(density);
         } else if (datamodels.isScalarField(density)) {
-            return createDensityFieldEncoding(density);
+            return createDensityFieldEncoding(density, preintegrate);
         } else {
             throw new Error(`Invalid scalar ${density}.`);
         }
@@ -280,25 +325,30 @@ function createEmissionConstantEncoding(color: datamodels.ColorConstantModel): I
     return { encoding, data };
 }
 
-function createEmissionFieldEncoding(color: datamodels.ColorFieldModel): IPartialEncodingEntriesAndData {
+function createEmissionFieldEncoding(color: datamodels.ColorFieldModel, preintegrate: boolean): IPartialEncodingEntriesAndData {
     const desc: Partial<encodings.IEmissionEncodingEntry> = {};
     const data: IPlotData = {};
 
     // Top level traits
-    const field = getNotNull<datamodels.FieldModel>(color, "field");
+    const field = getNotNull<datamodels.FieldModel | datamodels.FieldSeriesModel>(color, "field");
     const lut = color.get("lut");
 
     // Non-optional field
     // color: ColorFieldModel
-    // field: FieldModel
-    // array: DataUnion
-    const values = getIdentifiedValue(field, "values");
+    // field: FieldModel | FieldSeriesModel
+    // array: DataUnion or current frame
+    const values = getFieldValues(field);
     if (values.value) {
         const { id, value } = values;
         data[id] = value;
         desc.field = id;
         desc.space = field.get("space");
-        // desc.range = field.get("range"); // FIXME
+        // Use precomputed range if available, or fall back to
+        // scanning the values in the frontend with range "auto"
+        const range = field.get("range");
+        if (range) {
+            desc.range = range;
+        }
     } else {
         throw new Error(`Missing required field values.`);
     }
@@ -316,6 +366,11 @@ function createEmissionFieldEncoding(color: datamodels.ColorFieldModel): IPartia
             } else {
                 throw new Error(`Missing required values in ArrayColorMap`);
             }
+            if (preintegrate && lut.get("preintegrated")) {
+                const { id, value } = getIdentifiedValue(lut, "preintegrated");
+                data[id] = value;
+                desc.lut_preintegrated = id;
+            }
         } else if (lut.isNamedColorMap) {
             const name = getNotNull<string>(lut, "name");
             const value = getNamedColorMapArray(name);
@@ -332,12 +387,12 @@ function createEmissionFieldEncoding(color: datamodels.ColorFieldModel): IPartia
     return { encoding, data };
 }
 
-function createEmissionEncoding(color: datamodels.ColorConstantModel | datamodels.ColorFieldModel): IPartialEncodingEntriesAndData {
+function createEmissionEncoding(color: datamodels.ColorConstantModel | datamodels.ColorFieldModel, preintegrate = false): IPartialEncodingEntriesAndData {
     if (color) {
         if (datamodels.isColorConstant(color)) {
             return createEmissionConstantEncoding(color);
         } else if (datamodels.isColorField(color)) {
-            return createEmissionFieldEncoding(color);
+            return createEmissionFieldEncoding(color, preintegrate);
         } else {
             throw new Error(`Invalid color ${color}`);
         }
@@ -355,6 +410,24 @@ function createExposureEncoding(exposure: number): IPartialEncodingEntriesAndDat
     return { encoding };
 }
 
+function createOrderingEncoding(method: encodings.IOrderingEncodingEntry['method']): IPartialEncodingEntriesAndData {
+    const encoding = { ordering: { method } };
+    return { encoding };
+}
+
+// The plane of a slice plot is the isosurface at offset of the
+// distances of the vertices along its normal, used as density
+function createPlaneEncoding(plot: widgets.WidgetModel): IPartialEncodingEntriesAndData {
+    const encoding: {[key: string]: encodings.IPartialEncodingEntry} = {};
+    const data: IPlotData = {};
+    if (plot.get("plane_distances")) {
+        const { id, value } = getIdentifiedValue(plot, "plane_distances");
+        data[id] = value;
+        encoding.density = { field: id, space: "P1" };
+        encoding.isovalues = { mode: "single", value: plot.get("offset") };
+    }
+    return { encoding, data };
+}
 
 // Merge a list of { encoding, data } objects into one
 function mergeEncodings(...encodings: IPartialEncodingEntriesAndData[]): IPartialEncodingAndData {
@@ -375,6 +448,9 @@ abstract class PlotModel extends BlackboxModel {
     // Override this in every subclass
     abstract buildPlotEncoding(): IPartialEncodingAndData;
 
+    // Override this in every subclass
+    abstract plotDefaults(): {[key: string]: any};
+
     defaults() {
         return Object.assign(super.defaults(), module_defaults, {
             mesh: null,  // MeshModel
@@ -385,6 +461,7 @@ abstract class PlotModel extends BlackboxModel {
     createPropertiesArrays() {
         super.createPropertiesArrays();
         this.child_data_models = ['mesh', 'restrict'];
+        this.plot_properties = ['mesh', 'restrict', ...Object.keys(this.plotDefaults())];
     }
 
     setupListeners() {
@@ -416,7 +493,7 @@ abstract class PlotModel extends BlackboxModel {
     onDataChildChanged(model: widgets.WidgetModel, options: any) {
         // One of the child data widgets has changed, ensure THREE
         // object gets updated:
-        this.syncToThreeObj();
+        this.syncToThreeObj(true);
         // Then ensure we let pythreejs know our object is changed:
         this.trigger('childchange', this);
     }
@@ -430,20 +507,33 @@ abstract class PlotModel extends BlackboxModel {
     }
 
     updatePlotState(changed: any) {
-        // TODO: Only update the affected parts?
-        // Doing so is a bit complex and may not
-        // be that important to performance, considering
-        // the large objects are reused through reference
-        // counting managers internally.
+        // Nothing to do if only properties of the
+        // three.js object such as position changed
+        if (changed && !Object.keys(changed).some(name => this.plot_properties.indexOf(name) !== -1)) {
+            return;
+        }
+        // The plot state diffs the encoding and data
+        // against the previous ones and only updates
+        // the uniforms, defines and textures of the
+        // channels that actually changed.
         const { encoding, data } = this.buildPlotEncoding();
         this.plotState.update(encoding, data);
     }
 
-    syncToThreeObj() {
-        super.syncToThreeObj();
+    close(comm_closed?: boolean) {
+        // Release textures and buffers shared with other plots
+        if (this.plotState) {
+            this.plotState.dispose();
+        }
+        return super.close(comm_closed);
+    }
+
+    syncToThreeObj(force=false) {
+        super.syncToThreeObj(force);
 
-        // Let backbone tell us which attributes have changed
-        const changed = this.changedAttributes();
+        // Let backbone tell us which attributes have changed,
+        // changes in child data models are not listed here
+        const changed = force ? false : this.changedAttributes();
 
         // Let plotState update itself (mutates this.plotState)
         this.updatePlotState(changed);
@@ -453,6 +543,8 @@ abstract class PlotModel extends BlackboxModel {
 
     child_data_models: string[];
 
+    plot_properties: string[];
+
     static serializers: ISerializers = Object.assign({},
         BlackboxModel.serializers,
         {
@@ -473,6 +565,7 @@ class SurfacePlotModel extends PlotModel {
         return {
             color: null,  // ColorFieldModel || ColorConstantModel
             wireframe: null,  // WireframeParamsModel
+            boundary_cells: null,  // ndarray
         };
     }
 
@@ -483,17 +576,30 @@ class SurfacePlotModel extends PlotModel {
     }
 
     buildPlotEncoding() {
-        return mergeEncodings(
+        const merged = mergeEncodings(
             createMeshEncoding(this.get("mesh")),
             createRestrictEncoding(this.get("restrict")),
             createEmissionEncoding(this.get("color")),
             createWireframeParamsEncoding(this.get("wireframe"))
         );
+
+        // Only draw the cells with a face on the surface if computed
+        // on the Python side, the other cells are hidden anyway
+        if (this.get("boundary_cells")) {
+            const boundary = getIdentifiedValue(this, "boundary_cells");
+            merged.data![boundary.id] = boundary.value;
+            merged.encoding.cells.subset = boundary.id;
+            if (merged.encoding.indicators) {
+                merged.encoding.indicators.subset = boundary.id;
+            }
+        }
+        return merged;
     }
 
     createPropertiesArrays() {
         super.createPropertiesArrays();
         this.child_data_models.push('color', 'wireframe');
+        this.datawidget_properties.push('boundary_cells');
     }
 
     static serializers: ISerializers = Object.assign({},
@@ -501,6 +607,7 @@ class SurfacePlotModel extends PlotModel {
         {
             color: { deserialize: widgets.unpack_models },
             wireframe: { deserialize: widgets.unpack_models },
+            boundary_cells: data_union_serialization,
         }
     );
 }
@@ -518,6 +625,8 @@ class IsosurfacePlotModel extends PlotModel {
             field: null,  // Field if different from color.field
             values: null,  // IsovalueParams
             // wireframe: null, // TODO: Add wireframe options
+            isosurface_table: null,  // ndarray
+            active_cells: null,  // ndarray
         };
     }
 
@@ -528,7 +637,7 @@ class IsosurfacePlotModel extends PlotModel {
     }
 
     buildPlotEncoding() {
-        return mergeEncodings(
+        const merged = mergeEncodings(
             createMeshEncoding(this.get("mesh")),
             createRestrictEncoding(this.get("restrict")),
             createDensityEncoding(this.get("field")),
@@ -536,11 +645,38 @@ class IsosurfacePlotModel extends PlotModel {
             createIsovalueParamsEncoding(this.get("values"))
             //createWireframeParamsEncoding(this.get("wireframe"))
         );
+
+        // Explicit isovalues are looked up in a table computed on the
+        // Python side, with colors precomposed from an array lut
+        if (this.get("isosurface_table") && merged.encoding.isovalues) {
+            const table = getIdentifiedValue(this, "isosurface_table");
+            const color = this.get("color");
+            const lut = color ? color.get("lut") : null;
+            // Colors are only precomposed when isovalues are of the color field
+            const field = this.get("field");
+            const same_field = !field || (color && field === color.get("field"));
+            merged.data![table.id] = table.value;
+            merged.encoding.isovalues.table = table.id;
+            merged.encoding.isovalues.table_colors = Boolean(same_field && lut && lut.isArrayColorMap);
+        }
+
+        // Only draw the cells where the field takes one of the
+        // isovalues, found through an interval index on the Python side
+        if (this.get("active_cells")) {
+            const active = getIdentifiedValue(this, "active_cells");
+            merged.data![active.id] = active.value;
+            merged.encoding.cells.subset = active.id;
+            if (merged.encoding.indicators) {
+                merged.encoding.indicators.subset = active.id;
+            }
+        }
+        return merged;
     }
 
     createPropertiesArrays() {
         super.createPropertiesArrays();
         this.child_data_models.push('color', 'field', 'values');
+        this.datawidget_properties.push('isosurface_table', 'active_cells');
     }
 
     static serializers: ISerializers = Object.assign({},
@@ -550,6 +686,67 @@ class IsosurfacePlotModel extends PlotModel {
             field: { deserialize: widgets.unpack_models },
             values: { deserialize: widgets.unpack_models },
             //wireframe: { deserialize: widgets.unpack_models },
+            isosurface_table: data_union_serialization,
+            active_cells: data_union_serialization,
+        }
+    );
+}
+
+
+export
+class SlicePlotModel extends PlotModel {
+    getPlotMethod(): Method {
+        return "isosurface";
+    }
+
+    plotDefaults() {
+        return {
+            color: null,  // ColorFieldModel | ColorConstantModel
+            offset: 0.0,
+            plane_distances: null,  // ndarray
+            slice_cells: null,  // ndarray
+        };
+    }
+
+    defaults() {
+        return Object.assign(super.defaults(), {
+            _model_name : "SlicePlotModel",
+            }, this.plotDefaults());
+    }
+
+    buildPlotEncoding() {
+        const merged = mergeEncodings(
+            createMeshEncoding(this.get("mesh")),
+            createRestrictEncoding(this.get("restrict")),
+            createEmissionEncoding(this.get("color")),
+            createPlaneEncoding(this)
+        );
+
+        // Only draw the cells crossing the plane, found
+        // through an interval index on the Python side
+        if (this.get("slice_cells")) {
+            const slice = getIdentifiedValue(this, "slice_cells");
+            merged.data![slice.id] = slice.value;
+            merged.encoding.cells.subset = slice.id;
+            if (merged.encoding.indicators) {
+                merged.encoding.indicators.subset = slice.id;
+            }
+        }
+        return merged;
+    }
+
+    createPropertiesArrays() {
+        super.createPropertiesArrays();
+        this.child_data_models.push('color');
+        this.datawidget_properties.push('plane_distances', 'slice_cells');
+    }
+
+    static serializers: ISerializers = Object.assign({},
+        PlotModel.serializers,
+        {
+            color: { deserialize: widgets.unpack_models },
+            plane_distances: data_union_serialization,
+            slice_cells: data_union_serialization,
         }
     );
 }
@@ -579,7 +776,7 @@ class XrayPlotModel extends PlotModel {
         return mergeEncodings(
             createMeshEncoding(this.get("mesh")),
             createRestrictEncoding(this.get("restrict")),
-            createDensityEncoding(this.get("density")),
+            createDensityEncoding(this.get("density"), true),
             //createEmissionConstantEncoding(this.get("color")),
             createExtinctionEncoding(this.get("extinction"))
         );
@@ -733,6 +930,7 @@ class VolumePlotModel extends PlotModel {
             color: null,  // ColorFieldModel | ColorConstantModel
             extinction: 1.0,
             exposure: 0.0,
+            ordering: "depth",  // "depth" | "topological"
         };
     }
 
@@ -746,10 +944,11 @@ class VolumePlotModel extends PlotModel {
         return mergeEncodings(
             createMeshEncoding(this.get("mesh")),
             createRestrictEncoding(this.get("restrict")),
-            createDensityEncoding(this.get("density")),
-            createEmissionEncoding(this.get("color")),
+            createDensityEncoding(this.get("density"), true),
+            createEmissionEncoding(this.get("color"), true),
             createExtinctionEncoding(this.get("extinction")),
-            createExposureEncoding(this.get("exposure"))
+            createExposureEncoding(this.get("exposure")),
+            createOrderingEncoding(this.get("ordering"))
         );
     }
 
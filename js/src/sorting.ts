@@ -4,46 +4,327 @@ import {
     TypedArray
 } from './utils';
 
-// FIXME: Update function with correct type declarations.
-// export
-// function sort_cells(ordering: TypedArray, cells: TypedArray, coordinates: Float32Array,
-//                     camera_position: number[], view_direction: number[]) {
-//     /*
-//     const num_tetrahedrons = cells.length / 4;
-//     for (let i = 0; i < num_tetrahedrons; ++i) {
-//         ordering[i] = i;
-//     }
-//     */
-
-//     // TODO: Compute a better perspective dependent ordering using topology
-
-//     // Naively sort by smallest distance to camera
-//     ordering.sort((i, j) => {
-//         const min_dist = [Number.POSITIVE_INFINITY, Number.POSITIVE_INFINITY];
-//         const indices = [i, j];
-//         for (let r = 0; r < 2; ++r) {
-//             const local_vertices = cells[indices[r]]
-//             for (let k = 0; k < 4; ++k) {
-//                 const offset = 3*local_vertices[k];
-//                 let dist = 0.0;
-//                 for (let s = 0; s < 3; ++s) {
-//                     const dx = coordinates[offset+s] - camera_position[s];
-//                     // With orthographic camera and constant view direction
-//                     dist += view_direction[s] * dx;
-//                     // With perspective camera, use only distance to camera
-//                     //dist += dx*dx;
-//                 }
-//                 // Take distance from vertex with smallest distance
-//                 // (could also use midpoint)
-//                 min_dist[r] = Math.min(dist, min_dist[r]);
-//             }
-//         }
-//         if (min_dist[0] === min_dist[1]) {
-//             return 0;
-//         } else if (min_dist[0] < min_dist[1]) {
-//             return -1;
-//         } else {
-//             return +1;
-//         }
-//     });
-// }
+// Cell depths are quantized to integer keys of
+// RADIX_BITS * RADIX_PASSES bits and sorted with
+// an LSD radix sort, one pass per RADIX_BITS digit.
+// With 2 passes of 11 bits this gives ~4M depth levels
+// while keeping the histograms small enough for cache.
+const RADIX_BITS = 11;
+const RADIX_PASSES = 2;
+const RADIX_SIZE = 1 << RADIX_BITS;
+const RADIX_MASK = RADIX_SIZE - 1;
+const KEY_MAX = (1 << (RADIX_BITS * RADIX_PASSES)) - 1;
+
+
+/**
+ * Preallocated buffers for sorting a fixed number of cells,
+ * reused between frames to avoid allocations while rendering.
+ */
+export
+interface ISortingWorkspace {
+    depths: Float32Array;
+    keys: Uint32Array;
+    tmp_keys: Uint32Array;
+    tmp_indices: Uint32Array;
+    counts: Uint32Array;
+}
+
+export
+function create_sorting_workspace(num_cells: number): ISortingWorkspace {
+    return {
+        depths: new Float32Array(num_cells),
+        keys: new Uint32Array(num_cells),
+        tmp_keys: new Uint32Array(num_cells),
+        tmp_indices: new Uint32Array(num_cells),
+        counts: new Uint32Array(RADIX_SIZE * RADIX_PASSES),
+    };
+}
+
+/**
+ * Compute depth of the centroid of each cell seen from the camera.
+ *
+ * With perspective projection the depth is the squared distance to
+ * the camera position, otherwise the distance along the view direction.
+ * Only the first depths.length cells are processed, such that padded
+ * texture data can be passed for cells and coordinates.
+ *
+ * @return {number[]} [min, max] depth over all cells
+ */
+export
+function compute_cell_depths(depths: Float32Array, cells: TypedArray, coordinates: TypedArray,
+                             camera_position: number[], view_direction: number[], perspective: boolean) {
+    const num_cells = depths.length;
+    const [p0, p1, p2] = camera_position;
+    const [d0, d1, d2] = view_direction;
+    const x = coordinates;
+
+    let min = Number.POSITIVE_INFINITY;
+    let max = Number.NEGATIVE_INFINITY;
+    for (let i = 0; i < num_cells; ++i) {
+        const j = 4*i;
+        const a = 3*cells[j];
+        const b = 3*cells[j + 1];
+        const c = 3*cells[j + 2];
+        const d = 3*cells[j + 3];
+
+        // Centroid relative to camera position
+        const y0 = 0.25 * (x[a] + x[b] + x[c] + x[d]) - p0;
+        const y1 = 0.25 * (x[a + 1] + x[b + 1] + x[c + 1] + x[d + 1]) - p1;
+        const y2 = 0.25 * (x[a + 2] + x[b + 2] + x[c + 2] + x[d + 2]) - p2;
+
+        depths[i] = perspective ? (y0*y0 + y1*y1 + y2*y2) : (y0*d0 + y1*d1 + y2*d2);
+
+        // Range of the float32 rounded values, to keep keys within bounds
+        const depth = depths[i];
+        min = Math.min(min, depth);
+        max = Math.max(max, depth);
+    }
+    return [min, max];
+}
+
+/**
+ * Quantize depths to integer keys such that the
+ * farthest cell gets key 0 and the closest KEY_MAX.
+ */
+export
+function compute_depth_keys(keys: Uint32Array, depths: Float32Array, min: number, max: number) {
+    const num_cells = depths.length;
+    const scale = max > min ? KEY_MAX / (max - min) : 0.0;
+    for (let i = 0; i < num_cells; ++i) {
+        keys[i] = Math.floor((max - depths[i]) * scale);
+    }
+}
+
+/**
+ * Stable radix sort of cell indices by integer keys.
+ *
+ * Writes the cell indices 0...keys.length-1 sorted by increasing
+ * key into ordering, which may be a Float32Array used directly
+ * as an instanced attribute. The keys array is not modified.
+ */
+export
+function radix_sort_ordering(ordering: TypedArray, keys: Uint32Array, workspace: ISortingWorkspace) {
+    const num_cells = keys.length;
+    const { tmp_keys, tmp_indices, counts } = workspace;
+
+    // Build histograms for both digits in a single sweep
+    counts.fill(0);
+    for (let i = 0; i < num_cells; ++i) {
+        const k = keys[i];
+        ++counts[k & RADIX_MASK];
+        ++counts[RADIX_SIZE + ((k >>> RADIX_BITS) & RADIX_MASK)];
+    }
+
+    // Convert histograms to bucket start offsets
+    for (let pass = 0; pass < RADIX_PASSES; ++pass) {
+        let offset = 0;
+        const begin = pass * RADIX_SIZE;
+        for (let r = begin; r < begin + RADIX_SIZE; ++r) {
+            const count = counts[r];
+            counts[r] = offset;
+            offset += count;
+        }
+    }
+
+    // Scatter by low digit into temporary buffers
+    for (let i = 0; i < num_cells; ++i) {
+        const k = keys[i];
+        const dst = counts[k & RADIX_MASK]++;
+        tmp_keys[dst] = k;
+        tmp_indices[dst] = i;
+    }
+
+    // Scatter by high digit into final ordering
+    for (let i = 0; i < num_cells; ++i) {
+        const k = tmp_keys[i];
+        const dst = counts[RADIX_SIZE + ((k >>> RADIX_BITS) & RADIX_MASK)]++;
+        ordering[dst] = tmp_indices[i];
+    }
+}
+
+/**
+ * Sort cells back to front as seen from the camera.
+ *
+ * The number of cells is taken from ordering.length,
+ * cells and coordinates may include texture padding.
+ */
+export
+function sort_cells(ordering: TypedArray, cells: TypedArray, coordinates: TypedArray,
+                    camera_position: number[], view_direction: number[], perspective: boolean,
+                    workspace?: ISortingWorkspace) {
+    const num_cells = ordering.length;
+    if (!workspace || workspace.depths.length !== num_cells) {
+        workspace = create_sorting_workspace(num_cells);
+    }
+    const { depths, keys } = workspace;
+    const [min, max] = compute_cell_depths(depths, cells, coordinates,
+        camera_position, view_direction, perspective);
+    compute_depth_keys(keys, depths, min, max);
+    radix_sort_ordering(ordering, keys, workspace);
+}
+
+
+// Local vertices of the face opposite each local vertex 0...3
+const FACE_VERTICES = [1, 2, 3,  0, 3, 2,  0, 1, 3,  0, 2, 1];
+
+/**
+ * Workspace for topological sorting, extending the
+ * depth sorting buffers with per-cell graph state.
+ */
+export
+interface ITopologicalWorkspace extends ISortingWorkspace {
+    depth_order: Uint32Array;
+    front: Uint8Array;
+    indegree: Int32Array;
+    stack: Uint32Array;
+    emitted: Uint8Array;
+}
+
+export
+function create_topological_workspace(num_cells: number): ITopologicalWorkspace {
+    return Object.assign(create_sorting_workspace(num_cells), {
+        depth_order: new Uint32Array(num_cells),
+        front: new Uint8Array(4 * num_cells),
+        indegree: new Int32Array(num_cells),
+        stack: new Uint32Array(num_cells),
+        emitted: new Uint8Array(num_cells),
+    });
+}
+
+/**
+ * Determine for each interior face which of the two
+ * adjacent cells is in front as seen from the camera.
+ *
+ * Sets front[4*i + j] = 1 if the neighbor across the face opposite
+ * local vertex j of cell i is in front of cell i, and counts in
+ * indegree[k] the number of neighbors cell k is in front of.
+ *
+ * @param  {TypedArray} neighbors - array packing 4 neighbor cell indices per cell, -1 on the boundary
+ */
+export
+function compute_front_faces(front: Uint8Array, indegree: Int32Array,
+                             cells: TypedArray, neighbors: TypedArray, coordinates: TypedArray,
+                             camera_position: number[], view_direction: number[], perspective: boolean) {
+    const num_cells = indegree.length;
+    const [p0, p1, p2] = camera_position;
+    const [d0, d1, d2] = view_direction;
+    const x = coordinates;
+
+    front.fill(0);
+    indegree.fill(0);
+    for (let i = 0; i < num_cells; ++i) {
+        for (let j = 0; j < 4; ++j) {
+            // Visit each interior face once, from the cell with the lowest index
+            const k = neighbors[4*i + j];
+            if (k <= i) {
+                continue;
+            }
+
+            // Compute normal of the face
+            const a = 3*cells[4*i + FACE_VERTICES[3*j]];
+            const b = 3*cells[4*i + FACE_VERTICES[3*j + 1]];
+            const c = 3*cells[4*i + FACE_VERTICES[3*j + 2]];
+            const u0 = x[b] - x[a], u1 = x[b + 1] - x[a + 1], u2 = x[b + 2] - x[a + 2];
+            const v0 = x[c] - x[a], v1 = x[c + 1] - x[a + 1], v2 = x[c + 2] - x[a + 2];
+            const n0 = u1*v2 - u2*v1;
+            const n1 = u2*v0 - u0*v2;
+            const n2 = u0*v1 - u1*v0;
+
+            // Signed distance of the camera from the face plane,
+            // positive on the side of neighbor k
+            const o = 3*cells[4*i + j];
+            const inward = n0*(x[o] - x[a]) + n1*(x[o + 1] - x[a + 1]) + n2*(x[o + 2] - x[a + 2]);
+            let side = perspective
+                ? n0*(p0 - x[a]) + n1*(p1 - x[a + 1]) + n2*(p2 - x[a + 2])
+                : -(n0*d0 + n1*d1 + n2*d2);
+            if (inward > 0) {
+                side = -side;
+            }
+
+            if (side > 0) {
+                // Camera is on the side of k, so k is in front of i
+                front[4*i + j] = 1;
+                ++indegree[k];
+            } else if (side < 0) {
+                // Camera is on the side of i, so i is in front of k
+                for (let l = 0; l < 4; ++l) {
+                    if (neighbors[4*k + l] === i) {
+                        front[4*k + l] = 1;
+                        ++indegree[i];
+                        break;
+                    }
+                }
+            }
+        }
+    }
+}
+
+/**
+ * Sort cells back to front by a topological sort of the
+ * visibility graph given by cell adjacency (MPVONC).
+ *
+ * Cells with no cells behind them are visited in back to
+ * front depth order, and cells in front of them are emitted
+ * depth first once all cells behind them have been emitted.
+ * This runs in linear time and is exact for convex meshes,
+ * and for non-convex meshes the depth ordering of the
+ * starting cells handles the separate parts of the boundary.
+ * Any cells left over due to cycles in the visibility graph
+ * are appended in depth order.
+ */
+export
+function topological_sort_cells(ordering: TypedArray, cells: TypedArray, neighbors: TypedArray,
+                                 coordinates: TypedArray, camera_position: number[],
+                                 view_direction: number[], perspective: boolean,
+                                 workspace?: ITopologicalWorkspace) {
+    const num_cells = ordering.length;
+    if (!workspace || workspace.depths.length !== num_cells) {
+        workspace = create_topological_workspace(num_cells);
+    }
+    const { depths, keys, depth_order, front, indegree, stack, emitted } = workspace;
+
+    // Back to front depth order used for starting cells
+    const [min, max] = compute_cell_depths(depths, cells, coordinates,
+        camera_position, view_direction, perspective);
+    compute_depth_keys(keys, depths, min, max);
+    radix_sort_ordering(depth_order, keys, workspace);
+
+    // Build the visibility graph for this view
+    compute_front_faces(front, indegree, cells, neighbors, coordinates,
+        camera_position, view_direction, perspective);
+
+    emitted.fill(0);
+    let count = 0;
+    for (let r = 0; r < num_cells; ++r) {
+        const source = depth_order[r];
+        if (emitted[source] || indegree[source] > 0) {
+            continue;
+        }
+        let top = 0;
+        stack[top++] = source;
+        emitted[source] = 1;
+        while (top > 0) {
+            const i = stack[--top];
+            ordering[count++] = i;
+            for (let j = 0; j < 4; ++j) {
+                if (front[4*i + j]) {
+                    const k = neighbors[4*i + j];
+                    if (--indegree[k] === 0) {
+                        emitted[k] = 1;
+                        stack[top++] = k;
+                    }
+                }
+            }
+        }
+    }
+
+    // Break cycles in the visibility graph by depth order
+    if (count < num_cells) {
+        for (let r = 0; r < num_cells; ++r) {
+            const i = depth_order[r];
+            if (!emitted[i]) {
+                ordering[count++] = i;
+            }
+        }
+    }
+}
@@ -60,6 +60,8 @@ function default_uniforms() {
     const user_data_groups: {[key: string]: ITypedUniformMap} = {
         mesh: {
             t_cells: { value: null, gltype: "sampler2D" },
+            // High parts of vertex indices beyond 2^24
+            t_cells_high: { value: null, gltype: "sampler2D" },
             t_coordinates: { value: null, gltype: "sampler2D" },
             u_cell_texture_shape: { value: [0, 0], gltype: "ivec2" },
             u_vertex_texture_shape: { value: [0, 0], gltype: "ivec2" },
@@ -91,6 +93,8 @@ function default_uniforms() {
             u_isovalue: { value: 0.0, gltype: "float" },
             u_isovalue_spacing: { value: 0.0, gltype: "float" },
             u_isovalue_sweep_period: { value: 3.0, gltype: "float" },
+            // First isovalue and its color between two values
+            t_isosurface: { value: null, gltype: "sampler2D" },
         },
         density: {
             // Function values
@@ -99,6 +103,8 @@ function default_uniforms() {
             u_density_range: { value:  new THREE.Vector4(0.0, 1.0, 1.0, 1.0), gltype: "vec4" },
             // Scalar lookup table
             t_density_lut: { value: null, gltype: "sampler2D" },
+            // Mean of scalar lookup table between two values
+            t_density_preintegrated: { value: null, gltype: "sampler2D" },
         },
         emission: {
             // Function values
@@ -107,6 +113,8 @@ function default_uniforms() {
             u_emission_range: { value: new THREE.Vector4(0.0, 1.0, 1.0, 1.0), gltype: "vec4" },
             // Color lookup table
             t_emission_lut: { value: null, gltype: "sampler2D" },
+            // Mean of color lookup table between two values
+            t_emission_preintegrated: { value: null, gltype: "sampler2D" },
         },
     };
 
@@ -85,6 +85,22 @@ type TypedArray = Int8Array | Uint8Array | Int16Array | Uint16Array | Int32Array
 export
 type TypedArrayConstructor = Int8ArrayConstructor | Uint8ArrayConstructor | Int16ArrayConstructor | Uint16ArrayConstructor | Int32ArrayConstructor | Uint32ArrayConstructor | Uint8ClampedArrayConstructor | Float32ArrayConstructor | Float64ArrayConstructor;
 
+// Arrays received padded to their texture size, mapped to
+// the length of the padded buffer following each array
+const padded_arrays = new WeakMap<TypedArray, number>();
+
+export
+function mark_padded<T extends TypedArray>(array: T, padded_length: number): T {
+    padded_arrays.set(array, padded_length);
+    return array;
+}
+
+// Length of the padded buffer following array, or its own length
+export
+function padded_length(array: TypedArray): number {
+    return padded_arrays.get(array) || array.length;
+}
+
 
 export
 type Method = 'surface' | 'isosurface' | 'max' | 'min' | 'xray' | 'sum' | 'volume';
@@ -2,7 +2,13 @@
 
 import expect = require('expect.js');
 
-import { create_three_data } from "../src/channels";
+import {
+    create_three_data, resolve_encoding, find_changed_channels, gather_items,
+    create_channel_data, release_channel_data,
+    split_indices, compute_vertex_texture_shape, max_exact_index, split_index_width
+} from "../src/channels";
+
+import { managers } from "../src/managers";
 
 import * as encodings from '../src/encodings';
 
@@ -24,7 +30,222 @@ describe('channels', function() {
         it('should create stuff', function() {
             const { uniforms, defines, attributes } = create_three_data(method, encoding, data);
 
+            // Unordered method, cells are passed as instanced attribute
+            expect(defines['ENABLE_CELL_ORDERING']).to.be(undefined);
+            expect(uniforms['t_cells']).to.be(undefined);
+            expect(Array.from(attributes['c_cells'].array as Float32Array)).to.eql([0, 1, 2, 3]);
+        });
+
+        it('should only pass the subset of cells to draw', function() {
+            const subset_encoding: encodings.IPartialSurfaceEncoding = {
+                cells: { field: "c567", subset: "s567" },
+                coordinates: { field: "p567" },
+                indicators: { field: "i567", value: 1, lut_field: null, space: "I3", subset: "s567" },
+            };
+            const subset_data = {
+                c567: new Int32Array([0,1,2,3, 0,1,2,4, 0,1,3,4]),
+                i567: new Int32Array([7, 8, 9]),
+                s567: new Int32Array([2, 0]),
+                p567: new Float32Array([0,0,0, 0,0,1, 0,1,0, 1,0,0, -1,0,0]),
+            };
+            const { attributes } = create_three_data(method, subset_encoding, subset_data);
+            expect(Array.from(attributes['c_cells'].array as Float32Array)).to.eql([0, 1, 3, 4, 0, 1, 2, 3]);
+            expect(Array.from(attributes['c_cell_indicators'].array as Float32Array)).to.eql([9, 7]);
+        });
+    });
+
+    describe('isosurface', function() {
+        const method = "isosurface";
+
+        const encoding: encodings.IPartialIsoSurfaceEncoding = {
+            cells: { field: "c901" },
+            coordinates: { field: "p901" },
+            isovalues: {
+                mode: "list", value: 0.0, num_intervals: 0, spacing: 1.0, period: 3.0,
+                table: "t901", table_colors: true,
+            },
+        };
+
+        const data = {
+            c901: new Int32Array([0,1,2,3]),
+            p901: new Float32Array([0,0,0, 0,0,1, 0,1,0, 1,0,0]),
+            t901: new Float32Array(4 * 4 * 4),
+        };
+
+        it('should look up explicit isovalues in table', function() {
+            const { uniforms, defines } = create_three_data(method, encoding, data);
+            expect(defines['USING_ISOSURFACE_MODE_LIST']).to.be(1);
+            expect(defines['ENABLE_ISOSURFACE_COLORS']).to.be(1);
+            expect(uniforms['t_isosurface'].value.image.width).to.be(4);
+        });
+
+        it('should require a table for explicit isovalues', function() {
+            const missing: encodings.IPartialIsoSurfaceEncoding = Object.assign({}, encoding, {
+                isovalues: Object.assign({}, encoding.isovalues, { table: null }),
+            });
+            expect(() => create_three_data(method, missing, data)).to.throwError();
+        });
+    });
+
+    describe('volume', function() {
+        const method = "volume";
+
+        const encoding: encodings.IPartialVolumeEncoding = {
+            cells: { field: "c345" },
+            coordinates: { field: "p456" },
+        };
+
+        const data = {
+            c345: new Int32Array([0,1,2,3]),
+            p456: new Float32Array([0,0,0, 0,0,1, 0,1,0, 1,0,0])
+        };
+
+        it('should look up ordered cells in texture', function() {
+            const { uniforms, defines, attributes } = create_three_data(method, encoding, data);
+
+            expect(defines['ENABLE_CELL_ORDERING']).to.be(1);
             expect(uniforms['u_cell_texture_shape'].value).to.eql([1, 1]);
+            expect(attributes['c_cells']).to.be(undefined);
+        });
+
+        it('should use pre-integrated lut for linear density', function() {
+            const lut_encoding: encodings.IPartialVolumeEncoding = {
+                cells: { field: "c345" },
+                coordinates: { field: "p456" },
+                density: { constant: 1.0, field: "d789", space: "P1", range: [0, 1], lut_field: "l789", lut_preintegrated: "r789" },
+            };
+            const lut_data = Object.assign({
+                d789: new Float32Array([0, 0.5, 1, 0.5]),
+                l789: new Float32Array([0, 1]),
+                r789: new Float32Array([0, 0.5, 0.5, 1]),
+            }, data);
+            const { uniforms, defines } = create_three_data(method, lut_encoding, lut_data);
+            expect(defines['ENABLE_DENSITY_PREINTEGRATED']).to.be(1);
+            expect(uniforms['t_density_preintegrated'].value.image.width).to.be(2);
+            expect(uniforms['t_density_preintegrated'].value.image.height).to.be(2);
+
+            // Constant density in each cell has no use for it
+            lut_encoding.density!.space = "P0";
+            const p0 = create_three_data(method, lut_encoding, lut_data);
+            expect(p0.defines['ENABLE_DENSITY_PREINTEGRATED']).to.be(undefined);
+        });
+    });
+
+    describe('gather_items', function() {
+        it('should gather items of the given indices', function() {
+            const array = new Int32Array([0,1, 2,3, 4,5]);
+            const gathered = gather_items(array, new Int32Array([2, 0]), 2);
+            expect(gathered instanceof Int32Array).to.be(true);
+            expect(Array.from(gathered)).to.eql([4, 5, 0, 1]);
+        });
+    });
+
+    describe('split_indices', function() {
+        it('should only split indices not exact in float32', function() {
+            expect(split_indices(new Int32Array([0, 1, max_exact_index - 1]))).to.be(null);
+
+            const large = max_exact_index + 5;
+            const split = split_indices(new Int32Array([3, large]))!;
+            expect(Array.from(split.low)).to.eql([3, 5]);
+            expect(Array.from(split.high)).to.eql([0, max_exact_index / split_index_width]);
+        });
+
+        it('should lay out vertices in rows matching the split', function() {
+            expect(compute_vertex_texture_shape(16)).to.eql([4, 4]);
+            expect(compute_vertex_texture_shape(max_exact_index + 1)).to.eql(
+                [split_index_width, max_exact_index / split_index_width + 1]);
+        });
+
+        it('should pass split cells as two attributes', function() {
+            const data = { c890: new Int32Array([0, 1, 2, max_exact_index]) };
+            const cells = create_channel_data("surface", "cells", { field: "c890" }, data);
+            expect(cells.defines['ENABLE_SPLIT_VERTEX_INDICES']).to.be(1);
+            expect(Array.from(cells.attributes['c_cells'].array as Float32Array)).to.eql([0, 1, 2, 0]);
+            expect(Array.from(cells.attributes['c_cells_high'].array as Float32Array)).to.eql(
+                [0, 0, 0, max_exact_index / split_index_width]);
+            release_channel_data(cells);
+        });
+    });
+
+    describe('release_channel_data', function() {
+        it('should release textures and buffers when no longer used', function() {
+            const data = {
+                c789: new Int32Array([0,1,2,3]),
+                p789: new Float32Array([0,0,0, 0,0,1, 0,1,0, 1,0,0]),
+            };
+            const cells0 = create_channel_data("surface", "cells", { field: "c789" }, data);
+            const cells1 = create_channel_data("surface", "cells", { field: "c789" }, data);
+            const coordinates = create_channel_data("surface", "coordinates", { field: "p789" }, data);
+            const buffer = cells0.attributes['c_cells'];
+            const texture = coordinates.uniforms['t_coordinates'].value;
+            expect(cells1.attributes['c_cells']).to.be(buffer);
+
+            release_channel_data(cells0);
+            expect(managers.cells_buffer.key2object.get("c789")).to.be(buffer);
+            release_channel_data(cells1);
+            expect(managers.cells_buffer.key2object.has("c789")).to.be(false);
+
+            release_channel_data(coordinates);
+            expect(managers.array_texture.key2object.has("p789")).to.be(false);
+            expect(texture.disposed).to.be(true);
+        });
+    });
+
+    describe('subset updates', function() {
+        it('should keep the buffers in use constant while the subset changes', function() {
+            // Like moving the offset of a slice plot or an isovalue,
+            // the subset has the same id with other cells each time
+            const data = {
+                c890: new Int32Array([0,1,2,3, 0,1,2,4, 0,1,3,4]),
+                s890: new Int32Array([0]),
+            };
+            const before = managers.cells_buffer.stats().objects;
+            let cells = create_channel_data("isosurface", "cells", { field: "c890", subset: "s890" }, data);
+            const buffer = cells.attributes['c_cells'];
+            for (let subset of [[0, 2], [1], [], [0, 1, 2]]) {
+                const next = create_channel_data("isosurface", "cells", { field: "c890", subset: "s890" },
+                    Object.assign({}, data, { s890: new Int32Array(subset) }));
+                release_channel_data(cells);
+                cells = next;
+                expect(cells.attributes['c_cells']).to.be(buffer);
+                expect(buffer.count).to.be(subset.length);
+                expect(managers.cells_buffer.stats().objects).to.be(before + 1);
+            }
+            release_channel_data(cells);
+            expect(managers.cells_buffer.stats().objects).to.be(before);
+        });
+    });
+
+    describe('find_changed_channels', function() {
+        const method = "xray";
+
+        const data = {
+            c123: new Int32Array([0,1,2,3]),
+            p234: new Float32Array([0,0,0, 0,0,1, 0,1,0, 1,0,0]),
+        };
+        const encoding = resolve_encoding(method, {
+            cells: { field: "c123" },
+            coordinates: { field: "p234" },
+            extinction: { value: 1.0 },
+        });
+
+        it('should find nothing if nothing changed', function() {
+            const same = resolve_encoding(method, encoding);
+            expect(find_changed_channels(same, Object.assign({}, data), encoding, data)).to.eql([]);
+        });
+
+        it('should find changed channel values', function() {
+            const changed = resolve_encoding(method, Object.assign({}, encoding, {
+                extinction: { value: 2.0 },
+            }));
+            expect(find_changed_channels(changed, data, encoding, data)).to.eql(["extinction"]);
+        });
+
+        it('should find channels with new data', function() {
+            const new_data = Object.assign({}, data, {
+                p234: new Float32Array([0,0,0, 0,0,2, 0,2,0, 2,0,0]),
+            });
+            expect(find_changed_channels(encoding, new_data, encoding, data)).to.eql(["coordinates"]);
         });
     });
 
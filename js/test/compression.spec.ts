@@ -0,0 +1,85 @@
+"use strict";
+
+import expect = require('expect.js');
+
+import {
+    decode_varint,
+    decode_float16,
+    dequantize,
+    decode_array
+  } from '../src/compression';
+
+import {
+    padded_length
+  } from '../src/utils';
+
+
+describe('compression', function() {
+
+  describe('decode_varint()', function() {
+    it('should decode zigzag deltas', function() {
+      // Encoded by unray.compression.encode_varint([3, 5, 4, 200, -1])
+      const bytes = new Uint8Array([6, 4, 1, 136, 3, 145, 3]);
+      const values = decode_varint(bytes, 5);
+      expect(values instanceof Int32Array).to.be(true);
+      expect(Array.from(values)).to.eql([3, 5, 4, 200, -1]);
+    });
+  });
+
+  describe('decode_float16()', function() {
+    it('should decode half precision floats', function() {
+      const values = decode_float16(new Uint16Array([15872, 49152, 13312, 0, 0x7c00]));
+      expect(Array.from(values)).to.eql([1.5, -2, 0.25, 0, Infinity]);
+    });
+  });
+
+  describe('dequantize()', function() {
+    it('should use separate offset and scale per component', function() {
+      const q = new Uint8Array([0, 0, 255, 255, 51, 102]);
+      const values = dequantize(q, [0, 10], [1 / 255, 20 / 255]);
+      expect(values[0]).to.be(0);
+      expect(values[1]).to.be(10);
+      expect(values[2]).to.be(1);
+      expect(values[3]).to.be(30);
+      expect(values[4]).to.be.within(0.199, 0.201);
+      expect(values[5]).to.be.within(17.99, 18.01);
+    });
+  });
+
+  describe('decode_array()', function() {
+    it('should handle unaligned buffers', function() {
+      const bytes = new Uint8Array(7);
+      new Uint8Array(bytes.buffer, 1, 6).set(new Uint8Array(new Uint16Array([15872, 49152, 13312]).buffer));
+      const values = decode_array({
+        compression: "float16",
+        shape: [3],
+        dtype: "float32",
+        buffer: new DataView(bytes.buffer, 1, 6),
+      });
+      expect(Array.from(values)).to.eql([1.5, -2, 0.25]);
+    });
+
+    it('should view padded arrays without copying', function() {
+      const padded = new Float32Array([1, 2, 3, 0]);
+      const values = decode_array({
+        compression: "padded",
+        shape: [3],
+        dtype: "float32",
+        buffer: new DataView(padded.buffer),
+      });
+      expect(Array.from(values)).to.eql([1, 2, 3]);
+      expect(values.buffer === padded.buffer).to.be(true);
+      expect(padded_length(values)).to.be(4);
+    });
+
+    it('should throw on unknown compression', function() {
+      expect(() => decode_array({
+        compression: "zip" as any,
+        shape: [0],
+        dtype: "float32",
+        buffer: new DataView(new ArrayBuffer(0)),
+      })).to.throwError();
+    });
+  });
+
+});
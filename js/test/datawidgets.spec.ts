@@ -32,6 +32,24 @@ describe('datawidgets', function() {
         });
     });
 
+    describe('FieldSeriesModel', function() {
+        it('should be constructable', function() {
+            const model = factory.createP1FieldSeries();
+            expect(model.get('_model_name')).to.be("FieldSeriesModel");
+            expect(model.getFrame(0)!.length).to.be(5);
+        });
+        it('should receive frames in chunks', function() {
+            const model = factory.createP1FieldSeries();
+            const chunk = new Float32Array([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]);
+            const frame2 = model.getFrame(2);
+            model.onCustomMessage({ event: "frames", start: 1, count: 2, shape: [3, 5] },
+                [new DataView(chunk.buffer)]);
+            expect(Array.from(model.getFrame(2)!)).to.eql([6, 7, 8, 9, 10]);
+            expect(model.getFrame(2)).not.to.be(frame2);
+            expect(model.getFrame(10)).to.be(model.getFrame(2));
+        });
+    });
+
     describe('IndicatorFieldModel', function() {
         it('should be constructable in I2 space', function() {
             const model = factory.createFaceIndicatorField();
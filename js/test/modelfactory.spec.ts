@@ -75,6 +75,16 @@ function createP1Field() {
     return createTestModel(dw.FieldModel, attribs);
 }
 
+export
+function createP1FieldSeries() {
+    const mesh = createMesh();
+    const shape = [3, 5];
+    const space = "P1";
+
+    const attribs = { mesh, shape, space };
+    return createTestModel(dw.FieldSeriesModel, attribs);
+}
+
 export
 function createD1Field() {
     const mesh = createMesh();
@@ -2,7 +2,7 @@
 
 import expect = require('expect.js');
 
-import {ObjectManager} from "../src/object_manager";
+import {ObjectManager, content_key} from "../src/object_manager";
 
 interface TestObj {spec: Float32Array, oldspec?: Float32Array}
 
@@ -69,5 +69,74 @@ describe('ObjectManager', function() {
             expect(ledger[0]).to.be(obj0);
             expect(ledger[1]).to.be(obj1);
         });
+
+        it('should release the previous object on replacement', function() {
+            const ledger: TestObj[] = [];
+            const create = (spec: Float32Array) => ({spec: spec});
+            const update = (obj: TestObj, spec: Float32Array) => { obj.spec = spec; };
+            const deleted = (obj: TestObj) => { ledger.push(obj); };
+            const manager = new ObjectManager<Float32Array, TestObj>(create, update, deleted);
+
+            const obj0 = manager.update("key0", new Float32Array([3]));
+            const obj1 = manager.update("key1", new Float32Array([5]), obj0);
+            expect(obj1 === obj0).to.be(false);
+            expect(ledger).to.eql([obj0]);
+            expect(manager.key2object.has("key0")).to.be(false);
+
+            // Objects not managed here are ignored
+            expect(manager.release({spec: new Float32Array(1)})).to.be(false);
+            expect(manager.release(obj1)).to.be(true);
+            expect(ledger.length).to.be(2);
+            expect(manager.release(obj1)).to.be(false);
+        });
+    });
+
+    describe('content keys', function() {
+        it('should reuse objects without updating them', function() {
+            const create = (spec: Float32Array) => ({spec: spec});
+            const update = (obj: TestObj, spec: Float32Array) => { obj.spec = spec; };
+            const manager = new ObjectManager<Float32Array, TestObj>(create, update);
+
+            const key = content_key("0123abcd");
+            const spec0 = new Float32Array([3]);
+            const obj0 = manager.update(key, spec0);
+            const obj1 = manager.update(key, new Float32Array([3]));
+            expect(obj1).to.be(obj0);
+            expect(obj1.spec).to.be(spec0);
+            expect(manager.objectCount.get(obj0)).to.be(2);
+        });
+    });
+
+    describe('#setBudget()', function() {
+        it('should keep unused objects within budget', function() {
+            const ledger: TestObj[] = [];
+            const create = (spec: Float32Array) => ({spec: spec});
+            const update = (obj: TestObj, spec: Float32Array) => { obj.spec = spec; };
+            const deleted = (obj: TestObj) => { ledger.push(obj); };
+            const size = (obj: TestObj) => obj.spec.byteLength;
+            const manager = new ObjectManager<Float32Array, TestObj>(create, update, deleted, size);
+            manager.setBudget(12);
+
+            const obj0 = manager.update("key0", new Float32Array(2));
+            const obj1 = manager.update("key1", new Float32Array(2));
+            expect(manager.stats()).to.eql({ objects: 2, bytes: 16, cached: 0, cached_bytes: 0 });
+
+            // Released object is kept for reuse under the same key
+            manager.release(obj0);
+            expect(ledger.length).to.be(0);
+            expect(manager.stats()).to.eql({ objects: 1, bytes: 8, cached: 1, cached_bytes: 8 });
+            expect(manager.update("key0", new Float32Array(2))).to.be(obj0);
+            expect(manager.stats()).to.eql({ objects: 2, bytes: 16, cached: 0, cached_bytes: 0 });
+
+            // Least recently released objects are deleted beyond budget
+            manager.release(obj1);
+            manager.release(obj0);
+            expect(ledger).to.eql([obj1]);
+            expect(manager.stats()).to.eql({ objects: 0, bytes: 0, cached: 1, cached_bytes: 8 });
+
+            manager.setBudget(0);
+            expect(ledger).to.eql([obj1, obj0]);
+            expect(manager.stats()).to.eql({ objects: 0, bytes: 0, cached: 0, cached_bytes: 0 });
+        });
     });
 });
@@ -66,6 +66,20 @@ describe('plotwidgets', function() {
         });
     });
 
+    describe('SlicePlotModel', function() {
+        it('should fail to construct if not given a mesh', function() {
+            expect(createTestModel).withArgs(pw.SlicePlotModel, {}).to.throwException();
+        });
+        it('should be constructable with a mesh and constant color', function() {
+            const mesh = factory.createMesh();
+            const color = factory.createColorConstant();
+            const attribs = { mesh, color };
+            const plot = createTestModel(pw.SlicePlotModel, attribs);
+            expect(plot.get('_model_name')).to.be("SlicePlotModel");
+            expect(plot.get('offset')).to.be(0.0);
+        });
+    });
+
     describe('XrayPlotModel', function() {
         it('should fail to construct if not given a mesh', function() {
             expect(createTestModel).withArgs(pw.XrayPlotModel, {}).to.throwException();
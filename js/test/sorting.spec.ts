@@ -0,0 +1,108 @@
+"use strict";
+
+import expect = require('expect.js');
+
+import {
+    create_sorting_workspace,
+    compute_cell_depths,
+    radix_sort_ordering,
+    sort_cells,
+    topological_sort_cells
+  } from '../src/sorting';
+
+
+describe('sorting', function() {
+  // Three cells stacked along the z axis, cell i has centroid z = i + 0.25
+  const points = new Float32Array([
+    0,0,0,  1,0,0,  0,1,0,  0,0,1,
+    0,0,1,  1,0,1,  0,1,1,  0,0,2,
+    0,0,2,  1,0,2,  0,1,2,  0,0,3,
+  ]);
+  const cells = new Int32Array([
+    0,1,2,3,  4,5,6,7,  8,9,10,11,
+  ]);
+
+  describe('compute_cell_depths()', function() {
+    it('should compute depths along the view direction', function() {
+      const depths = new Float32Array(3);
+      const range = compute_cell_depths(depths, cells, points, [0, 0, 0], [0, 0, 1], false);
+      expect(Array.from(depths)).to.eql([0.25, 1.25, 2.25]);
+      expect(range).to.eql([0.25, 2.25]);
+    });
+  });
+
+  describe('radix_sort_ordering()', function() {
+    it('should sort by increasing key and be stable', function() {
+      const keys = new Uint32Array([5000, 3, 1 << 20, 3, 0]);
+      const ordering = new Float32Array(5);
+      radix_sort_ordering(ordering, keys, create_sorting_workspace(5));
+      expect(Array.from(ordering)).to.eql([4, 1, 3, 0, 2]);
+    });
+  });
+
+  describe('sort_cells()', function() {
+    it('should order cells back to front with orthographic projection', function() {
+      const ordering = new Float32Array(3);
+      sort_cells(ordering, cells, points, [0, 0, 0], [0, 0, 1], false);
+      expect(Array.from(ordering)).to.eql([2, 1, 0]);
+      sort_cells(ordering, cells, points, [0, 0, 0], [0, 0, -1], false);
+      expect(Array.from(ordering)).to.eql([0, 1, 2]);
+    });
+
+    it('should order cells back to front with perspective projection', function() {
+      const ordering = new Float32Array(3);
+      sort_cells(ordering, cells, points, [0, 0, 10], [0, 0, -1], true);
+      expect(Array.from(ordering)).to.eql([0, 1, 2]);
+      sort_cells(ordering, cells, points, [0, 0, -10], [0, 0, 1], true);
+      expect(Array.from(ordering)).to.eql([2, 1, 0]);
+    });
+  });
+
+  describe('topological_sort_cells()', function() {
+    // Two cells sharing the face (0, 1, 2) tilted almost parallel to the
+    // z axis, such that the cell in front seen along +z has the centroid
+    // farthest away and depth sorting by centroids gets the order wrong
+    const points = new Float32Array([
+      0,0,0,  0,1,0,  1,0,10,  3,0.3,20,  -1,0.3,0,
+    ]);
+    const cells = new Int32Array([
+      0,1,2,3,  0,1,2,4,
+    ]);
+    const neighbors = new Int32Array([
+      -1,-1,-1,1,  -1,-1,-1,0,
+    ]);
+
+    it('should order cells by visibility rather than centroid depth', function() {
+      const ordering = new Float32Array(2);
+      sort_cells(ordering, cells, points, [0, 0, 0], [0, 0, 1], false);
+      expect(Array.from(ordering)).to.eql([0, 1]);
+      topological_sort_cells(ordering, cells, neighbors, points, [0, 0, 0], [0, 0, 1], false);
+      expect(Array.from(ordering)).to.eql([1, 0]);
+    });
+
+    it('should reverse the order when seen from the other side', function() {
+      const ordering = new Float32Array(2);
+      topological_sort_cells(ordering, cells, neighbors, points, [0, 0, 0], [0, 0, -1], false);
+      expect(Array.from(ordering)).to.eql([0, 1]);
+      topological_sort_cells(ordering, cells, neighbors, points, [0, 0, 100], [0, 0, -1], true);
+      expect(Array.from(ordering)).to.eql([0, 1]);
+      topological_sort_cells(ordering, cells, neighbors, points, [0, 0, -100], [0, 0, 1], true);
+      expect(Array.from(ordering)).to.eql([1, 0]);
+    });
+
+    it('should agree with depth sorting on stacked cells', function() {
+      const points = new Float32Array([
+        0,0,0,  1,0,0,  0,1,0,  0,0,1,  1,1,1,
+      ]);
+      const cells = new Int32Array([0,1,2,3,  4,3,2,1]);
+      const neighbors = new Int32Array([1,-1,-1,-1,  0,-1,-1,-1]);
+      const ordering = new Float32Array(2);
+      topological_sort_cells(ordering, cells, neighbors, points, [5, 5, 5], [-1, -1, -1], true);
+      expect(Array.from(ordering)).to.eql([0, 1]);
+      sort_cells(ordering, cells, points, [5, 5, 5], [-1, -1, -1], true);
+      expect(Array.from(ordering)).to.eql([0, 1]);
+      topological_sort_cells(ordering, cells, neighbors, points, [-5, -5, -5], [1, 1, 1], true);
+      expect(Array.from(ordering)).to.eql([1, 0]);
+    });
+  });
+});
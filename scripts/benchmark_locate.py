@@ -0,0 +1,41 @@
+"""Measure the cost of locating points in mesh cells.
+
+Run with `python scripts/benchmark_locate.py [n] [num_queries]`, which
+builds a unit cube mesh with n^3 subcubes split in 6 tetrahedra each
+and locates num_queries random points in it, by default 1M points.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from unray.meshutils import build_cell_tree, locate_points
+
+
+def create_box_mesh(n):
+    m = n + 1
+    points = np.stack(np.meshgrid(*[np.linspace(0, 1, m)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+    index = np.arange(m**3).reshape((m, m, m))
+    corners = np.stack([index[i:m-1+i, j:m-1+j, k:m-1+k].ravel()
+        for i in (0, 1) for j in (0, 1) for k in (0, 1)], axis=1)
+    tets = [[0, 1, 3, 7], [0, 1, 5, 7], [0, 2, 3, 7], [0, 2, 6, 7], [0, 4, 5, 7], [0, 4, 6, 7]]
+    return corners[:, tets].reshape(-1, 4).astype(np.int32), points.astype(np.float32)
+
+
+def main(n=64, num_queries=1000000):
+    cells, points = create_box_mesh(n)
+    queries = np.random.RandomState(0).uniform(-0.05, 1.05, size=(num_queries, 3))
+    print("%d cells, %d queries" % (len(cells), num_queries))
+
+    t0 = time.time()
+    tree = build_cell_tree(cells, points)
+    t1 = time.time()
+    found, coordinates = locate_points(tree, cells, points, queries)
+    t2 = time.time()
+    print("build: %.2f s" % (t1 - t0))
+    print("locate: %.2f s, %.2f us per query, %d found" % (t2 - t1, 1e6 * (t2 - t1) / num_queries, (found >= 0).sum()))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -43,6 +43,15 @@ def d1field(mesh):
     values = np.asarray([0.1, 0.2, 0.3, 0.4, 1.0, 2.0, 3.0, 4.0], dtype="float32")
     return ur.Field(mesh=mesh, values=values, space="D1")
 
+@pytest.fixture
+def p1field_series(mesh):
+    values = np.asarray([
+        [0.1, -0.2, 3.0, -4.0, 0.5],
+        [0.2, -0.4, 6.0, -8.0, 1.0],
+        [0.3, -0.6, 9.0, -12.0, 1.5],
+        ], dtype="float32")
+    return ur.FieldSeries(mesh=mesh, values=values, space="P1")
+
 @pytest.fixture
 def face_indicators(mesh):
     shared = 3  # This is the facet shared between the two cells
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from unray.compression import (
+    encode_varint,
+    decode_varint,
+    quantize,
+    dequantize,
+    encode_array,
+    decode_array,
+    texture_shape,
+)
+
+def test_varint_roundtrip():
+    values = np.asarray([3, 5, 4, 200, -1, 2**31 - 1, -2**31], dtype="int64")
+    data = encode_varint(values)
+    assert data.dtype == np.uint8
+    assert decode_varint(data, len(values)).tolist() == values.tolist()
+
+def test_varint_packs_small_deltas():
+    cells = np.arange(4000, dtype="int32").reshape((-1, 4))
+    data = encode_varint(cells)
+    # All deltas are 0 or 1, taking one byte each
+    assert len(data) == cells.size
+
+def test_quantize_columns():
+    values = np.asarray([[0.0, 10.0], [1.0, 30.0], [0.5, 20.0]])
+    q, offset, scale = quantize(values, "uint8")
+    assert q.dtype == np.uint8
+    assert q[:, 0].tolist() == [0, 255, 128]
+    assert q[:, 1].tolist() == [0, 255, 128]
+    assert offset.tolist() == [0.0, 10.0]
+    assert np.allclose(dequantize(q, offset, scale), values, atol=0.5 * scale)
+
+def test_quantize_constant():
+    q, offset, scale = quantize(np.full(5, 2.0), "uint16")
+    assert q.tolist() == [0] * 5
+    assert dequantize(q, offset, scale).tolist() == [2.0] * 5
+
+@pytest.mark.parametrize("compression,tol", [
+    ("float16", 1e-3), ("uint16", 1e-4), ("uint8", 1e-2),
+])
+def test_encode_values(compression, tol):
+    values = np.linspace(0.0, 1.0, 101, dtype="float32")
+    state = encode_array(values, compression)
+    assert state["compression"] == compression
+    assert state["dtype"] == "float32"
+    assert state["shape"] == values.shape
+    decoded = decode_array(state)
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, values, atol=tol)
+
+def test_encode_cells(mesh):
+    state = encode_array(mesh.cells, "varint")
+    assert state["dtype"] == "int32"
+    decoded = decode_array(state)
+    assert decoded.dtype == np.int32
+    assert decoded.tolist() == np.asarray(mesh.cells).tolist()
+
+def test_texture_shape():
+    assert texture_shape(1) == (1, 1)
+    assert texture_shape(5) == (2, 3)
+    assert texture_shape(16) == (4, 4)
+    assert texture_shape(17) == (4, 5)
+    assert texture_shape(2**24) == (2**12, 2**12)
+    assert texture_shape(2**24 + 1) == (2**12, 2**12 + 1)
+
+def test_encode_padded(mesh):
+    state = encode_array(mesh.points, "padded")
+    assert state["shape"] == mesh.points.shape
+    width, height = texture_shape(len(mesh.points))
+    assert state["buffer"].nbytes == width * height * 3 * 4
+    assert np.allclose(decode_array(state), mesh.points)
+
+def test_encode_invalid():
+    with pytest.raises(ValueError):
+        encode_array(np.zeros(3), "zip")
+
+def test_compressed_state(mesh, p1field):
+    assert "compression" not in mesh.get_state()["cells"]
+    mesh.cells_compression = "varint"
+    mesh.points_compression = "uint16"
+    state = mesh.get_state()
+    assert state["cells"]["compression"] == "varint"
+    assert state["points"]["compression"] == "uint16"
+    p1field.values_compression = "uint8"
+    assert p1field.get_state()["values"]["compression"] == "uint8"
+    p1field.values_compression = "padded"
+    assert p1field.get_state()["values"]["compression"] == "padded"
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+import unray as ur
+from unray.render import Camera, render
+from unray.lututils import sample_lut
+from unray import cpu
+
+
+def box_mesh(nz=1):
+    "Mesh of nz unit cubes stacked along z, each split in 6 tetrahedra."
+    corners = np.asarray([[i & 1, (i >> 1) & 1, i >> 2] for i in range(8)])
+    points = np.concatenate([corners[corners[:, 2] == 0] + [0, 0, k] for k in range(nz + 1)])
+    paths = [(1, 2, 4), (1, 4, 2), (2, 1, 4), (2, 4, 1), (4, 1, 2), (4, 2, 1)]
+    cells = []
+    for k in range(nz):
+        for path in paths:
+            corner = [0, path[0], path[0] + path[1], 7]
+            cells.append([c % 4 + 4 * (k + c // 4) for c in corner])
+    return ur.Mesh(cells=np.asarray(cells, dtype="int32"), points=np.asarray(points, dtype="float32"))
+
+
+# Looking down at the unit cube from above with a narrow view,
+# such that all rays go through the top and bottom faces
+camera = Camera(position=(0.5, 0.5, 10.0), target=(0.5, 0.5, 0.5), up=(0, 1, 0), fov=4.0)
+
+
+def z_field(mesh, space="P1"):
+    points = mesh.points
+    cells = mesh.cells
+    if space == "P1":
+        values = points[:, 2]
+    elif space == "D1":
+        values = points[cells, 2].reshape(-1)
+    return ur.Field(mesh=mesh, values=values.astype("float32"), space=space)
+
+
+def integrate(plot, steps=1, width=8, height=8):
+    scene = cpu.prepare(plot)
+    return cpu.integrate(scene, camera.fit(scene["points"]), width, height, steps=steps)
+
+
+def test_box_mesh_volume():
+    mesh = box_mesh(2)
+    vertices = mesh.points[mesh.cells]
+    edges = vertices[:, :3] - vertices[:, 3:]
+    assert np.allclose(np.abs(np.linalg.det(edges)).sum() / 6, 2.0)
+
+
+def test_sum_of_constant_is_ray_length():
+    plot = ur.SumPlot(mesh=box_mesh(), color=ur.ColorConstant(intensity=0.5, color="#ffffff"), exposure=1.0)
+    rgb, alpha = integrate(plot)
+    assert (alpha == 1).all()
+    assert np.allclose(rgb, 1.0, rtol=1e-3)
+
+
+@pytest.mark.parametrize("space", ["P1", "D1"])
+def test_xray_of_linear_field(space):
+    mesh = box_mesh()
+    density = ur.ScalarField(field=z_field(mesh, space))
+    plot = ur.XrayPlot(mesh=mesh, density=density, extinction=2.0)
+    rgb, alpha = integrate(plot)
+    assert (rgb == 0).all()
+    # Mean density along the ray is 0.5
+    assert np.allclose(alpha, 1.0 - np.exp(-1.0), rtol=1e-3)
+
+
+def test_xray_of_cell_values():
+    mesh = box_mesh(2)
+    values = np.repeat([1.0, 3.0], 6).astype("float32")
+    field = ur.Field(mesh=mesh, values=values, space="P0")
+    plot = ur.XrayPlot(mesh=mesh, density=ur.ScalarField(field=field))
+    rgb, alpha = integrate(plot)
+    # Scaled densities 0 and 1 along one unit each
+    assert np.allclose(alpha, 1.0 - np.exp(-1.0), rtol=1e-3)
+
+
+def test_xray_steps_converge():
+    mesh = box_mesh()
+    values = np.linspace(0.0, 1.0, 16) ** 2
+    lut = ur.ArrayScalarMap(values=values.astype("float32"))
+    plot = ur.XrayPlot(mesh=mesh, density=ur.ScalarField(field=z_field(mesh), lut=lut))
+    _, coarse = integrate(plot, steps=1)
+    _, fine = integrate(plot, steps=64)
+    # Mean density along the ray is the mean of the lut
+    mean = sample_lut(values, (np.arange(4096) + 0.5) / 4096).mean()
+    assert np.allclose(fine, 1.0 - np.exp(-mean), rtol=1e-3)
+    assert (coarse > fine).all()
+
+
+def test_max_and_min(array_color_lut):
+    mesh = box_mesh()
+    color = ur.ColorField(field=z_field(mesh), lut=array_color_lut)
+    rgb, alpha = integrate(ur.MaxPlot(mesh=mesh, color=color))
+    assert np.allclose(rgb, 1.0)
+    rgb, alpha = integrate(ur.MinPlot(mesh=mesh, color=color))
+    assert np.allclose(rgb, 0.0)
+    assert (alpha == 1).all()
+
+
+def test_volume_of_constants():
+    plot = ur.VolumePlot(mesh=box_mesh(), color=ur.ColorConstant(color="#ff0000"),
+        density=ur.ScalarConstant(value=2.0), extinction=0.5, exposure=0.0)
+    rgb, alpha = integrate(plot, steps=3)
+    a = 1.0 - np.exp(-1.0)
+    assert np.allclose(alpha, a, rtol=1e-3)
+    assert np.allclose(rgb[..., 0], a, rtol=1e-3)
+    assert np.allclose(rgb[..., 1:], 0.0)
+
+
+def test_volume_composites_front_to_back():
+    # Red cube in front of a blue cube, seen from above
+    mesh = box_mesh(2)
+    field = ur.Field(mesh=mesh, values=np.repeat([0.0, 1.0], 6).astype("float32"), space="P0")
+    lut = ur.ArrayColorMap(values=np.asarray([[0, 0, 1], [1, 0, 0]], dtype="float32"))
+    plot = ur.VolumePlot(mesh=mesh, color=ur.ColorField(field=field, lut=lut),
+        density=ur.ScalarConstant(value=1.0), extinction=1.0)
+    rgb, alpha = integrate(plot)
+    a = 1.0 - np.exp(-1.0)
+    assert np.allclose(rgb[..., 0], a, rtol=1e-3)
+    assert np.allclose(rgb[..., 2], (1.0 - a) * a, rtol=1e-3)
+    assert np.allclose(alpha, 1.0 - np.exp(-2.0), rtol=1e-3)
+
+
+def test_restrict():
+    mesh = box_mesh()
+    indicators = ur.IndicatorField(mesh=mesh, values=np.zeros(6, dtype="int32"), space="I3")
+    plot = ur.SumPlot(mesh=mesh, color=ur.ColorConstant(), restrict=ur.ScalarIndicators(field=indicators, value=1))
+    rgb, alpha = integrate(plot)
+    assert (alpha == 0).all()
+
+
+def test_tiles():
+    assert cpu.tiles(5, 3, 2) == [(0, 0, 2, 2), (2, 0, 4, 2), (4, 0, 5, 2), (0, 2, 2, 3), (2, 2, 4, 3), (4, 2, 5, 3)]
+
+
+def test_render_tiles_in_processes(mesh, color_field, scalar_field):
+    plot = ur.VolumePlot(mesh=mesh, color=color_field, density=scalar_field, extinction=3.0)
+    view = Camera(direction=(0.2, 1.0, 0.3))
+    image = cpu.render(plot, view, width=24, height=20, tile_size=7, processes=2)
+    assert image.shape == (20, 24, 4)
+    assert 0 < (image[..., 3] > 0).sum() < 20 * 24
+    assert (image == cpu.render(plot, view, width=24, height=20, tile_size=64, processes=1)).all()
+
+    # The generic render function dispatches to this module
+    assert (image == render(plot, view, width=24, height=20)).all()
+
+
+def test_render_background():
+    plot = ur.XrayPlot(mesh=box_mesh(), density=ur.ScalarConstant(value=1.0))
+    image = cpu.render(plot, camera, width=4, height=4, background="#ffffff", processes=1)
+    value = np.round(255 * np.exp(-1.0))
+    assert np.allclose(image[..., :3], value, atol=1)
+    assert (image[..., 3] == 255).all()
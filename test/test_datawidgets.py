@@ -6,6 +6,150 @@ def test_mesh(mesh):
     assert mesh.cells.shape[1] == 4
     assert mesh.points.shape[1] == 3
 
+def test_mesh_auto_orient(mesh):
+    assert mesh.oriented
+    assert mesh.cells.tolist() == [[0, 1, 3, 2], [0, 1, 2, 4]]
+
+def test_mesh_no_auto_orient(mesh):
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    m = ur.Mesh(cells=cells, points=mesh.points, auto_orient=False)
+    assert not m.oriented
+    assert m.cells.tolist() == cells.tolist()
+
+def test_mesh_neighbors(mesh):
+    assert mesh.neighbors is None
+    neighbors = mesh.compute_neighbors()
+    assert neighbors.tolist() == [[-1, -1, 1, -1], [-1, -1, -1, 0]]
+    assert mesh.neighbors is neighbors
+    # Neighbors are kept up to date once computed
+    mesh.cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    assert mesh.neighbors.tolist() == [[-1, -1, 1, -1], [-1, -1, -1, 0]]
+    mesh.cells = np.asarray([[0, 1, 2, 4]], dtype="int32")
+    assert mesh.neighbors.tolist() == [[-1, -1, -1, -1]]
+
+def test_mesh_shares_memory(mesh, tmp_path):
+    points = np.memmap(str(tmp_path / "points.bin"), dtype="float32", mode="w+", shape=(5, 3))
+    points[:] = mesh.points
+    m = ur.Mesh(cells=mesh.cells, points=points)
+    assert np.shares_memory(m.points, points)
+    assert np.shares_memory(m.cells, mesh.cells)
+
+def test_field_casts_values(mesh):
+    values = np.arange(5, dtype="float64")
+    field = ur.Field(mesh=mesh, values=values)
+    assert field.values.dtype == np.float32
+    assert field.values.tolist() == values.tolist()
+    values = np.arange(5, dtype="float32")
+    values.flags.writeable = False
+    field.values = values
+    assert np.shares_memory(field.values, values)
+
+def test_content_hashes(mesh, p1field):
+    assert sorted(mesh.hashes) == ["cells", "points"]
+    # Equal arrays have equal hashes, regardless of widget
+    copy = ur.Mesh(cells=np.array(mesh.cells), points=np.array(mesh.points))
+    assert copy.hashes == mesh.hashes
+    points = np.array(mesh.points)
+    points[0, 0] = 0.5
+    copy.points = points
+    assert copy.hashes["points"] != mesh.hashes["points"]
+    assert copy.hashes["cells"] == mesh.hashes["cells"]
+
+    # Compressed values get a different hash, sent along with the values
+    sent = []
+    p1field.send_state = lambda key=None: sent.append(key)
+    h = p1field.hashes["values"]
+    p1field.values_compression = "float16"
+    assert p1field.hashes["values"] != h
+    assert ["values", "hashes"] in sent
+
+    # Only arrays are hashed, array widgets are keyed by model id instead
+    mesh.compute_neighbors()
+    assert "neighbors" in mesh.hashes
+    mesh.neighbors = None
+    assert "neighbors" not in mesh.hashes
+
+def test_refresh(mesh, p1field, array_scalar_lut):
+    # Reassigning an array modified in place notifies nothing
+    h = p1field.hashes["values"]
+    lower, upper = p1field.compute_cell_ranges()
+    p1field.values[:] *= 2
+    p1field.values = p1field.values
+    assert p1field.hashes["values"] == h
+    assert p1field.range == (-4.0, 3.0)
+
+    p1field.refresh()
+    assert p1field.hashes["values"] != h
+    assert p1field.range == (-8.0, 6.0)
+    assert np.allclose(p1field.compute_cell_ranges()[0], 2 * lower)
+
+    # Refreshing mesh cells updates caches of fields on the mesh
+    mesh.cells[:] = mesh.cells[::-1]
+    mesh.refresh("cells")
+    assert np.allclose(p1field.compute_cell_ranges()[0], 2 * lower[::-1])
+
+    array_scalar_lut.values[:] = 1.0
+    array_scalar_lut.refresh()
+    assert np.allclose(array_scalar_lut.preintegrated, 1.0)
+
+def test_mesh_locate(mesh):
+    cells, lam = mesh.locate([[0.1, 0.1, 0.1], [-0.1, 0.1, 0.1], [2.0, 0.0, 0.0]])
+    assert cells.tolist() == [0, 1, -1]
+    assert np.allclose(np.einsum("ij,ijk->ik", lam[:2], mesh.points[mesh.cells[cells[:2]]]),
+        [[0.1, 0.1, 0.1], [-0.1, 0.1, 0.1]])
+    # The index is cached until points change
+    tree = mesh._cell_tree
+    mesh.locate([[0.1, 0.1, 0.1]])
+    assert mesh._cell_tree is tree
+    mesh.points = mesh.points + np.float32(1.0)
+    assert mesh._cell_tree is None
+    assert mesh.locate([[0.1, 0.1, 0.1]])[0].tolist() == [-1]
+
+def test_mesh_decimate(mesh):
+    coarse = mesh.decimate(1)
+    assert len(coarse.cells) <= 1
+    assert mesh.decimate(1) is coarse
+    # Meshes small enough are kept as they are
+    assert mesh.decimate(2).cells.tolist() == mesh.cells.tolist()
+    mesh.points = mesh.points * 2
+    assert mesh.decimate(1) is not coarse
+
+def test_field_decimate(p0field, p1field, p1field_series, cell_indicators):
+    for field in [p0field, p1field, p1field_series, cell_indicators]:
+        coarse = field.decimate(2)
+        assert coarse.mesh is field.mesh.decimate(2)
+        assert coarse.space == field.space
+        assert coarse.values.tolist() == field.values.tolist()
+
+def test_decimate_keeps_compression(mesh, p1field):
+    mesh.points_compression = "uint16"
+    p1field.values_compression = "float16"
+    coarse = p1field.decimate(2)
+    assert coarse.values_compression == "float16"
+    assert coarse.mesh.points_compression == "uint16"
+    # Cached coarse meshes follow later changes
+    mesh.cells_compression = "varint"
+    assert mesh.decimate(2).cells_compression == "varint"
+
+def test_mesh_extract(mesh, cell_indicators):
+    submesh = mesh.extract(cell_indicators, 20)
+    assert submesh.cells.tolist() == [[0, 1, 2, 3]]
+    assert submesh.points.tolist() == mesh.points[[0, 1, 2, 4]].tolist()
+    assert mesh.extract(cell_indicators, 20) is submesh
+    # Recomputed when indicators change
+    cell_indicators.values = np.asarray([20, 10], dtype="int32")
+    assert len(mesh.extract(cell_indicators, 20).points) == 4
+    assert mesh.extract(cell_indicators, 20) is not submesh
+
+def test_field_extract(p0field, p1field, d1field, face_indicators, cell_indicators):
+    assert p0field.extract(cell_indicators, 10).values.tolist() == [-3.0]
+    assert p1field.extract(cell_indicators, 20).values.tolist() == p1field.values[[0, 1, 2, 4]].tolist()
+    assert d1field.extract(cell_indicators, 20).values.tolist() == d1field.values[4:].tolist()
+    assert face_indicators.extract(cell_indicators, 10).values.tolist() == [0, 1, 2, 3]
+    assert p1field.extract(cell_indicators, 20).mesh is p0field.extract(cell_indicators, 20).mesh
+    with pytest.raises(ValueError):
+        p1field.extract(face_indicators, 3)
+
 def test_p0field(p0field):
     mesh = p0field.mesh
     nc = mesh.cells.shape[0]
@@ -18,6 +162,78 @@ def test_p1field(p1field):
     assert p1field.space == "P1"
     assert p1field.values.shape[0] == np
 
+def test_extract_keeps_compression(mesh, p1field, cell_indicators):
+    mesh.cells_compression = "varint"
+    p1field.values_compression = "uint8"
+    sub = p1field.extract(cell_indicators, 20)
+    assert sub.values_compression == "uint8"
+    assert sub.mesh.cells_compression == "varint"
+    # Cached submeshes follow later changes
+    mesh.points_compression = "uint16"
+    assert mesh.extract(cell_indicators, 20).points_compression == "uint16"
+
+def test_field_sample(p0field, p1field, d1field):
+    points = [[0.1, 0.2, 0.3], [-0.1, 0.2, 0.3], [1.0, 1.0, 1.0]]
+    values = p0field.sample(points)
+    assert values[:2].tolist() == [-3.0, 5.0]
+    assert np.isnan(values[2])
+    assert np.allclose(p1field.sample(points)[:2], [0.18, 0.63])
+    # D1 values follow the local vertex order of the oriented cells
+    assert np.allclose(d1field.sample(points[:1]), [0.21])
+
+def test_field_sample_line_and_plane(p1field):
+    points, values = p1field.sample_line([0, 0, 0], [0, 1, 0], 5)
+    assert points.shape == (5, 3)
+    assert np.allclose(values, np.linspace(0.1, 3.0, 5))
+
+    points, values = p1field.sample_plane([-1, 0, 0], [2, 0, 0], [0, 0, 1], 5, 3)
+    assert points.shape == (3, 5, 3)
+    assert values.shape == (3, 5)
+    assert np.allclose(points[2, 4], [1, 0, 1])
+    # Values are linear along the x axis on either side of the origin
+    assert np.allclose(values[0], [0.5, 0.3, 0.1, -1.95, -4.0])
+    assert np.isnan(values[2, [0, 1, 3, 4]]).all()
+
+def test_field_find_cells(p0field, p1field, d1field, mesh):
+    lower, upper = p1field.compute_cell_ranges()
+    assert np.allclose(lower, [-4.0, -0.2])
+    assert np.allclose(upper, [3.0, 3.0])
+    assert p1field.find_cells(-1.0).tolist() == [0]
+    assert p1field.find_cells([-1.0, 0.0]).tolist() == [0, 1]
+    assert p1field.find_cells(4.0).tolist() == []
+    assert p0field.find_cells(5.0).tolist() == [1]
+    assert d1field.find_cells([0.5, 0.9]).tolist() == []
+    assert d1field.find_cells(2.5).tolist() == [1]
+
+    # Ranges follow the values and the cells of the mesh
+    p1field.values = p1field.values + 10.0
+    assert p1field.find_cells(-1.0).tolist() == []
+    mesh.cells = mesh.cells[:1]
+    assert p1field.find_cells(13.0).tolist() == [0]
+
+def test_field_range(p1field):
+    assert ur.Field(mesh=p1field.mesh, values=np.full(5, np.nan, dtype="float32")).range == (0.0, 0.0)
+    assert p1field.range == (-4.0, 3.0)
+    p1field.values = p1field.values * 2
+    assert p1field.range == (-8.0, 6.0)
+    p1field.range_percentiles = (0.0, 50.0)
+    assert p1field.range == (-8.0, pytest.approx(0.2))
+
+def test_p1field_series(p1field_series):
+    mesh = p1field_series.mesh
+    np = mesh.points.shape[0]
+    assert p1field_series.shape == (3, np)
+    assert p1field_series.range == (-12.0, 9.0)
+
+def test_field_series_send_frames(p1field_series):
+    sent = []
+    p1field_series._send = lambda msg, buffers=None: sent.append((msg["content"], buffers))
+    p1field_series.chunk_size = 2
+    p1field_series.send_frames()
+    assert [content["start"] for content, buffers in sent] == [0, 2]
+    assert [content["count"] for content, buffers in sent] == [2, 1]
+    assert bytes(sent[1][1][0]) == p1field_series.values[2].tobytes()
+
 def test_d1field(d1field):
     mesh = d1field.mesh
     nc = mesh.cells.shape[0]
@@ -56,6 +272,16 @@ def test_scalar_field(scalar_field):
     assert scalar_field.field._model_name == "FieldModel"
     assert scalar_field.lut._model_name == "ArrayScalarMapModel"
 
+def test_lut_preintegrated(array_scalar_lut, array_color_lut):
+    assert array_scalar_lut.preintegrated.shape == (128, 128)
+    assert array_color_lut.preintegrated.shape == (128, 128, 3)
+    array_scalar_lut.preintegration_size = 16
+    assert array_scalar_lut.preintegrated.shape == (16, 16)
+    array_scalar_lut.values = np.ones(4, dtype="float32")
+    assert np.allclose(array_scalar_lut.preintegrated, 1.0)
+    array_scalar_lut.preintegration_size = 0
+    assert array_scalar_lut.preintegrated is None
+
 def test_scalar_indicators(scalar_indicators):
     assert scalar_indicators.field._model_name == "IndicatorFieldModel"
     assert scalar_indicators.lut._model_name == "ArrayScalarMapModel"
@@ -0,0 +1,184 @@
+import base64
+import gzip
+import struct
+import zlib
+import numpy as np
+import pytest
+import unray as ur
+from unray.io import (
+    read, read_npz, read_npy, read_raw, read_vtu, read_dolfin_xml,
+    read_unray, write_unray, load, load_mesh,
+)
+
+
+cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int64")
+points = np.asarray([
+    [0, 0, 0], [0, 0, 1], [0, 1, 0],
+    [1, 0, 0], [-1, 0, 0],
+    ], dtype="float64")
+pressure = np.asarray([0.1, -0.2, 3.0, -4.0, 0.5])
+material = np.asarray([7.0, 9.0])
+
+
+def check_mesh_data(data):
+    assert np.asarray(data["cells"]).tolist() == cells.tolist()
+    assert np.allclose(data["points"], points)
+    assert np.allclose(data["point_data"]["pressure"], pressure)
+    assert np.allclose(data["cell_data"]["material"], material)
+
+
+def test_read_npz_stored_is_memory_mapped(tmp_path):
+    filename = str(tmp_path / "mesh.npz")
+    np.savez(filename, cells=cells, points=points, pressure=pressure, material=material)
+    data = read_npz(filename)
+    check_mesh_data(data)
+    assert isinstance(data["cells"], np.memmap)
+    assert isinstance(data["points"], np.memmap)
+    assert not isinstance(read_npz(filename, mmap=False)["points"], np.memmap)
+
+
+def test_read_npz_compressed(tmp_path):
+    filename = str(tmp_path / "mesh.npz")
+    np.savez_compressed(filename, **{
+        "cells": cells, "points": points,
+        "point_data/pressure": pressure, "cell_data/material": material})
+    data = read(filename)
+    check_mesh_data(data)
+    assert not isinstance(data["points"], np.memmap)
+
+
+def test_read_npz_requires_mesh(tmp_path):
+    filename = str(tmp_path / "values.npz")
+    np.savez(filename, values=pressure)
+    with pytest.raises(ValueError):
+        read_npz(filename)
+
+
+def test_read_npy_and_raw(tmp_path):
+    filename = str(tmp_path / "points.npy")
+    np.save(filename, points)
+    assert isinstance(read_npy(filename), np.memmap)
+    assert np.allclose(read_npy(filename), points)
+
+    filename = str(tmp_path / "cells.bin")
+    cells.astype("int32").tofile(filename)
+    raw = read_raw(filename, "int32", shape=(-1, 4))
+    assert isinstance(raw, np.memmap)
+    assert raw.tolist() == cells.tolist()
+
+
+def _vtu_array(name, array, fmt, compressed, appended):
+    "Encode an array as a DataArray element, appending raw data to appended."
+    vtk_type = {"i": "Int", "u": "UInt", "f": "Float"}[array.dtype.kind] + str(8 * array.dtype.itemsize)
+    components = array.shape[1] if array.ndim > 1 else 1
+    attributes = 'type="%s" Name="%s" NumberOfComponents="%d" format="%s"' % (vtk_type, name, components, fmt)
+    raw = np.ascontiguousarray(array).tobytes()
+    if compressed:
+        block = zlib.compress(raw)
+        header = struct.pack("<4I", 1, len(raw), len(raw), len(block))
+    else:
+        block = raw
+        header = struct.pack("<I", len(raw))
+    if fmt == "ascii":
+        return "<DataArray %s>%s</DataArray>" % (attributes, " ".join(str(v) for v in array.ravel()))
+    if fmt == "binary":
+        if compressed:
+            text = base64.b64encode(header) + base64.b64encode(block)
+        else:
+            text = base64.b64encode(header + block)
+        return "<DataArray %s>\n%s\n</DataArray>" % (attributes, text.decode("ascii"))
+    offset = len(appended)
+    appended.extend(header + block)
+    return '<DataArray %s offset="%d"/>' % (attributes, offset)
+
+
+def write_vtu(filename, fmt, compressed=False, types=None):
+    appended = bytearray()
+    a = lambda *args: _vtu_array(*args, fmt=fmt, compressed=compressed, appended=appended)
+    types = np.full(len(cells), 10, dtype="uint8") if types is None else types
+    xml = """<?xml version="1.0"?>
+<VTKFile type="UnstructuredGrid" version="1.0" byte_order="LittleEndian" header_type="UInt32"%s>
+<UnstructuredGrid><Piece NumberOfPoints="%d" NumberOfCells="%d">
+<PointData>%s</PointData>
+<CellData>%s</CellData>
+<Points>%s</Points>
+<Cells>%s%s%s</Cells>
+</Piece></UnstructuredGrid>
+""" % (
+        ' compressor="vtkZLibDataCompressor"' if compressed else "",
+        len(points), len(cells),
+        a("pressure", pressure),
+        a("material", material),
+        a("Points", points),
+        a("connectivity", cells.ravel()),
+        a("offsets", 4 * np.arange(1, len(cells) + 1)),
+        a("types", types),
+    )
+    content = xml.encode("ascii")
+    if fmt == "appended":
+        content += b'<AppendedData encoding="raw">_' + bytes(appended) + b"</AppendedData>\n"
+    content += b"</VTKFile>\n"
+    with open(filename, "wb") as f:
+        f.write(content)
+
+
+@pytest.mark.parametrize("fmt", ["ascii", "binary", "appended"])
+@pytest.mark.parametrize("compressed", [False, True])
+def test_read_vtu(tmp_path, fmt, compressed):
+    filename = str(tmp_path / "mesh.vtu")
+    write_vtu(filename, fmt, compressed)
+    check_mesh_data(read_vtu(filename))
+
+
+def test_read_vtu_requires_tetrahedra(tmp_path):
+    filename = str(tmp_path / "mesh.vtu")
+    write_vtu(filename, "ascii", types=np.asarray([10, 12], dtype="uint8"))
+    with pytest.raises(ValueError):
+        read_vtu(filename)
+
+
+def test_read_dolfin_xml(tmp_path):
+    filename = str(tmp_path / "mesh.xml.gz")
+    vertices = "".join('<vertex index="%d" x="%g" y="%g" z="%g"/>' % ((i,) + tuple(p))
+        for i, p in enumerate(points))
+    tetrahedra = "".join('<tetrahedron index="%d" v0="%d" v1="%d" v2="%d" v3="%d"/>' % ((i,) + tuple(c))
+        for i, c in enumerate(cells))
+    with gzip.open(filename, "wb") as f:
+        f.write(('<dolfin><mesh celltype="tetrahedron" dim="3">'
+            '<vertices size="%d">%s</vertices><cells size="%d">%s</cells>'
+            '</mesh></dolfin>' % (len(points), vertices, len(cells), tetrahedra)).encode("ascii"))
+    data = read(filename)
+    assert data["cells"].tolist() == cells.tolist()
+    assert np.allclose(data["points"], points)
+
+
+def test_unray_roundtrip(tmp_path):
+    filename = str(tmp_path / "mesh.unray")
+    write_unray(filename, cells, points,
+        point_data={"pressure": pressure}, cell_data={"material": material},
+        chunk_size=1)
+    data = read_unray(filename)
+    check_mesh_data(data)
+    assert data["cells"].dtype == np.int32
+    assert data["points"].dtype == np.float32
+    assert isinstance(data["points"], np.memmap)
+    # Arrays are aligned for direct use as typed arrays
+    assert data["points"].offset % 64 == 0
+    check_mesh_data(read_unray(filename, mmap=False))
+
+
+def test_load(tmp_path):
+    filename = str(tmp_path / "mesh.unray")
+    write_unray(filename, cells, points,
+        point_data={"pressure": pressure}, cell_data={"material": material})
+    mesh, fields = load(filename)
+    assert isinstance(mesh, ur.Mesh)
+    assert fields["pressure"].space == "P1"
+    assert fields["material"].space == "P0"
+    assert fields["pressure"].mesh is mesh
+    assert load_mesh(filename).points.shape == points.shape
+
+
+def test_read_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        read(str(tmp_path / "mesh.stl"))
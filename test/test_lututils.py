@@ -0,0 +1,54 @@
+import numpy as np
+from unray.lututils import sample_lut, preintegrate_lut, isosurface_table
+
+
+def test_sample_lut_clamps_to_texel_centers():
+    values = np.asarray([0.0, 1.0])
+    assert sample_lut(values, [0.0, 0.25, 0.5, 0.75, 1.0]).tolist() == [0.0, 0.0, 0.5, 1.0, 1.0]
+
+
+def test_preintegrate_linear_lut():
+    # The mean of a linear function is its value at the midpoint
+    values = np.linspace(0.0, 1.0, 64)
+    table = preintegrate_lut(values, 16)
+    assert table.shape == (16, 16)
+    assert table.dtype == np.float32
+    f = (np.arange(16) + 0.5) / 16
+    expected = sample_lut(values, 0.5 * (f[:, None] + f[None, :]))
+    assert np.allclose(table, expected, atol=1e-4)
+    assert np.allclose(table, table.T)
+
+
+def test_preintegrate_step_lut():
+    # Half of a segment across a step is in each half
+    values = np.asarray([0.0] * 32 + [1.0] * 32)
+    table = preintegrate_lut(values, 64)
+    assert np.isclose(table[60, 3], 0.5, atol=0.02)
+    assert table[0, 0] == 0.0
+    assert table[63, 63] == 1.0
+
+
+def test_preintegrate_color_lut(array_color_lut):
+    table = preintegrate_lut(array_color_lut.values, 8)
+    assert table.shape == (8, 8, 3)
+    assert np.allclose(table[..., 0], table[..., 2])
+
+
+def test_isosurface_table_first_isovalue():
+    table = isosurface_table([2.5, 5.5, 8.5], (0.0, 10.0), size=10)
+    value = table[..., 3]
+    # From front value 0.05 towards back values 0.95 and 0.35
+    assert np.isclose(value[9, 0], 0.25)
+    assert np.isclose(value[3, 0], 0.25)
+    # From front value 0.95 towards back value 0.05
+    assert np.isclose(value[0, 9], 0.85)
+    # No isovalue between 0.3 and 0.45
+    assert value[4, 3] == -1.0
+    assert not table[..., :3].any()
+
+
+def test_isosurface_table_colors():
+    lut = np.asarray([[0.0, 0.0, 1.0], [1.0, 0.0, 0.0]])
+    table = isosurface_table([0.25, 0.75], (0.0, 1.0), lut=lut, size=8)
+    found = table[..., 3] >= 0
+    assert np.allclose(table[found, :3], np.asarray(sample_lut(lut, table[found, 3])))
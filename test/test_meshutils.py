@@ -0,0 +1,276 @@
+import warnings
+import numpy as np
+from unray.meshutils import (
+    compute_tetrahedron_cell_orientations,
+    reorient_tetrahedron_cells,
+    oriented_tetrahedron_cells,
+    compute_cell_neighbors,
+    compute_boundary_cells,
+    compute_range,
+    as_array,
+    content_hash,
+    decimate_tetrahedra,
+    decimate_values,
+    extract_cells,
+    extract_values,
+    build_cell_tree,
+    tetrahedron_barycentric_coordinates,
+    locate_points,
+    interpolate_values,
+    compute_cell_ranges,
+    build_interval_index,
+    query_interval_index,
+    slice_tetrahedra,
+)
+
+def test_tetrahedron_cell_orientations(mesh):
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    reorient = compute_tetrahedron_cell_orientations(cells, mesh.points)
+    assert list(reorient) == [True, False]
+
+def test_reorient_tetrahedron_cells(mesh):
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    reorient_tetrahedron_cells(cells, np.asarray([True, True]))
+    assert cells.tolist() == [[0, 1, 3, 2], [0, 1, 4, 2]]
+
+def test_oriented_tetrahedron_cells(mesh):
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    oriented = oriented_tetrahedron_cells(cells, mesh.points)
+    assert oriented.tolist() == [[0, 1, 3, 2], [0, 1, 2, 4]]
+    assert not compute_tetrahedron_cell_orientations(oriented, mesh.points).any()
+    # Input is not modified, and already oriented cells are returned as is
+    assert cells.tolist() == [[0, 1, 2, 3], [0, 1, 2, 4]]
+    assert oriented_tetrahedron_cells(oriented, mesh.points) is oriented
+
+def test_compute_cell_neighbors():
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    neighbors = compute_cell_neighbors(cells)
+    assert neighbors.dtype == np.int32
+    assert neighbors.tolist() == [[-1, -1, -1, 1], [-1, -1, -1, 0]]
+    # Neighbors are found regardless of vertex ordering within cells
+    cells = np.asarray([[0, 1, 3, 2], [4, 2, 1, 0]], dtype="int32")
+    assert compute_cell_neighbors(cells).tolist() == [[-1, -1, 1, -1], [0, -1, -1, -1]]
+
+def cube_cells(n):
+    "Split an n^3 grid of cubes into 6 tetrahedra each."
+    index = np.arange((n + 1)**3).reshape(n + 1, n + 1, n + 1)
+    corners = [index[i:n + i, j:n + j, k:n + k].ravel()
+        for i in (0, 1) for j in (0, 1) for k in (0, 1)]
+    paths = [(1, 3), (1, 5), (2, 3), (2, 6), (4, 5), (4, 6)]
+    return np.vstack([np.stack([corners[0], corners[a], corners[b], corners[7]], axis=1)
+        for a, b in paths]).astype(np.int32)
+
+def test_compute_cell_neighbors_grid():
+    cells = cube_cells(3)
+    neighbors = compute_cell_neighbors(cells)
+    # Every interior face is shared by exactly two cells
+    assert (neighbors < 0).sum() == 6 * 3**2 * 2
+    i, j = np.nonzero(neighbors >= 0)
+    assert np.all(np.any(neighbors[neighbors[i, j]] == i[:, None], axis=1))
+
+def test_compute_boundary_cells():
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4]], dtype="int32")
+    assert compute_boundary_cells(cells).tolist() == [0, 1]
+
+    # Only cells touching the surface of the cube are boundary cells
+    cells = cube_cells(4)
+    boundary = compute_boundary_cells(cells)
+    assert boundary.dtype == np.int32
+    neighbors = compute_cell_neighbors(cells)
+    assert np.all((neighbors[boundary] < 0).any(axis=1))
+    assert (neighbors[boundary] < 0).sum() == (neighbors < 0).sum() == 6 * 4**2 * 2
+
+    # Faces between different indicator values are included as well
+    indicators = np.zeros(len(cells), dtype=np.int32)
+    indicators[:64] = 1
+    region = compute_boundary_cells(cells, indicators, neighbors)
+    assert set(region) > set(boundary) | set(range(64))
+    assert len(region) < len(cells)
+    same = compute_boundary_cells(cells, np.zeros(len(cells), dtype=np.int32))
+    assert same.tolist() == boundary.tolist()
+
+def test_compute_range():
+    values = np.asarray([3.0, -1.0, np.nan, 2.0], dtype="float32")
+    assert compute_range(values) == (-1.0, 3.0)
+    assert compute_range(values, (50.0, 100.0)) == (2.0, 3.0)
+    assert compute_range(np.zeros(0, dtype="float32")) == (0.0, 0.0)
+    # No finite values, without warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert compute_range(np.full(3, np.nan, dtype="float32")) == (0.0, 0.0)
+        assert compute_range(np.full(3, np.nan, dtype="float32"), (1.0, 99.0)) == (0.0, 0.0)
+        assert compute_range(np.asarray([np.inf, np.nan])) == (0.0, 0.0)
+
+def test_as_array_shares_memory(tmp_path):
+    values = np.arange(12, dtype="float32").reshape((4, 3))
+    values.flags.writeable = False
+    assert np.shares_memory(as_array(values, np.float32), values)
+    mapped = np.memmap(str(tmp_path / "values.bin"), dtype="float32", mode="w+", shape=(4, 3))
+    assert np.shares_memory(as_array(mapped, np.float32), mapped)
+    assert np.shares_memory(as_array(memoryview(values), np.float32), values)
+
+def test_as_array_casts_in_chunks():
+    values = np.arange(10, dtype="float64").reshape((5, 2))
+    result = as_array(values, np.float32, chunk_rows=2)
+    assert result.dtype == np.float32
+    assert result.tolist() == values.tolist()
+    assert as_array([1, 2], np.int32).dtype == np.int32
+
+def test_content_hash():
+    a = np.arange(12, dtype=np.float32).reshape(4, 3)
+    assert content_hash(a) == content_hash(a.copy())
+    assert content_hash(a) == content_hash(np.asfortranarray(a), chunk_rows=3)
+    assert content_hash(a) != content_hash(a.reshape(3, 4))
+    assert content_hash(a) != content_hash(a.astype(np.int32).view(np.float32))
+    assert content_hash(a) != content_hash(a, salt="float16")
+
+def test_chunked_orientations(mesh):
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4], [0, 1, 3, 2]], dtype="int32")
+    reorient = compute_tetrahedron_cell_orientations(cells, mesh.points, chunk_rows=2)
+    assert list(reorient) == [True, False, False]
+
+def test_decimate_tetrahedra():
+    # Unit cube split into 6*n^3 tetrahedra
+    n = 6
+    m = n + 1
+    points = np.stack(np.meshgrid(*[np.linspace(0, 1, m)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+    index = np.arange(m**3).reshape((m, m, m))
+    corners = np.stack([index[i:m-1+i, j:m-1+j, k:m-1+k].ravel()
+        for i in (0, 1) for j in (0, 1) for k in (0, 1)], axis=1)
+    tets = [[0, 1, 3, 7], [0, 1, 5, 7], [0, 2, 3, 7], [0, 2, 6, 7], [0, 4, 5, 7], [0, 4, 6, 7]]
+    cells = corners[:, tets].reshape(-1, 4).astype("int32")
+
+    coarse_cells, coarse_points, vertex_map, cell_map = decimate_tetrahedra(cells, points, 300)
+    assert 0 < len(coarse_cells) <= 300
+    assert coarse_cells.max() == len(coarse_points) - 1
+    assert vertex_map.shape == (len(points),)
+    assert cell_map.shape == (len(cells),)
+    assert cell_map.max() == len(coarse_cells) - 1
+    # Coarse cells are nondegenerate
+    assert all(len(set(c)) == 4 for c in coarse_cells.tolist())
+
+    # Linear functions are reproduced at cluster means
+    values = decimate_values(points[:, 0], "P1", cells, coarse_cells, vertex_map, cell_map)
+    assert np.allclose(values, coarse_points[:, 0])
+    values = decimate_values(np.ones(len(cells)), "P0", cells, coarse_cells, vertex_map, cell_map)
+    assert np.allclose(values, 1.0)
+    values = decimate_values(np.ones(4 * len(cells)), "D1", cells, coarse_cells, vertex_map, cell_map)
+    assert values.shape == (4 * len(coarse_cells),)
+
+    # Small meshes are returned as is
+    assert decimate_tetrahedra(cells, points, len(cells))[0] is cells
+
+def test_extract_cells():
+    cells = np.asarray([[0, 1, 2, 3], [0, 1, 2, 4], [4, 5, 6, 7]], dtype="int32")
+    sub_cells, vertex_indices, cell_indices = extract_cells(cells, [False, True, True])
+    assert cell_indices.tolist() == [1, 2]
+    assert vertex_indices.tolist() == [0, 1, 2, 4, 5, 6, 7]
+    assert vertex_indices[sub_cells].tolist() == cells[1:].tolist()
+
+    values = np.arange(12.0)
+    assert extract_values(values[:8], "P1", vertex_indices, cell_indices).tolist() == [0, 1, 2, 4, 5, 6, 7]
+    assert extract_values(values[:3], "P0", vertex_indices, cell_indices).tolist() == [1, 2]
+    assert extract_values(values, "D1", vertex_indices, cell_indices).tolist() == list(range(4, 12))
+
+def test_build_cell_tree():
+    n = 3
+    cells = cube_cells(n)
+    points = np.stack(np.meshgrid(*[np.arange(n + 1.0)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+    order, levels = build_cell_tree(cells, points, leaf_size=4)
+    # 162 cells in 41 leaves padded to 64
+    assert len(levels) == 7
+    assert [len(lower) for lower, upper in levels] == [2**i for i in range(7)]
+    assert sorted(order[order >= 0].tolist()) == list(range(len(cells)))
+    lower, upper = levels[0]
+    assert lower.tolist() == [[0, 0, 0]]
+    assert upper.tolist() == [[n, n, n]]
+    # Children are contained in their parents
+    for (lower, upper), (child_lower, child_upper) in zip(levels[:-1], levels[1:]):
+        assert (np.repeat(lower, 2, axis=0) <= child_lower).all()
+        assert (np.repeat(upper, 2, axis=0) >= child_upper).all()
+
+def test_tetrahedron_barycentric_coordinates():
+    vertices = np.asarray([[[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]]], dtype=float)
+    lam = tetrahedron_barycentric_coordinates(vertices, np.asarray([[0.1, 0.2, 0.3]]))
+    assert np.allclose(lam, [[0.4, 0.1, 0.2, 0.3]])
+
+def test_locate_points():
+    n = 4
+    cells = cube_cells(n)
+    points = np.stack(np.meshgrid(*[np.linspace(0, 1, n + 1)] * 3, indexing="ij"), axis=-1).reshape(-1, 3)
+    tree = build_cell_tree(cells, points)
+    rng = np.random.RandomState(0)
+    queries = rng.uniform(-0.2, 1.2, size=(2000, 3))
+    found, lam = locate_points(tree, cells, points, queries, chunk_rows=300)
+
+    outside = ((queries < 0) | (queries > 1)).any(axis=1)
+    assert (found[outside] == -1).all()
+    assert (lam[outside] == 0).all()
+    assert (found[~outside] >= 0).all()
+
+    # Barycentric coordinates reproduce the queries
+    inside = found >= 0
+    assert np.allclose(lam[inside].sum(axis=1), 1.0)
+    assert (lam[inside] >= -1e-10).all()
+    assert np.allclose(np.einsum("ij,ijk->ik", lam[inside], points[cells[found[inside]]]), queries[inside])
+
+    # Vertices are found in one of their cells
+    found, lam = locate_points(tree, cells, points, points)
+    assert (found >= 0).all()
+    assert np.allclose(lam.max(axis=1), 1.0)
+
+def test_interpolate_values():
+    cells = np.asarray([[0, 1, 2, 3], [1, 2, 3, 4]], dtype="int32")
+    found = np.asarray([1, -1, 0])
+    lam = np.asarray([[0.25, 0.25, 0.25, 0.25], [0, 0, 0, 0], [1, 0, 0, 0]])
+    values = interpolate_values([1.0, 2.0], "P0", cells, found, lam)
+    assert values[[0, 2]].tolist() == [2.0, 1.0]
+    assert np.isnan(values[1])
+    values = interpolate_values([0.0, 1.0, 2.0, 3.0, 4.0], "P1", cells, found, lam)
+    assert values[[0, 2]].tolist() == [2.5, 0.0]
+    values = interpolate_values(np.arange(8.0), "D1", cells, found, lam)
+    assert values[[0, 2]].tolist() == [5.5, 0.0]
+
+def test_compute_cell_ranges():
+    cells = np.asarray([[0, 1, 2, 3], [1, 2, 3, 4]], dtype="int32")
+    lower, upper = compute_cell_ranges([3.0, 1.0, 2.0, 0.5, 4.0], "P1", cells, chunk_rows=1)
+    assert lower.tolist() == [0.5, 0.5]
+    assert upper.tolist() == [3.0, 4.0]
+    lower, upper = compute_cell_ranges(np.arange(8.0), "D1", cells)
+    assert lower.tolist() == [0.0, 4.0]
+    assert upper.tolist() == [3.0, 7.0]
+    lower, upper = compute_cell_ranges([1.0, 2.0], "P0", cells)
+    assert lower.tolist() == upper.tolist() == [1.0, 2.0]
+
+def test_interval_index():
+    rng = np.random.RandomState(0)
+    lower = rng.rand(500)
+    # Lengths over several orders of magnitude, including empty intervals
+    upper = lower + rng.rand(500)**6
+    upper[:10] = lower[:10]
+    index = build_interval_index(lower, upper)
+    for values in [0.3, [0.1, 0.9], lower[:3], [-1.0, 5.0]]:
+        values = np.atleast_1d(values)
+        expected = np.flatnonzero(((lower[:, None] <= values) & (upper[:, None] >= values)).any(axis=1))
+        found = query_interval_index(index, values)
+        assert found.dtype == np.int32
+        assert found.tolist() == expected.tolist()
+    assert query_interval_index(build_interval_index([], []), 0.0).tolist() == []
+
+def test_slice_tetrahedra():
+    n = 2
+    cells = cube_cells(n)
+    x = np.arange(n + 1, dtype=np.float64)
+    points = np.stack(np.meshgrid(x, x, x, indexing="ij"), axis=-1).reshape(-1, 3)
+    for z in [0.7, 1.0]:
+        distances = points[cells, 2] - z
+        triangle_cells, coordinates = slice_tetrahedra(distances)
+        triangles = np.einsum("tvk,tkx->tvx", coordinates, points[cells[triangle_cells]])
+        # Triangles lie in the plane and cover the cross section of the grid
+        assert np.allclose(coordinates.sum(axis=2), 1.0)
+        assert np.allclose(triangles[..., 2], z)
+        areas = 0.5 * np.abs(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])[:, 2])
+        assert np.isclose(areas.sum(), n * n)
+        assert (np.diff(triangle_cells) >= 0).all()
+    # Cells not crossing the plane give no triangles
+    assert len(slice_tetrahedra(points[cells, 2] + 1.0)[0]) == 0
@@ -1,4 +1,9 @@
+import pytest
+import numpy as np
 import unray as ur
+import traitlets
+
+from test_meshutils import cube_cells
 
 # TODO: Add case with restrict to all tests here
 
@@ -62,3 +67,254 @@ def test_volume_plot(mesh, color_field, color_constant, scalar_field, scalar_con
 
     p = ur.VolumePlot(mesh=mesh, color=color_field, density=scalar_constant)
     assert p._model_name == "VolumePlotModel"
+
+def test_volume_plot_ordering(mesh, color_constant, scalar_constant):
+    p = ur.VolumePlot(mesh=mesh, color=color_constant, density=scalar_constant)
+    assert p.ordering == "depth"
+    assert mesh.neighbors is None
+
+    p.ordering = "topological"
+    assert mesh.neighbors is not None
+
+def test_volume_plot_field_series(mesh, p1field_series, array_scalar_lut, color_constant):
+    density = ur.ScalarField(field=p1field_series, lut=array_scalar_lut)
+    p = ur.VolumePlot(mesh=mesh, color=color_constant, density=density)
+    assert p._model_name == "VolumePlotModel"
+
+def test_plot_decimate(mesh, color_field, scalar_constant):
+    p = ur.VolumePlot(mesh=mesh, color=color_field, density=scalar_constant, extinction=0.5)
+    q = p.decimate(2)
+    assert isinstance(q, ur.VolumePlot)
+    assert q.mesh is mesh.decimate(2)
+    assert q.color.field.mesh is q.mesh
+    assert q.color.lut is color_field.lut
+    assert q.density is scalar_constant
+    assert q.extinction == 0.5
+
+def test_plot_compact(mesh, color_field, scalar_indicators):
+    p = ur.SurfacePlot(mesh=mesh, color=color_field)
+    assert p.compact() is p
+
+    p = ur.SurfacePlot(mesh=mesh, color=color_field, restrict=scalar_indicators)
+    q = p.compact()
+    assert q.restrict is None
+    assert len(q.mesh.cells) == 0
+    scalar_indicators.value = 20
+    q = p.compact()
+    assert q.mesh is mesh.extract(scalar_indicators.field, 20)
+    assert q.color.field.mesh is q.mesh
+    assert len(q.color.field.values) == 4
+
+def test_isosurface_plot_table(mesh, p1field, color_field, color_constant):
+    params = ur.IsovalueParams(mode="list", values=[0.5, 1.5])
+    p = ur.IsosurfacePlot(mesh=mesh, color=color_field, values=params, isosurface_table_size=16)
+    assert p.isosurface_table.shape == (16, 16, 4)
+    lo, hi = p1field.range
+    found = np.unique(p.isosurface_table[..., 3])
+    expected = sorted((v - lo) / (hi - lo) for v in params.values if lo <= v <= hi)
+    assert np.allclose(found[found >= 0], expected)
+    # Colors are precomposed with the lut of the color
+    assert p.isosurface_table[..., :3].any()
+
+    # Table follows isovalues, lut and mode
+    params.values = []
+    assert (p.isosurface_table[..., 3] == -1).all()
+    p.color = color_constant
+    assert p.isosurface_table is None
+    p.field = p1field
+    assert not p.isosurface_table[..., :3].any()
+    # Colors are only precomposed for isovalues of the color field
+    params.values = [0.5]
+    p.color = color_field
+    assert p.isosurface_table[..., :3].any()
+    p.field = ur.Field(mesh=mesh, values=p1field.values, space="P1")
+    assert not p.isosurface_table[..., :3].any()
+    params.mode = "single"
+    assert p.isosurface_table is None
+
+    # Table size is kept by previews
+    params.mode = "list"
+    q = p.decimate(2)
+    assert q.isosurface_table_size == 16
+    assert q.isosurface_table.shape == (16, 16, 4)
+
+def test_surface_plot_boundary_follows_indicators():
+    n = 4
+    x = np.arange(n + 1, dtype="float32")
+    points = np.stack(np.meshgrid(x, x, x, indexing="ij"), axis=-1).reshape(-1, 3)
+    mesh = ur.Mesh(cells=cube_cells(n), points=points)
+    indicators = ur.IndicatorField(mesh=mesh, values=np.zeros(len(mesh.cells), dtype="int32"), space="I3")
+    restrict = ur.ScalarIndicators(field=indicators, value=0)
+    p = ur.SurfacePlot(mesh=mesh, color=ur.ColorConstant(), restrict=restrict)
+    exterior = p.boundary_cells.tolist()
+    assert exterior == mesh.compute_boundary_cells().tolist()
+
+    # Changing the indicators after construction adds the region boundaries
+    values = np.zeros(len(mesh.cells), dtype="int32")
+    values[:64] = 1
+    indicators.values = values
+    assert p.boundary_cells.tolist() == mesh.compute_boundary_cells(indicators).tolist()
+    assert len(p.boundary_cells) > len(exterior)
+    restrict.value = 1
+    assert p.boundary_cells.tolist() == mesh.compute_boundary_cells(indicators).tolist()
+    restrict.field = ur.IndicatorField(mesh=mesh, values=np.zeros(len(mesh.cells), dtype="int32"), space="I3")
+    restrict.value = 0
+    assert p.boundary_cells.tolist() == exterior
+
+    # Options that are not synced are kept by previews
+    p.boundary_only = False
+    assert p.decimate(200).boundary_only is False
+    assert p.compact().boundary_only is False
+
+def test_surface_plot_boundary_cells(mesh, color_field, scalar_indicators, face_indicators):
+    p = ur.SurfacePlot(mesh=mesh, color=color_field, restrict=scalar_indicators)
+    assert p.boundary_cells.tolist() == mesh.compute_boundary_cells(scalar_indicators.field).tolist()
+    p.boundary_only = False
+    assert p.boundary_cells is None
+
+    # Facet restrictions draw all cells
+    restrict = ur.ScalarIndicators(field=face_indicators)
+    p = ur.SurfacePlot(mesh=mesh, color=color_field, restrict=restrict)
+    assert p.boundary_cells is None
+
+    p = ur.SurfacePlot(mesh=mesh, color=color_field)
+    assert p.boundary_cells.tolist() == [0, 1]
+    # Boundary is updated along with the mesh cells
+    mesh.cells = mesh.cells[:1]
+    assert p.boundary_cells.tolist() == [0]
+
+def test_slice_plot(mesh, color_field, color_constant, scalar_indicators):
+    p = ur.SlicePlot(mesh=mesh, color=color_field, normal=(2, 0, 0), offset=0.5)
+    assert p.plane_distances.tolist() == [0, 0, 0, 1, -1]
+    assert p.slice_cells.tolist() == [0]
+
+    # Moving the plane looks up the cells crossing it
+    p.offset = -0.5
+    assert p.slice_cells.tolist() == [1]
+    p.offset = 0.0
+    assert p.slice_cells.tolist() == [0, 1]
+    p.offset = 2.0
+    assert p.slice_cells.tolist() == []
+    p.offset = -0.25
+    p.restrict = scalar_indicators
+    assert p.slice_cells.tolist() == []
+    # Slice cells follow the indicators after the plot is built
+    scalar_indicators.value = 20
+    assert p.slice_cells.tolist() == [1]
+    indicators = scalar_indicators.field
+    indicators.values = indicators.values[::-1]
+    assert p.slice_cells.tolist() == []
+    scalar_indicators.field = ur.IndicatorField(mesh=mesh, values=np.asarray([10, 20], dtype="int32"), space="I3")
+    assert p.slice_cells.tolist() == [1]
+
+    # The plane is kept by previews
+    q = p.decimate(2)
+    assert q.normal == (2, 0, 0)
+    assert q.slice_cells.tolist() == [1]
+    assert p.compact().normal == (2, 0, 0)
+
+    # Cross section in the plane, colored by the field
+    triangles, values = p.cross_section()
+    assert triangles.shape == (1, 3, 3)
+    assert np.allclose(triangles[..., 0], -0.25)
+    assert np.allclose(values, color_field.field.sample(triangles.reshape(-1, 3)).reshape(-1, 3), atol=1e-6)
+
+    # Plane follows normal and mesh points
+    p.restrict = None
+    p.normal = (0, 0, 1)
+    p.offset = 0.5
+    assert p.slice_cells.tolist() == [0, 1]
+    mesh.points = mesh.points + [0, 0, 1]
+    assert p.slice_cells.tolist() == []
+
+    p = ur.SlicePlot(mesh=mesh, color=color_constant)
+    assert p.cross_section()[1] is None
+
+    # Planes need a direction
+    with pytest.raises(traitlets.TraitError):
+        p.normal = (0, 0, 0)
+    assert p.normal == (0.0, 0.0, 1.0)
+
+    # Offset slider without vertices to take its range from
+    empty = ur.Mesh(cells=np.zeros((0, 4), dtype="int32"), points=np.zeros((0, 3), dtype="float32"))
+    p = ur.SlicePlot(mesh=empty, color=color_constant, offset=2.0)
+    assert p.slice_cells.tolist() == []
+    for distances in [p.plane_distances, None]:
+        p.set_trait("plane_distances", distances)
+        slider = p.dashboard().children[-1]
+        assert (slider.min, slider.value, slider.max) == (1.0, 2.0, 3.0)
+
+def test_isosurface_plot_active_cells(mesh, p1field, color_field, color_constant, scalar_indicators):
+    params = ur.IsovalueParams(mode="single", value=-1.0)
+    p = ur.IsosurfacePlot(mesh=mesh, color=color_field, values=params)
+    assert p.active_cells.tolist() == [0]
+
+    # Moving the isovalue looks up the cells again
+    params.value = 0.0
+    assert p.active_cells.tolist() == [0, 1]
+    params.mode = "list"
+    params.values = [-1.0, 5.0]
+    assert p.active_cells.tolist() == [0]
+    params.values = []
+    assert p.active_cells.tolist() == []
+    params.mode = "linear"
+    assert p.active_cells is None
+
+    # Restricted to the selected cells, following the indicators
+    params.mode = "single"
+    p.restrict = scalar_indicators
+    assert p.active_cells.tolist() == []
+    scalar_indicators.value = 20
+    assert p.active_cells.tolist() == [1]
+    scalar_indicators.field.values = scalar_indicators.field.values[::-1]
+    assert p.active_cells.tolist() == [0]
+    scalar_indicators.field = ur.IndicatorField(mesh=mesh, values=np.asarray([20, 20], dtype="int32"), space="I3")
+    assert p.active_cells.tolist() == [0, 1]
+    p.restrict = None
+
+    # Isovalues are of the field if given, and follow its values
+    field = ur.Field(mesh=mesh, values=p1field.values, space="P1")
+    p.field = field
+    p.color = color_constant
+    assert p.active_cells.tolist() == [0, 1]
+    field.values = field.values - 5.0
+    assert p.active_cells.tolist() == []
+    p.field = None
+    assert p.active_cells is None
+
+def test_isosurface_plot_isosurfaces(mesh, p0field, p1field, color_field, color_constant):
+    params = ur.IsovalueParams(mode="single", value=-1.0)
+    p = ur.IsosurfacePlot(mesh=mesh, color=color_field, values=params)
+    triangles, values = p.isosurfaces()
+    assert triangles.shape == (1, 3, 3)
+    # Colored by the field, which takes the isovalue on its isosurface
+    assert np.allclose(values, -1.0)
+    assert np.allclose(p1field.sample(triangles.reshape(-1, 3)), -1.0, atol=1e-6)
+
+    # Isosurfaces of all isovalues together
+    params.mode = "list"
+    params.values = [-1.0, 0.0, 5.0]
+    triangles, values = p.isosurfaces()
+    assert sorted(set(np.round(values.ravel(), 6))) == [-1.0, 0.0]
+    # Levels spaced within the range (-4, 3) of the field
+    params.mode = "linear"
+    params.value = 0.5
+    params.spacing = 2.0
+    assert sorted(set(np.round(p.isosurfaces()[1].ravel(), 6))) == [-3.5, -1.5, 0.5, 2.5]
+    params.mode = "log"
+    params.value = 1.0
+    assert sorted(set(np.round(p.isosurfaces()[1].ravel(), 6))) == [0.125, 0.25, 0.5, 1.0, 2.0]
+
+    # Constant colors have no values
+    p.field = p1field
+    p.color = color_constant
+    triangles, values = p.isosurfaces()
+    assert len(triangles) > 0 and values is None
+
+    params.mode = "sweep"
+    with pytest.raises(NotImplementedError):
+        p.isosurfaces()
+    params.mode = "single"
+    p.field = p0field
+    with pytest.raises(NotImplementedError):
+        p.isosurfaces()
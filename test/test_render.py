@@ -0,0 +1,114 @@
+import struct
+import zlib
+import numpy as np
+import pytest
+import unray as ur
+from unray.render import (
+    parse_color, Camera, rasterize, render, render_batch, encode_png,
+)
+
+
+def decode_png(data):
+    "Decode PNG files written by encode_png."
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    width, height, _, color_type = struct.unpack(">IIBB", data[16:26])
+    channels = {2: 3, 6: 4}[color_type]
+    length, = struct.unpack(">I", data[33:37])
+    raw = np.frombuffer(zlib.decompress(data[41:41 + length]), dtype=np.uint8)
+    return raw.reshape(height, 1 + width * channels)[:, 1:].reshape(height, width, channels)
+
+
+def test_parse_color():
+    assert parse_color("#ff0000").tolist() == [1.0, 0.0, 0.0]
+    assert parse_color("#0f0").tolist() == [0.0, 1.0, 0.0]
+    assert parse_color("rgb(0, 0, 255)").tolist() == [0.0, 0.0, 1.0]
+    assert np.allclose(parse_color("hsl(120, 100%, 50%)"), [0.0, 1.0, 0.0])
+    assert parse_color("white").tolist() == [1.0, 1.0, 1.0]
+    with pytest.raises(ValueError):
+        parse_color("nocolor")
+
+
+def test_camera_projects_target_to_center():
+    camera = Camera(position=(0, 0, 5), target=(0, 0, 0), up=(0, 1, 0))
+    xy, depth = camera.project([[0, 0, 0], [0, 1, 0]], 200, 100)
+    assert np.allclose(xy[0], [100, 50])
+    assert xy[1, 1] < 50
+    assert np.allclose(depth, 5)
+
+
+def test_rasterize_closest_triangle():
+    xy = np.asarray([[[0, 0], [8, 0], [0, 8]], [[0, 0], [8, 0], [0, 8]]], dtype=float)
+    depth = np.asarray([[2, 2, 2], [1, 1, 1]], dtype=float)
+    triangles, weights, depths = rasterize(xy, depth, 8, 8, chunk_size=16)
+    assert triangles[0, 0] == 1
+    assert triangles[7, 7] == -1
+    assert np.allclose(weights[triangles >= 0].sum(axis=1), 1.0)
+    assert np.allclose(depths[triangles >= 0], 1.0)
+
+
+def test_render_surface_plot(mesh, color_field, color_constant):
+    camera = Camera(direction=(0.2, 1.0, 0.3))
+    image = render(ur.SurfacePlot(mesh=mesh, color=color_field), camera, width=64, height=48)
+    assert image.shape == (48, 64, 4)
+    assert image.dtype == np.uint8
+    covered = image[..., 3] == 255
+    assert 0 < covered.sum() < covered.size
+    assert (image[~covered] == 0).all()
+
+    image = render(ur.SurfacePlot(mesh=mesh, color=color_constant), camera,
+        width=64, height=48, background="#ff0000")
+    assert (image[..., 3] == 255).all()
+    assert (image[~covered, :3] == [255, 0, 0]).all()
+
+
+def test_render_slice_plot(mesh, color_field):
+    camera = Camera(direction=(1.0, 0.2, 0.3))
+    plot = ur.SlicePlot(mesh=mesh, color=color_field, normal=(1, 0, 0), offset=0.25)
+    image = render(plot, camera, width=32, height=32)
+    covered = image[..., 3] == 255
+    assert 0 < covered.sum() < covered.size
+    plot.offset = 2.0
+    assert (render(plot, camera, width=32, height=32) == 0).all()
+
+
+def test_render_isosurface_plot(mesh, color_field):
+    camera = Camera(direction=(1.0, 0.2, 0.3))
+    params = ur.IsovalueParams(mode="single", value=0.0)
+    plot = ur.IsosurfacePlot(mesh=mesh, color=color_field, values=params)
+    image = render(plot, camera, width=32, height=32)
+    covered = image[..., 3] == 255
+    assert 0 < covered.sum() < covered.size
+    params.value = 5.0
+    assert (render(plot, camera, width=32, height=32) == 0).all()
+
+
+def test_render_unsupported(mesh, color_field, isovalue_params):
+    # Isovalues changing with time in the browser
+    isovalue_params.mode = "sweep"
+    plot = ur.IsosurfacePlot(mesh=mesh, color=color_field, values=isovalue_params)
+    with pytest.raises(NotImplementedError):
+        render(plot)
+    # Rejected while preparing, before any workers start
+    with pytest.raises(NotImplementedError):
+        render_batch([plot], processes=2)
+
+
+def test_render_batch(tmp_path, mesh, p1field_series, array_color_lut):
+    # One plot per timestep
+    plots = []
+    for values in p1field_series.values:
+        field = ur.Field(mesh=mesh, values=values, space="P1")
+        plots.append(ur.SurfacePlot(mesh=mesh, color=ur.ColorField(field=field, lut=array_color_lut)))
+    images = render_batch(plots, processes=2, width=32, height=32)
+    assert len(images) == len(plots)
+    assert (images[1] == render(plots[1], width=32, height=32)).all()
+
+    filenames = [str(tmp_path / ("frame%d.png" % i)) for i in range(len(plots))]
+    assert render_batch(plots, filenames, processes=1, width=32, height=32) == filenames
+    with open(filenames[1], "rb") as f:
+        assert (decode_png(f.read()) == images[1]).all()
+
+
+def test_encode_png_rgb():
+    image = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    assert (decode_png(encode_png(image)) == image).all()
@@ -0,0 +1,189 @@
+"""Compact encodings of mesh and field arrays for transfer to the frontend.
+
+Each encoding has a vectorized encoder here and a matching decoder
+in js/src/compression.ts. Encoded arrays are serialized as
+
+    {'compression': name, 'shape': shape, 'dtype': dtype, 'buffer': memoryview, ...}
+
+where dtype is the dtype of the decoded array, and any extra
+entries are parameters needed for decoding.
+
+The "padded" encoding is not compact, it sends float32 arrays padded
+with zeros to the size of the texture the frontend stores them in,
+such that the received buffer is used as texture data without copying.
+
+The decoders here are mainly for testing, the frontend never
+sends encoded arrays back.
+"""
+
+import numpy as np
+from ipywidgets import Widget
+from ipydatawidgets import data_union_serialization
+
+
+# Available encodings for integer cell arrays
+cells_compressions = ["none", "varint"]
+
+# Available encodings for coordinate arrays
+points_compressions = ["none", "uint16", "padded"]
+
+# Available encodings for field value arrays
+values_compressions = ["none", "float16", "uint16", "uint8", "padded"]
+
+# Largest value in a quantized integer type
+_quantized_max = {"uint8": 255, "uint16": 65535}
+
+
+def encode_varint(values):
+    """Encode integers as deltas between consecutive values,
+    zigzag mapped to unsigned and packed in LEB128 varints.
+
+    Consecutive indices in cells are usually close,
+    so most values fit in 1 or 2 bytes instead of 4.
+    """
+    values = np.asarray(values, dtype=np.int64).ravel()
+    delta = np.diff(values, prepend=0)
+    zigzag = ((delta << 1) ^ (delta >> 63)).astype(np.uint64)
+
+    # Number of 7 bit groups needed for each value
+    nbytes = np.ones(len(zigzag), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += zigzag >= np.uint64(1 << (7 * k))
+    offsets = np.cumsum(nbytes) - nbytes
+
+    data = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max(initial=0))):
+        mask = nbytes > k
+        group = (zigzag[mask] >> np.uint64(7 * k)) & np.uint64(0x7f)
+        more = (nbytes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        data[offsets[mask] + k] = group | more
+    return data
+
+
+def decode_varint(data, size):
+    """Decode integers encoded by encode_varint."""
+    data = np.asarray(data, dtype=np.uint8)
+    last = (data & 0x80) == 0
+    index = np.cumsum(last) - last
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    shift = 7 * (np.arange(len(data)) - starts[index])
+    zigzag = np.zeros(size, dtype=np.uint64)
+    np.add.at(zigzag, index, (data & 0x7f).astype(np.uint64) << shift.astype(np.uint64))
+    delta = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    return np.cumsum(delta)
+
+
+def quantize(values, dtype):
+    """Quantize values to unsigned integers of the given dtype.
+
+    Each column of a 2D array is mapped linearly from its own
+    range, decode with values = offset + quantized * scale.
+    """
+    values = np.asarray(values)
+    vmax = _quantized_max[dtype]
+    lo = np.nanmin(values, axis=0) if values.size else np.zeros(values.shape[1:])
+    hi = np.nanmax(values, axis=0) if values.size else np.zeros(values.shape[1:])
+    extent = hi - lo
+    inv = np.where(extent > 0, vmax / np.where(extent > 0, extent, 1), 0)
+    q = np.rint((np.nan_to_num(values) - lo) * inv)
+    q = np.clip(q, 0, vmax).astype(dtype)
+    return q, np.atleast_1d(lo).astype(float), np.atleast_1d(extent / vmax).astype(float)
+
+
+def dequantize(q, offset, scale):
+    """Map quantized values back to float32."""
+    return (offset + q * np.asarray(scale)).astype(np.float32)
+
+
+# Float32 represents vertex indices exactly up to 2^24, beyond that
+# the frontend stores vertex data in rows of fixed width
+_max_exact_index = 1 << 24
+_split_index_width = 1 << 12
+
+
+def texture_shape(num_items):
+    """Shape (width, height) of the texture the frontend
+    stores an array of num_items vertices or values in.
+
+    Mirrors compute_vertex_texture_shape in js/src/channels.ts.
+    """
+    if num_items <= 0:
+        return (1, 1)
+    if num_items > _max_exact_index:
+        return (_split_index_width, -(-num_items // _split_index_width))
+    width = 1 << ((num_items.bit_length() - 1) // 2)
+    return (width, -(-num_items // width))
+
+
+def pad_to_texture(value):
+    """Copy rows of value to a float32 array padded
+    with zeros to the size of its frontend texture."""
+    value = np.asarray(value)
+    width, height = texture_shape(len(value))
+    padded = np.zeros((width * height,) + value.shape[1:], dtype=np.float32)
+    padded[:len(value)] = value
+    return padded
+
+
+def encode_array(value, compression):
+    """Encode an array with the named compression."""
+    value = np.asarray(value)
+    state = {
+        "compression": compression,
+        "shape": value.shape,
+        "dtype": str(value.dtype),
+    }
+    if compression == "varint":
+        state["dtype"] = "int32"
+        data = encode_varint(value)
+    elif compression == "float16":
+        state["dtype"] = "float32"
+        data = value.astype(np.float16)
+    elif compression == "padded":
+        state["dtype"] = "float32"
+        data = pad_to_texture(value)
+    elif compression in _quantized_max:
+        state["dtype"] = "float32"
+        data, offset, scale = quantize(value, compression)
+        state["offset"] = offset.tolist()
+        state["scale"] = scale.tolist()
+    else:
+        raise ValueError("Invalid compression %r." % (compression,))
+    state["buffer"] = memoryview(np.ascontiguousarray(data))
+    return state
+
+
+def decode_array(state):
+    """Decode an array encoded by encode_array."""
+    compression = state["compression"]
+    shape = tuple(state["shape"])
+    size = int(np.prod(shape))
+    buffer = state["buffer"]
+    if compression == "varint":
+        value = decode_varint(np.frombuffer(buffer, dtype=np.uint8), size)
+    elif compression == "float16":
+        value = np.frombuffer(buffer, dtype=np.float16)
+    elif compression == "padded":
+        value = np.frombuffer(buffer, dtype=np.float32)[:size]
+    elif compression in _quantized_max:
+        q = np.frombuffer(buffer, dtype=compression).reshape(shape)
+        value = dequantize(q, state["offset"], state["scale"])
+    else:
+        raise ValueError("Invalid compression %r." % (compression,))
+    return value.astype(state["dtype"]).reshape(shape)
+
+
+def compressed_union_serialization(option):
+    """Create serializers for a DataUnion trait, compressing plain arrays
+    according to the trait named option on the widget.
+
+    Widget references and uncompressed arrays are passed
+    on to the regular data union serialization.
+    """
+    def to_json(value, widget):
+        compression = getattr(widget, option)
+        if compression == "none" or value is None or isinstance(value, Widget):
+            return data_union_serialization["to_json"](value, widget)
+        return encode_array(value, compression)
+
+    return dict(to_json=to_json, from_json=data_union_serialization["from_json"])
@@ -0,0 +1,436 @@
+"""Reference ray integration of volumetric plots on the CPU.
+
+Computes the ray integrals of the projected tetrahedra methods of
+XrayPlot, MinPlot, MaxPlot, SumPlot and VolumePlot with vectorized
+NumPy, for producing images without a browser or GPU and as a
+numerical reference for the shaders:
+
+    image = render(plot, Camera(position=(3, 2, 1)), width=800, height=600)
+
+A ray is cast through the center of each pixel, and the segment of the
+ray inside each cell is found exactly from the barycentric coordinates
+of the cell, in which P1 and D1 fields are linear along the segment and
+P0 fields constant. Each segment is split in steps pieces, and on each
+piece the mapped density and emission are averaged between its ends
+like the shaders do for a whole segment, so steps=1 reproduces the
+shaders without pre-integrated lookup tables, and larger values
+converge to the exact integrals of TODO.md. Unlike the browser, the
+segments of a volume plot are composited in exact order along the ray.
+
+The image is split in tiles, which are integrated in a pool of worker
+processes.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from ipydatawidgets import get_union_array
+
+from .lututils import sample_lut
+from .datawidgets import (
+    ScalarConstant, ScalarField, ColorConstant, ColorField,
+    ArrayScalarMap, ArrayColorMap,
+)
+from .plotwidgets import XrayPlot, MinPlot, MaxPlot, SumPlot, VolumePlot
+from .render import Camera, parse_color, _field_values, _scaled_values
+
+
+# Plot methods integrated here
+methods = ("xray", "min", "max", "sum", "volume")
+
+_plot_methods = {
+    XrayPlot: "xray",
+    MinPlot: "min",
+    MaxPlot: "max",
+    SumPlot: "sum",
+    VolumePlot: "volume",
+}
+
+
+def _cell_values(field, cells):
+    "Values of field at the vertices of each cell, shape (num_cells, 4)."
+    values = np.asarray(_field_values(field), dtype=np.float64)
+    if field.space == "P0":
+        return np.repeat(values[:, None], 4, axis=1)
+    elif field.space == "P1":
+        return values[cells]
+    elif field.space == "D1":
+        return values.reshape(-1, 4)
+    raise ValueError("Invalid field space %r." % (field.space,))
+
+
+def _prepare_density(density, cells):
+    "Scaled density at cell vertices and its lookup table."
+    if isinstance(density, ScalarConstant):
+        return dict(values=np.full((len(cells), 4), density.value), lut=None)
+    elif isinstance(density, ScalarField):
+        values = _scaled_values(density.field, _cell_values(density.field, cells))
+        lut = None
+        if isinstance(density.lut, ArrayScalarMap):
+            lut = np.asarray(get_union_array(density.lut.values), dtype=np.float64)
+        elif density.lut is not None:
+            raise NotImplementedError("Only ArrayScalarMap lookup tables are supported.")
+        return dict(values=values, lut=lut)
+    raise NotImplementedError("Density %r is not supported." % (density,))
+
+
+def _prepare_emission(color, cells):
+    "Scaled emission at cell vertices, its lookup table and color."
+    if isinstance(color, ColorConstant):
+        return dict(values=np.full((len(cells), 4), color.intensity), lut=None, color=parse_color(color.color))
+    elif isinstance(color, ColorField):
+        values = _scaled_values(color.field, _cell_values(color.field, cells))
+        lut = None
+        if isinstance(color.lut, ArrayColorMap):
+            lut = np.asarray(get_union_array(color.lut.values), dtype=np.float64)
+        elif color.lut is not None:
+            raise NotImplementedError("Only ArrayColorMap lookup tables are supported.")
+        return dict(values=values, lut=lut, color=np.ones(3))
+    raise NotImplementedError("Color %r is not supported." % (color,))
+
+
+def prepare(plot):
+    """Gather the data needed to integrate a volumetric plot.
+
+    Returns a dict of plain arrays, which is cheap to pass to
+    worker processes, unlike the widgets themselves.
+    """
+    method = _plot_methods.get(type(plot))
+    if method is None:
+        raise NotImplementedError("Integrating %s is not supported." % (type(plot).__name__,))
+
+    points = np.asarray(get_union_array(plot.mesh.points), dtype=np.float64)
+    cells = np.asarray(get_union_array(plot.mesh.cells))
+    selected = np.arange(len(cells))
+    restrict = plot.restrict
+    if restrict is not None:
+        if restrict.field.space != "I3":
+            raise NotImplementedError("Restriction to %s indicators is not supported." % (restrict.field.space,))
+        selected = np.flatnonzero(get_union_array(restrict.field.values) == restrict.value)
+
+    scene = dict(method=method, points=points, cells=cells[selected])
+    if method in ("xray", "volume"):
+        density = _prepare_density(plot.density, cells)
+        density["values"] = density["values"][selected]
+        scene.update(density=density, extinction=float(plot.extinction))
+    if method != "xray":
+        emission = _prepare_emission(plot.color, cells)
+        emission["values"] = emission["values"][selected]
+        scene.update(emission=emission)
+    if method in ("sum", "volume"):
+        scene.update(exposure=2.0 ** plot.exposure)
+    return scene
+
+
+def _inverse_maps(vertices):
+    """Affine maps from points to barycentric coordinates of cells.
+
+    Returns (inverse, origin, valid) such that the first three
+    barycentric coordinates of x in cell c are
+    inverse[c] @ (x - origin[c]), and the last one is one minus
+    their sum. Degenerate cells are marked invalid.
+    """
+    origin = vertices[:, 3]
+    edges = np.transpose(vertices[:, :3] - origin[:, None], (0, 2, 1))
+    det = np.linalg.det(edges)
+    scale = np.abs(edges).max(axis=(1, 2)) ** 3
+    valid = np.abs(det) > 1e-12 * scale
+    inverse = np.zeros_like(edges)
+    inverse[valid] = np.linalg.inv(edges[valid])
+    return inverse, origin, valid
+
+
+def _barycentric(inverse, v):
+    "Barycentric coordinates from vectors v already relative to the origin of each cell."
+    lam = np.einsum("cij,cj->ci", inverse, v)
+    return np.concatenate([lam, 1.0 - lam.sum(axis=1)[:, None]], axis=1)
+
+
+def _ray_directions(camera, px, py, width, height):
+    "Unit directions of rays through the centers of the given pixels."
+    right, up, forward = camera.basis()
+    scale = np.tan(np.radians(0.5 * camera.fov))
+    x = (2.0 * (px + 0.5) / width - 1.0) * scale * width / height
+    y = (1.0 - 2.0 * (py + 0.5) / height) * scale
+    d = forward[None, :] + x[:, None] * right[None, :] + y[:, None] * up[None, :]
+    return d / np.linalg.norm(d, axis=1)[:, None]
+
+
+def project_cells(scene, camera, width, height):
+    """Compute the geometry of cells seen by the camera, shared by all tiles.
+
+    Returns a dict with the pixel bounding boxes (x0, x1, y0, y1) of
+    the projected cells, the maps to barycentric coordinates of each
+    cell, see _inverse_maps, the barycentric coordinates of the camera
+    position, and which cell owns rays in the plane of each face. Cells crossing the plane of the camera and
+    degenerate cells are not visible.
+    """
+    vertices = scene["points"][scene["cells"]]
+    xy, depth = camera.project(vertices.reshape(-1, 3), width, height)
+    xy = xy.reshape(-1, 4, 2)
+    depth = depth.reshape(-1, 4)
+    bounds = np.stack([
+        np.ceil(xy[..., 0].min(axis=1) - 0.5), np.floor(xy[..., 0].max(axis=1) - 0.5) + 1,
+        np.ceil(xy[..., 1].min(axis=1) - 0.5), np.floor(xy[..., 1].max(axis=1) - 0.5) + 1,
+    ], axis=1)
+    inverse, origin, valid = _inverse_maps(vertices)
+    visible = valid & (depth > 0).all(axis=1)
+    position = np.asarray(camera.position, dtype=np.float64)
+
+    # A ray in the plane of a face shared by two cells belongs to the
+    # cell where the normal of the face pointing into the cell has its
+    # first significant component positive
+    normals = np.concatenate([inverse, -inverse.sum(axis=1)[:, None]], axis=1)
+    significant = np.abs(normals) > 1e-9 * np.abs(normals).max(axis=2)[..., None]
+    first = np.argmax(significant, axis=2)[..., None]
+    owned = np.take_along_axis(normals, first, axis=2)[..., 0] > 0
+
+    return dict(bounds=bounds, inverse=inverse, visible=visible, owned=owned,
+        position=_barycentric(inverse, position[None, :] - origin))
+
+
+def segments(geometry, camera, width, height, tile=None, chunk_size=1 << 20):
+    """Find the segments of pixel rays inside each cell.
+
+    Rays are cast from the camera position through the pixel centers
+    of the tile (x0, y0, x1, y1), by default the whole image, using the
+    geometry from project_cells. Yields chunks of (pixels, cells, t0,
+    t1, v, d) where pixels are flat indices into the tile, the segment
+    of the ray is between the distances t0 and t1 from the camera, and
+    v and d are the barycentric coordinates of the camera position and
+    the ray direction in the cell, such that v + t * d is the point at t.
+    """
+    x0, y0, x1, y1 = tile if tile is not None else (0, 0, width, height)
+    bounds = geometry["bounds"]
+    bx0 = np.clip(bounds[:, 0], x0, x1)
+    bx1 = np.clip(bounds[:, 1], x0, x1)
+    by0 = np.clip(bounds[:, 2], y0, y1)
+    by1 = np.clip(bounds[:, 3], y0, y1)
+    ids = np.flatnonzero(geometry["visible"] & (bx1 > bx0) & (by1 > by0))
+    if not len(ids):
+        return
+    nx = (bx1 - bx0)[ids].astype(np.int64)
+    counts = nx * (by1 - by0)[ids].astype(np.int64)
+
+    # Split cells in chunks of about chunk_size candidate pixels
+    ends = np.cumsum(counts)
+    bounds = np.searchsorted(ends, np.arange(chunk_size, ends[-1], chunk_size))
+    for chunk in np.split(np.arange(len(ids)), np.unique(bounds)):
+        if not len(chunk):
+            continue
+        c = np.repeat(ids[chunk], counts[chunk])
+        starts = np.repeat(np.cumsum(counts[chunk]) - counts[chunk], counts[chunk])
+        j = np.arange(len(c)) - starts
+        n = np.repeat(nx[chunk], counts[chunk])
+        px = bx0[c].astype(np.int64) + j % n
+        py = by0[c].astype(np.int64) + j // n
+
+        # Barycentric direction of the ray, the linear part of the map
+        d = _barycentric(geometry["inverse"][c], _ray_directions(camera, px, py, width, height))
+        d[:, 3] -= 1.0
+        v = geometry["position"][c]
+
+        # The ray is inside the cell where v + t * d >= 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = -v / d
+        t0 = np.where(d > 0, r, -np.inf).max(axis=1)
+        t1 = np.where(d < 0, r, np.inf).min(axis=1)
+        outside = (v < 0) | ((v == 0) & ~geometry["owned"][c])
+        parallel = ((d == 0) & outside).any(axis=1)
+        t0 = np.maximum(t0, 0.0)
+        hit = (t1 > t0) & ~parallel
+        pixels = (py[hit] - y0) * (x1 - x0) + (px[hit] - x0)
+        yield pixels, c[hit], t0[hit], t1[hit], v[hit], d[hit]
+
+
+def _map_density(density, scaled):
+    if density["lut"] is not None:
+        return sample_lut(density["lut"], scaled)
+    return scaled
+
+
+def _map_emission(emission, scaled):
+    if emission["lut"] is not None:
+        return sample_lut(emission["lut"], scaled)
+    return scaled[:, None] * emission["color"][None, :]
+
+
+def _steps(cells, t0, t1, v, d, steps):
+    """Split segments in steps pieces.
+
+    Returns the cells, start distances, lengths, and barycentric
+    coordinates at the start and end of each piece, in order along
+    each segment.
+    """
+    s = np.linspace(0.0, 1.0, steps + 1)
+    t = t0[:, None] + (t1 - t0)[:, None] * s[None, :]
+    lam = v[:, None, :] + t[:, :, None] * d[:, None, :]
+    length = np.repeat((t1 - t0) / steps, steps)
+    return (np.repeat(cells, steps), t[:, :-1].reshape(-1), length,
+        lam[:, :-1].reshape(-1, 4), lam[:, 1:].reshape(-1, 4))
+
+
+def integrate(scene, camera, width, height, tile=None, steps=1, geometry=None):
+    """Integrate the rays through the pixels of a tile.
+
+    Returns (rgb, alpha) for the tile (x0, y0, x1, y1), by default the
+    whole image, optionally reusing the geometry from project_cells. Colors are premultiplied by alpha for the xray and
+    volume methods, for the other methods alpha marks the pixels
+    covered by the plot and rgb is the blended color, see blend.
+    """
+    x0, y0, x1, y1 = tile if tile is not None else (0, 0, width, height)
+    if geometry is None:
+        geometry = project_cells(scene, camera, width, height)
+    method = scene["method"]
+    num_pixels = (x1 - x0) * (y1 - y0)
+    if method == "min":
+        rgb = np.full((num_pixels, 3), np.inf)
+    elif method == "max":
+        rgb = np.full((num_pixels, 3), -np.inf)
+    else:
+        rgb = np.zeros((num_pixels, 3))
+    optical_depth = np.zeros(num_pixels)
+    covered = np.zeros(num_pixels, dtype=bool)
+
+    # Pieces of volume rays are gathered for ordering
+    pieces = []
+
+    for pixels, cells, t0, t1, v, d in segments(geometry, camera, width, height, tile):
+        covered[pixels] = True
+        cells, t, length, lam0, lam1 = _steps(cells, t0, t1, v, d, steps)
+        pixels = np.repeat(pixels, steps)
+
+        if method in ("xray", "volume"):
+            values = scene["density"]["values"][cells]
+            rho0 = _map_density(scene["density"], (lam0 * values).sum(axis=1))
+            rho1 = _map_density(scene["density"], (lam1 * values).sum(axis=1))
+            tau = scene["extinction"] * length * 0.5 * (rho0 + rho1)
+        if method != "xray":
+            values = scene["emission"]["values"][cells]
+            L0 = _map_emission(scene["emission"], (lam0 * values).sum(axis=1))
+            L1 = _map_emission(scene["emission"], (lam1 * values).sum(axis=1))
+
+        if method == "xray":
+            optical_depth += np.bincount(pixels, tau, num_pixels)
+        elif method == "sum":
+            C = (scene["exposure"] * length)[:, None] * 0.5 * (L0 + L1)
+            for i in range(3):
+                rgb[:, i] += np.bincount(pixels, C[:, i], num_pixels)
+        elif method == "max":
+            np.maximum.at(rgb, pixels, np.maximum(L0, L1))
+        elif method == "min":
+            np.minimum.at(rgb, pixels, np.minimum(L0, L1))
+        elif method == "volume":
+            pieces.append((pixels, t, tau, 0.5 * (L0 + L1)))
+
+    if method == "volume" and pieces:
+        pixels, t, tau, L = [np.concatenate(p) for p in zip(*pieces)]
+        order = np.lexsort((t, pixels))
+        pixels, tau, L = pixels[order], tau[order], L[order]
+
+        # Front to back compositing, each piece is attenuated
+        # by the optical depth of the pieces in front of it
+        cumulative = np.cumsum(tau)
+        first = np.ones(len(pixels), dtype=bool)
+        first[1:] = pixels[1:] != pixels[:-1]
+        group = np.cumsum(first) - 1
+        in_front = cumulative - tau - (cumulative - tau)[first][group]
+        a = 1.0 - np.exp(-tau)
+        C = (scene["exposure"] * a * np.exp(-in_front))[:, None] * L
+        for i in range(3):
+            rgb[:, i] = np.bincount(pixels, C[:, i], num_pixels)
+        optical_depth = np.bincount(pixels, tau, num_pixels)
+
+    if method in ("xray", "volume"):
+        alpha = 1.0 - np.exp(-optical_depth)
+    else:
+        alpha = covered.astype(np.float64)
+        rgb[~covered] = 0.0
+
+    shape = (y1 - y0, x1 - x0)
+    return rgb.reshape(shape + (3,)), alpha.reshape(shape)
+
+
+def blend(method, rgb, alpha, background=None):
+    """Blend integrated colors with a background like the frontend.
+
+    Returns RGB colors and alpha. Without a background, uncovered pixels
+    are transparent. The xray and volume methods are composited over
+    the background, while sum adds to it, and min and max take the
+    minimum or maximum with it.
+    """
+    if background is None:
+        return rgb, alpha
+    bg = parse_color(background)[None, None, :]
+    if method in ("xray", "volume"):
+        rgb = rgb + (1.0 - alpha)[..., None] * bg
+    elif method == "sum":
+        rgb = rgb + bg
+    elif method == "max":
+        rgb = np.where(alpha[..., None] > 0, np.maximum(rgb, bg), bg)
+    elif method == "min":
+        rgb = np.where(alpha[..., None] > 0, np.minimum(rgb, bg), bg)
+    return rgb, np.ones_like(alpha)
+
+
+# Arguments of integrate shared by the tiles in a worker process
+_worker_args = None
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _integrate_tile(tile):
+    scene, camera, width, height, steps, geometry = _worker_args
+    return integrate(scene, camera, width, height, tile, steps, geometry)
+
+
+def tiles(width, height, tile_size=64):
+    "Split an image in tiles (x0, y0, x1, y1) of at most tile_size pixels square."
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in range(0, height, tile_size) for x in range(0, width, tile_size)]
+
+
+def render_prepared(scene, camera=None, width=640, height=480, background=None,
+                    steps=1, tile_size=64, processes=None):
+    """Render data from prepare(plot) to an image.
+
+    The image is split in tiles of tile_size pixels square, which are
+    integrated in a pool of processes, by default one per core, or in
+    this process if processes is 1. Returns an array of shape
+    (height, width, 4) with RGBA colors as uint8.
+    """
+    camera = (camera or Camera()).fit(scene["points"])
+    parts = tiles(width, height, tile_size)
+    geometry = project_cells(scene, camera, width, height)
+    args = (scene, camera, width, height, steps, geometry)
+    if processes == 1:
+        _init_worker(*args)
+        try:
+            results = [_integrate_tile(tile) for tile in parts]
+        finally:
+            _init_worker()
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=args) as pool:
+            results = list(pool.map(_integrate_tile, parts))
+
+    rgb = np.zeros((height, width, 3))
+    alpha = np.zeros((height, width))
+    for (x0, y0, x1, y1), (c, a) in zip(parts, results):
+        rgb[y0:y1, x0:x1] = c
+        alpha[y0:y1, x0:x1] = a
+    rgb, alpha = blend(scene["method"], rgb, alpha, background)
+    image = np.concatenate([rgb, alpha[..., None]], axis=-1)
+    return np.round(255.0 * np.clip(image, 0.0, 1.0)).astype(np.uint8)
+
+
+def render(plot, camera=None, width=640, height=480, background=None,
+           steps=1, tile_size=64, processes=None):
+    """Render a volumetric plot to an image on the CPU, without a browser.
+
+    See render_prepared for the arguments.
+    """
+    return render_prepared(prepare(plot), camera, width, height, background,
+        steps, tile_size, processes)
@@ -1,12 +1,24 @@
 import numpy as np
 import ipywidgets as widgets
 from ipywidgets import widget_serialization, register, Color
-from ipydatawidgets import DataUnion, data_union_serialization, shape_constraints
+from ipydatawidgets import DataUnion, data_union_serialization, shape_constraints, get_union_array
 import traitlets
 from traitlets import (
-    Unicode, CFloat, CInt, CBool, Enum, Union, Instance,
+    Unicode, CFloat, CInt, CBool, Enum, Union, Instance, Tuple, Dict, List,
 )
 from ._version import widget_module_name, EXTENSION_SPEC_VERSION
+from .meshutils import (
+    oriented_tetrahedron_cells, compute_cell_neighbors, compute_boundary_cells, compute_range, as_array,
+    content_hash,
+    decimate_tetrahedra, decimate_values, extract_cells, extract_values,
+    build_cell_tree, locate_points, interpolate_values,
+    compute_cell_ranges, build_interval_index, query_interval_index,
+)
+from .lututils import preintegrate_lut
+from .compression import (
+    cells_compressions, points_compressions, values_compressions,
+    compressed_union_serialization,
+)
 
 
 def _gather_dashboards(self, names):
@@ -20,6 +32,35 @@ def _gather_dashboards(self, names):
     return children, titles
 
 
+def _copy_with_data(widget, transform, base=widgets.Widget, **overrides):
+    """Copy widget with all referenced data widgets replaced by transform(data).
+
+    Data widgets are those with a mesh, i.e. meshes and fields.
+    Widgets without any references to data are returned as is, such
+    that e.g. lookup tables are shared with the copy. All writable
+    traits are copied, including options that are not synced, except
+    those defined by base, and overrides replace traits.
+    """
+    names = set(type(widget).class_trait_names()) - set(base.class_trait_names())
+    kwargs = {}
+    changed = bool(overrides)
+    for name in names:
+        if name.startswith("_") or widget.traits()[name].read_only:
+            continue
+        value = overrides[name] if name in overrides else getattr(widget, name)
+        if isinstance(value, widgets.Widget):
+            if isinstance(value, Mesh) or isinstance(getattr(value, "mesh", None), Mesh):
+                copied = transform(value)
+            else:
+                copied = _copy_with_data(value, transform)
+            changed = changed or copied is not value
+            value = copied
+        kwargs[name] = value
+    if not changed:
+        return widget
+    return type(widget)(**kwargs)
+
+
 def _make_accordion(children, titles):
     accordion = widgets.Accordion(children=children)
     for i, title in enumerate(titles):
@@ -37,7 +78,21 @@ indicator_field_types = ("I0", "I1", "I2", "I3")
 colormap_names = ("viridis", "fixme")
 
 # List of valid isosurface types
-isosurface_types = ("single", "linear", "log", "power", "sweep")
+isosurface_types = ("single", "linear", "log", "power", "sweep", "list")
+
+
+class SharedDataUnion(DataUnion):
+    """DataUnion for large mesh and field arrays, sharing memory with inputs where possible.
+
+    Arrays of the trait dtype, including memory maps, read-only arrays and
+    typed buffers, are kept as views without copying. Other arrays are cast
+    chunk by chunk into one new array, see unray.meshutils.as_array.
+    """
+
+    def validate(self, obj, value):
+        if self.dtype is not None and value is not None and not isinstance(value, widgets.Widget):
+            value = as_array(value, self.dtype)
+        return super(SharedDataUnion, self).validate(obj, value)
 
 
 class BaseWidget(widgets.Widget):
@@ -45,36 +100,498 @@ class BaseWidget(widgets.Widget):
     _model_module = Unicode(widget_module_name).tag(sync=True)
     _model_module_version = Unicode(EXTENSION_SPEC_VERSION).tag(sync=True)
 
+    def refresh(self, *names):
+        """Update this widget after modifying its arrays in place.
+
+        Notifies a change of the named array traits, by default all
+        array traits, as if they were assigned again. This recomputes
+        what depends on them, such as hashes, ranges and tables, and
+        sends them to the frontend. Assigning the same or an equal
+        array again does not notify any change, so use this instead.
+        """
+        if not names:
+            names = sorted(name for name, trait in self.traits().items()
+                if isinstance(trait, DataUnion) and not trait.read_only)
+        # Sending the arrays and all derived state in one message
+        with self.hold_sync():
+            for name in names:
+                value = getattr(self, name)
+                self.notify_change({"name": name, "old": value, "new": value, "owner": self, "type": "change"})
+
+
+class DataWidget(BaseWidget):
+    """Base class for widgets holding large arrays.
+
+    A content hash of each array in _hashed_traits is synced along
+    with it in the same message, such that the frontend can share
+    one texture between widgets holding identical arrays.
+    Call refresh() after modifying arrays in place to update their hash.
+    """
+    # Abstract class, don't register, and don't set name
+
+    # Names of array traits to hash
+    _hashed_traits = ()
+
+    # Content hash of each array trait holding an array,
+    # other values such as array widgets are keyed by model id
+    hashes = Dict(read_only=True).tag(sync=True)
+
+    def notify_change(self, change):
+        if change["name"] in self._hashed_traits:
+            with self.hold_sync():
+                self._update_hash(change["name"])
+                super(DataWidget, self).notify_change(change)
+        else:
+            super(DataWidget, self).notify_change(change)
+
+    def _update_hash(self, name):
+        hashes = dict(self.hashes)
+        value = getattr(self, name)
+        if isinstance(value, np.ndarray):
+            # Compressed arrays decode to different values
+            salt = getattr(self, name + "_compression", "none")
+            hashes[name] = content_hash(value, salt)
+        else:
+            hashes.pop(name, None)
+        self.set_trait("hashes", hashes)
+
+    def _send_array(self, name):
+        # Send array and hash together after changing the hash salt
+        with self.hold_sync():
+            self._update_hash(name)
+            self.send_state([name, "hashes"])
+
 
 # ------------------------------------------------------
 
 
 @register
-class Mesh(BaseWidget):
+class Mesh(DataWidget):
     """Representation of an unstructured mesh."""
     _model_name = Unicode('MeshModel').tag(sync=True)
+    _hashed_traits = ("cells", "points", "neighbors")
     auto_orient = CBool(True).tag(sync=True)
-    cells = DataUnion(dtype=np.int32, shape_constraint=shape_constraints(None, 4)).tag(sync=True)
-    points = DataUnion(dtype=np.float32, shape_constraint=shape_constraints(None, 3)).tag(sync=True)
+    cells = SharedDataUnion(dtype=np.int32, shape_constraint=shape_constraints(None, 4)).tag(sync=True, **compressed_union_serialization("cells_compression"))
+    points = SharedDataUnion(dtype=np.float32, shape_constraint=shape_constraints(None, 3)).tag(sync=True, **compressed_union_serialization("points_compression"))
+
+    # Opt-in compact encodings for sending cells and points to the frontend,
+    # "varint" is lossless while "uint16" quantizes points within the bounding box
+    cells_compression = Enum(cells_compressions, "none")
+    points_compression = Enum(points_compressions, "none")
+
+    # Set when cells are known to be positively oriented,
+    # telling the frontend to skip its reorientation pass
+    oriented = CBool(False, read_only=True).tag(sync=True)
+
+    # Cell adjacency, only computed when requested by compute_neighbors()
+    neighbors = SharedDataUnion(None, dtype=np.int32, shape_constraint=shape_constraints(None, 4), allow_none=True).tag(sync=True)
+
+    def __init__(self, **kwargs):
+        # Cache of (coarse mesh, vertex map, cell map) per target number
+        # of cells, cleared when cells or points change
+        self._decimations = {}
+        # Cache of (indicator values, submesh, vertex indices, cell indices)
+        # per (indicator field, value), also cleared when cells or points change
+        self._extractions = {}
+        # Cache of (indicator values, boundary cells) per indicator field,
+        # with None for the exterior boundary, also cleared when cells change
+        self._boundaries = {}
+        self._neighbors = None
+        # Bounding volume hierarchy over cells, built by the first
+        # call to locate(), also cleared when cells or points change
+        self._cell_tree = None
+        # Incremented when cells or points change, such that caches
+        # of other widgets notice arrays refreshed in place
+        self._revision = 0
+        super(Mesh, self).__init__(**kwargs)
+
+    def compute_neighbors(self):
+        """Compute cell adjacency for this mesh.
+
+        The result is cached and synced to the frontend,
+        and kept up to date if cells change later.
+        """
+        if self.neighbors is None:
+            self.neighbors = compute_cell_neighbors(get_union_array(self.cells))
+        return self.neighbors
+
+    def compute_boundary_cells(self, indicators=None):
+        """Compute the indices of cells with a face on the mesh surface.
+
+        With cell indicators (I3) on this mesh, faces between cells
+        with different indicator values are included as well.
+        Results are cached per indicator field, and recomputed
+        if the values of the indicator field change.
+        """
+        values = None
+        if indicators is not None:
+            if indicators.space != "I3" or indicators.mesh is not self:
+                raise ValueError("Expecting cell indicators (I3) on this mesh.")
+            values = get_union_array(indicators.values)
+        cached = self._boundaries.get(indicators)
+        if cached is None or cached[0] is not values:
+            cells = get_union_array(self.cells)
+            cached = (values, compute_boundary_cells(cells, values, self._cell_neighbors()))
+            self._boundaries[indicators] = cached
+        return cached[1]
+
+    def _cell_neighbors(self):
+        # Adjacency is kept private here rather than
+        # synced to the frontend like compute_neighbors()
+        if self.neighbors is not None:
+            self._neighbors = get_union_array(self.neighbors)
+        elif self._neighbors is None:
+            self._neighbors = compute_cell_neighbors(get_union_array(self.cells))
+        return self._neighbors
+
+    def locate(self, points):
+        """Find the cells containing a batch of points.
+
+        Returns (cell indices, barycentric coordinates) of shapes (n,)
+        and (n, 4), with cell index -1 for points outside the mesh.
+        Barycentric coordinates follow the local vertex order of cells.
+        A bounding volume hierarchy over the cells is built on first use
+        and cached, see unray.meshutils.build_cell_tree.
+        """
+        cells = get_union_array(self.cells)
+        points_array = get_union_array(self.points)
+        if self._cell_tree is None:
+            self._cell_tree = build_cell_tree(cells, points_array)
+        return locate_points(self._cell_tree, cells, points_array, points)
+
+    def decimate(self, target_cells):
+        """Create a coarsened copy of this mesh with at most target_cells cells.
+
+        Meant for fast previews of large meshes, see
+        unray.meshutils.decimate_tetrahedra for the method.
+        Decimations are cached per target_cells, such that
+        fields on this mesh decimate to the same coarse mesh.
+        """
+        return self._decimation(target_cells)[0]
+
+    def _decimation(self, target_cells):
+        cache = self._decimations
+        if target_cells not in cache:
+            cells = get_union_array(self.cells)
+            coarse_cells, coarse_points, vertex_map, cell_map = decimate_tetrahedra(
+                cells, get_union_array(self.points), target_cells)
+            coarse = Mesh(cells=coarse_cells, points=coarse_points, auto_orient=self.auto_orient)
+            cache[target_cells] = (coarse, vertex_map, cell_map)
+        self._copy_compression(cache[target_cells][0])
+        return cache[target_cells]
+
+    def _copy_compression(self, mesh):
+        # Derived meshes are sent with the same encodings as this one,
+        # also when they are cached and the options changed since
+        mesh.cells_compression = self.cells_compression
+        mesh.points_compression = self.points_compression
+
+    def _decimate_values(self, values, space, target_cells):
+        # Using the coarse cells after any reorientation,
+        # such that D1 values follow the local vertex order
+        coarse, vertex_map, cell_map = self._decimation(target_cells)
+        values = decimate_values(values, space, get_union_array(self.cells),
+            get_union_array(coarse.cells), vertex_map, cell_map)
+        return coarse, values
+
+    def extract(self, indicators, value):
+        """Create a submesh of the cells where cell indicators equal value.
+
+        Submeshes are cached per indicator field and value, and
+        recomputed if the values of the indicator field change.
+        """
+        return self._extraction(indicators, value)[0]
+
+    def _extraction(self, indicators, value):
+        if indicators.space != "I3" or indicators.mesh is not self:
+            raise ValueError("Expecting cell indicators (I3) on this mesh.")
+        values = get_union_array(indicators.values)
+        key = (indicators, value)
+        cached = self._extractions.get(key)
+        if cached is None or cached[0] is not values:
+            sub_cells, vertex_indices, cell_indices = extract_cells(
+                get_union_array(self.cells), values == value)
+            points = get_union_array(self.points)[vertex_indices]
+            submesh = Mesh(cells=sub_cells, points=points, auto_orient=self.auto_orient)
+            cached = (values, submesh, vertex_indices, cell_indices)
+            self._extractions[key] = cached
+        self._copy_compression(cached[1])
+        return cached[1:]
+
+    def _extract_values(self, values, space, indicators, value):
+        submesh, vertex_indices, cell_indices = self._extraction(indicators, value)
+        return submesh, extract_values(values, space, vertex_indices, cell_indices)
+
+    @traitlets.observe("cells_compression", "points_compression")
+    def _update_compression(self, change):
+        self._send_array(change["name"][:-len("_compression")])
+
+    @traitlets.observe("cells", "points", "auto_orient")
+    def _update_cells(self, change):
+        self._revision += 1
+        self._decimations.clear()
+        self._extractions.clear()
+        self._boundaries.clear()
+        self._neighbors = None
+        self._cell_tree = None
+
+        # Orientation is computed once here whenever cells or points
+        # are assigned, instead of in every plot that uses this mesh
+        cells = self.cells
+        points = get_union_array(self.points)
+        oriented = False
+        # Cells and points may be assigned one at a time,
+        # skip while they are inconsistent with each other
+        if (self.auto_orient and isinstance(cells, np.ndarray)
+                and (cells.size == 0 or cells.max() < len(points))):
+            cells_oriented = oriented_tetrahedron_cells(cells, points)
+            if cells_oriented is not cells:
+                # Triggers this observer again, which then
+                # finds nothing left to reorient
+                self.cells = cells_oriented
+                return
+            oriented = True
+        self.set_trait("oriented", oriented)
+
+        # Keep adjacency up to date once it has been requested
+        if change["name"] == "cells" and self.neighbors is not None:
+            self.neighbors = compute_cell_neighbors(get_union_array(cells))
 
 
 @register
-class Field(BaseWidget):
+class Field(DataWidget):
     """Representation of a discrete scalar field over a mesh."""
     _model_name = Unicode('FieldModel').tag(sync=True)
+    _hashed_traits = ("values",)
     mesh = Instance(Mesh, allow_none=False).tag(sync=True, **widget_serialization)
-    values = DataUnion(dtype=np.float32, shape_constraint=shape_constraints(None)).tag(sync=True, **data_union_serialization)
+    values = SharedDataUnion(dtype=np.float32, shape_constraint=shape_constraints(None)).tag(sync=True, **compressed_union_serialization("values_compression"))
     space = Enum(field_types, "P1").tag(sync=True)
 
+    # Opt-in lossy encoding for sending values to the frontend,
+    # as half floats or quantized to 8 or 16 bits within the range of values
+    values_compression = Enum(values_compressions, "none")
+
+    @traitlets.observe("values_compression")
+    def _update_compression(self, change):
+        self._send_array("values")
+
+    # Percentiles of values to use as range, e.g. (1, 99) to ignore outliers
+    range_percentiles = Tuple(CFloat(), CFloat(), default_value=(0.0, 100.0))
+
+    # Range of values, computed here once such that
+    # the frontend doesn't need to scan the values
+    range = Tuple(CFloat(), CFloat(), default_value=None, allow_none=True, read_only=True).tag(sync=True)
+
+    @traitlets.observe("values", "range_percentiles")
+    def _update_range(self, change):
+        values = get_union_array(self.values)
+        self.set_trait("range", compute_range(values, self.range_percentiles))
+
+    @traitlets.observe("values")
+    def _clear_cell_ranges(self, change):
+        # Also reached through refresh() with the same array
+        self._cell_ranges = None
+
+    def __init__(self, **kwargs):
+        # Cache of (values, mesh revision, lower, upper, interval index) with
+        # the range of values in each cell, rebuilt when values or cells change
+        self._cell_ranges = None
+        super(Field, self).__init__(**kwargs)
+
+    def _cached_cell_ranges(self):
+        values = get_union_array(self.values)
+        revision = self.mesh._revision
+        cached = self._cell_ranges
+        if cached is None or cached[0] is not values or cached[1] != revision:
+            lower, upper = compute_cell_ranges(values, self.space, get_union_array(self.mesh.cells))
+            cached = (values, revision, lower, upper, build_interval_index(lower, upper))
+            self._cell_ranges = cached
+        return cached
+
+    def compute_cell_ranges(self):
+        """Compute the minimum and maximum value of this field in each cell.
+
+        Returns (lower, upper) arrays with one value per cell. The result
+        is cached, and recomputed if the values or the mesh cells change.
+        """
+        return self._cached_cell_ranges()[2:4]
+
+    def find_cells(self, values):
+        """Find the cells where this field takes any of the given values.
+
+        Returns the sorted indices of the cells as int32. Cells are looked
+        up in an interval index over the ranges from compute_cell_ranges(),
+        built once and cached, see unray.meshutils.build_interval_index.
+        """
+        return query_interval_index(self._cached_cell_ranges()[4], values)
+
+    def sample(self, points):
+        """Evaluate this field at a batch of points of shape (n, 3).
+
+        Returns an array of n values, interpolated linearly in cells for
+        P1 and D1 fields, and NaN at points outside the mesh. Points are
+        located by mesh.locate(points), reusing its cached index.
+        """
+        cells, coordinates = self.mesh.locate(points)
+        return interpolate_values(get_union_array(self.values), self.space,
+            get_union_array(self.mesh.cells), cells, coordinates)
+
+    def sample_line(self, p0, p1, n):
+        """Evaluate this field at n points evenly spaced from p0 to p1.
+
+        Returns (points, values) with points of shape (n, 3), see sample.
+        """
+        t = np.linspace(0.0, 1.0, n)[:, None]
+        points = (1.0 - t) * np.asarray(p0, dtype=np.float64) + t * np.asarray(p1, dtype=np.float64)
+        return points, self.sample(points)
+
+    def sample_plane(self, origin, u, v, nu, nv):
+        """Evaluate this field on a grid of nu x nv points in a plane.
+
+        The grid spans the parallelogram origin + s * u + t * v for
+        s and t in [0, 1]. Returns (points, values) with points of shape
+        (nv, nu, 3) and values of shape (nv, nu), see sample.
+        """
+        s = np.linspace(0.0, 1.0, nu)[None, :, None]
+        t = np.linspace(0.0, 1.0, nv)[:, None, None]
+        points = (np.asarray(origin, dtype=np.float64)
+            + s * np.asarray(u, dtype=np.float64) + t * np.asarray(v, dtype=np.float64))
+        return points, self.sample(points.reshape(-1, 3)).reshape(nv, nu)
+
+    def decimate(self, target_cells):
+        "Create a copy of this field on mesh.decimate(target_cells)."
+        mesh, values = self.mesh._decimate_values(get_union_array(self.values), self.space, target_cells)
+        return Field(mesh=mesh, values=values, space=self.space,
+            range_percentiles=self.range_percentiles, values_compression=self.values_compression)
+
+    def extract(self, indicators, value):
+        "Create a copy of this field on mesh.extract(indicators, value)."
+        mesh, values = self.mesh._extract_values(get_union_array(self.values), self.space, indicators, value)
+        return Field(mesh=mesh, values=values, space=self.space,
+            range_percentiles=self.range_percentiles, values_compression=self.values_compression)
+
 
 @register
-class IndicatorField(BaseWidget):
+class FieldSeries(BaseWidget):
+    """Representation of a time series of discrete scalar fields over a mesh.
+
+    All frames are held in one contiguous array of shape (num_frames, num_values),
+    streamed to the frontend in chunks of chunk_size frames ahead of playback.
+    Changing frame then switches the field shown without any further data
+    transfer, so playback with a linked Play widget runs in the frontend.
+    """
+    _model_name = Unicode('FieldSeriesModel').tag(sync=True)
+    mesh = Instance(Mesh, allow_none=False).tag(sync=True, **widget_serialization)
+    values = SharedDataUnion(dtype=np.float32, shape_constraint=shape_constraints(None, None))
+    space = Enum(field_types, "P1").tag(sync=True)
+
+    # Index of the frame currently shown
+    frame = CInt(0).tag(sync=True)
+
+    # Shape (num_frames, num_values) of the series
+    shape = Tuple(CInt(), CInt(), default_value=(0, 0), read_only=True).tag(sync=True)
+
+    # Number of frames to send in each message
+    chunk_size = CInt(16)
+
+    # Percentiles of values to use as range, e.g. (1, 99) to ignore outliers
+    range_percentiles = Tuple(CFloat(), CFloat(), default_value=(0.0, 100.0))
+
+    # Range of values over all frames, such that colors are comparable between frames
+    range = Tuple(CFloat(), CFloat(), default_value=None, allow_none=True, read_only=True).tag(sync=True)
+
+    def __init__(self, **kwargs):
+        super(FieldSeries, self).__init__(**kwargs)
+        self.on_msg(self._handle_custom_msg)
+
+    @traitlets.observe("values", "range_percentiles")
+    def _update_range(self, change):
+        values = get_union_array(self.values)
+        self.set_trait("range", compute_range(values, self.range_percentiles))
+
+    @traitlets.observe("values")
+    def _update_frames(self, change):
+        values = get_union_array(self.values)
+        self.set_trait("shape", values.shape)
+        self.send_frames()
+
+    def _handle_custom_msg(self, widget, content, buffers):
+        # Sent by each new frontend model
+        if content.get("event") == "request_frames":
+            self.send_frames()
+
+    def send_frames(self, start=0, stop=None):
+        "Send frames in the range [start, stop) to the frontend."
+        values = get_union_array(self.values)
+        stop = len(values) if stop is None else min(stop, len(values))
+        for i in range(start, stop, max(1, self.chunk_size)):
+            j = min(i + max(1, self.chunk_size), stop)
+            chunk = np.ascontiguousarray(values[i:j])
+            content = {"event": "frames", "start": i, "count": j - i, "shape": list(values.shape)}
+            self.send(content, buffers=[memoryview(chunk)])
+
+    def decimate(self, target_cells):
+        "Create a copy of this series on mesh.decimate(target_cells)."
+        # Transfer all frames at once with values along the first axis
+        values = get_union_array(self.values).T
+        mesh, values = self.mesh._decimate_values(values, self.space, target_cells)
+        return FieldSeries(mesh=mesh, values=np.ascontiguousarray(values.T), space=self.space, frame=self.frame,
+            chunk_size=self.chunk_size, range_percentiles=self.range_percentiles)
+
+    def extract(self, indicators, value):
+        "Create a copy of this series on mesh.extract(indicators, value)."
+        values = get_union_array(self.values).T
+        mesh, values = self.mesh._extract_values(values, self.space, indicators, value)
+        return FieldSeries(mesh=mesh, values=np.ascontiguousarray(values.T), space=self.space, frame=self.frame,
+            chunk_size=self.chunk_size, range_percentiles=self.range_percentiles)
+
+    def dashboard(self):
+        "Create linked playback widgets for this series."
+        children = []
+
+        last = max(0, self.shape[0] - 1)
+        play = widgets.Play(value=self.frame, min=0, max=last, interval=50, description="Play")
+        slider = widgets.IntSlider(value=self.frame, min=0, max=last, description="Frame")
+        # Linking in the frontend such that playback doesn't wait for the kernel
+        widgets.jslink((play, "value"), (self, "frame"))
+        widgets.jslink((slider, "value"), (self, "frame"))
+        children.append(widgets.HBox(children=[play, slider]))
+
+        return widgets.VBox(children=children)
+
+
+@register
+class IndicatorField(DataWidget):
     """Representation of a set of nominal indicator values for each mesh entity."""
     _model_name = Unicode('IndicatorFieldModel').tag(sync=True)
+    _hashed_traits = ("values",)
     mesh = Instance(Mesh, allow_none=False).tag(sync=True, **widget_serialization)
-    values = DataUnion(dtype=np.int32, shape_constraint=shape_constraints(None)).tag(sync=True, **data_union_serialization)
+    values = SharedDataUnion(dtype=np.int32, shape_constraint=shape_constraints(None)).tag(sync=True, **data_union_serialization)
     space = Enum(indicator_field_types, "I3").tag(sync=True)
 
+    @traitlets.observe("values")
+    def _clear_mesh_caches(self, change):
+        # Submeshes and boundaries of the mesh are cached by the identity
+        # of these values, which stays the same through refresh()
+        mesh = self.mesh
+        if mesh is not None:
+            mesh._boundaries.pop(self, None)
+            for key in [key for key in mesh._extractions if key[0] is self]:
+                del mesh._extractions[key]
+
+    def decimate(self, target_cells):
+        """Create a copy of these indicators on mesh.decimate(target_cells).
+
+        Only cell indicators (space I3) can be decimated.
+        """
+        mesh, values = self.mesh._decimate_values(get_union_array(self.values), self.space, target_cells)
+        return IndicatorField(mesh=mesh, values=values, space=self.space)
+
+    def extract(self, indicators, value):
+        "Create a copy of these indicators on mesh.extract(indicators, value)."
+        mesh, values = self.mesh._extract_values(get_union_array(self.values), self.space, indicators, value)
+        return IndicatorField(mesh=mesh, values=values, space=self.space)
+
 
 # ------------------------------------------------------
 # TODO: Lookup tables for scalars and colors should be
@@ -85,6 +602,14 @@ class Map(BaseWidget):
     # Abstract class, don't register, and don't set name
 
 
+def _preintegrate(lut):
+    # Arrays modified in place are picked up by refresh()
+    table = None
+    if lut.preintegration_size > 0:
+        table = preintegrate_lut(get_union_array(lut.values), lut.preintegration_size)
+    lut.set_trait("preintegrated", table)
+
+
 class ScalarMap(Map):
     """Representation of a scalar lookup table."""
     # Abstract class, don't register, and don't set name
@@ -96,6 +621,17 @@ class ArrayScalarMap(ScalarMap):
     _model_name = Unicode('ArrayScalarMapModel').tag(sync=True)
     values = DataUnion(dtype=np.float32, shape_constraint=shape_constraints(None)).tag(sync=True, **data_union_serialization)
 
+    # Mean of the lookup table between any two values, used by volume
+    # rendering to integrate exactly over cells, see preintegrate_lut.
+    # Size of the table along each axis, 0 disables pre-integration.
+    preintegration_size = CInt(128)
+    preintegrated = DataUnion(None, dtype=np.float32, shape_constraint=shape_constraints(None, None),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    @traitlets.observe("values", "preintegration_size")
+    def _update_preintegrated(self, change):
+        _preintegrate(self)
+
     # TODO: Handle linear/log scaled Maps somehow:
     #space = Enum(["linear", "log", "power"], "linear").tag(sync=True)
 
@@ -117,6 +653,15 @@ class ArrayColorMap(ColorMap):
     values = DataUnion(dtype=np.float32, shape_constraint=shape_constraints(None, 3)).tag(sync=True, **data_union_serialization)
     space = Enum(["rgb", "hsv"], "rgb").tag(sync=True)
 
+    # Mean color between any two values, see ArrayScalarMap
+    preintegration_size = CInt(128)
+    preintegrated = DataUnion(None, dtype=np.float32, shape_constraint=shape_constraints(None, None, 3),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    @traitlets.observe("values", "preintegration_size")
+    def _update_preintegrated(self, change):
+        _preintegrate(self)
+
     # TODO: Pair colors with domain values (Map is a mapping real -> color)
 
     # TODO: Do this instead?
@@ -182,12 +727,12 @@ class ScalarField(ScalarValued):
     """Representation of a scalar field."""
     _model_name = Unicode('ScalarFieldModel').tag(sync=True)
 
-    field = Instance(Field, allow_none=False).tag(sync=True, **widget_serialization)
+    field = Union([Instance(Field), Instance(FieldSeries)], allow_none=False).tag(sync=True, **widget_serialization)
     lut = Instance(ScalarMap, allow_none=True).tag(sync=True, **widget_serialization)
 
     def dashboard(self):
         "Create linked widgets for this data."
-        children, titles = _gather_dashboards(self, ["lut"])
+        children, titles = _gather_dashboards(self, ["field", "lut"])
         return widgets.VBox(children=children)
 
 
@@ -258,12 +803,12 @@ class ColorField(ColorValued):
     """Representation of a color field."""
     _model_name = Unicode('ColorFieldModel').tag(sync=True)
 
-    field = Instance(Field, allow_none=False).tag(sync=True, **widget_serialization)
+    field = Union([Instance(Field), Instance(FieldSeries)], allow_none=False).tag(sync=True, **widget_serialization)
     lut = Instance(ColorMap, allow_none=True).tag(sync=True, **widget_serialization)
 
     def dashboard(self):
         "Create linked widgets for this data."
-        children, titles = _gather_dashboards(self, ["lut"])
+        children, titles = _gather_dashboards(self, ["field", "lut"])
 
         return widgets.VBox(children=children)
 
@@ -329,6 +874,10 @@ class IsovalueParams(BaseWidget):
     spacing = CFloat(1.0).tag(sync=True)
     period = CFloat(3.0).tag(sync=True)
 
+    # Explicit isovalues for mode "list", looked up in a table
+    # computed by the plot, see IsosurfacePlot.isosurface_table
+    values = List(CFloat()).tag(sync=True)
+
     def dashboard(self):
         "Create linked widgets for isosurface parameters."
         children = []
@@ -0,0 +1,521 @@
+"""Readers and writers for tetrahedral meshes and fields on them.
+
+Supported formats, chosen by file suffix:
+
+    .npz            numpy archives, stored (uncompressed) members
+                    are memory mapped instead of read
+    .vtu            VTK XML unstructured grids with tetrahedron cells only
+    .xml, .xml.gz   dolfin XML meshes, without requiring dolfin
+    .unray          native format written by write_unray, always
+                    memory mapped and aligned for zero-copy access
+
+Single arrays in .npy files and raw binary arrays without
+a header can be memory mapped with read_npy and read_raw.
+
+The read_* functions return a dict with the arrays
+
+    {"cells": ..., "points": ..., "point_data": {name: ...}, "cell_data": {name: ...}}
+
+while load_mesh and load wrap these arrays in Mesh and Field widgets.
+"""
+
+import base64
+import gzip
+import json
+import mmap as memorymap
+import os
+import struct
+import zipfile
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+
+from .datawidgets import Mesh, Field
+
+
+# Magic bytes at the start of .unray files
+unray_magic = b"\x93UNRAY"
+
+# Version of the .unray format written by write_unray
+unray_format_version = 1
+
+# Alignment in bytes of arrays in .unray files
+unray_alignment = 64
+
+# Target dtypes of mesh and field arrays in .unray files
+_unray_dtypes = {"cells": np.int32, "points": np.float32}
+
+# VTK cell type id of linear tetrahedra
+_vtk_tetra = 10
+
+# Map from VTK data type names to numpy dtypes
+_vtk_dtypes = {
+    "Int8": "i1", "UInt8": "u1",
+    "Int16": "i2", "UInt16": "u2",
+    "Int32": "i4", "UInt32": "u4",
+    "Int64": "i8", "UInt64": "u8",
+    "Float32": "f4", "Float64": "f8",
+}
+
+
+def _mesh_data(cells, points, point_data=None, cell_data=None):
+    return {
+        "cells": cells,
+        "points": points,
+        "point_data": point_data or {},
+        "cell_data": cell_data or {},
+    }
+
+
+# ------------------------------------------------------
+# Numpy formats
+
+
+def _npz_member_offset(f, info):
+    "Find the offset of the data of a stored zip member."
+    # The local file header has its own name and extra field
+    # lengths, which may differ from those in the central directory
+    f.seek(info.header_offset)
+    header = f.read(30)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    return info.header_offset + 30 + name_length + extra_length
+
+
+def _read_npy_header(f):
+    "Read the header of a .npy file, returning (shape, fortran_order, dtype)."
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
+
+
+def _memmap_npy(filename, offset, shape, fortran_order, dtype):
+    if dtype.hasobject:
+        return None
+    order = "F" if fortran_order else "C"
+    if int(np.prod(shape)) == 0:
+        # mmap can't map empty ranges
+        return np.empty(shape, dtype=dtype, order=order)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape, order=order)
+
+
+def read_npz_arrays(filename, mmap=True):
+    """Read all arrays in a .npz file into a dict.
+
+    Stored members, as written by np.savez, are memory mapped
+    when mmap is True. Compressed members, as written by
+    np.savez_compressed, are always decompressed into memory.
+    """
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename
+            if not name.endswith(".npy"):
+                continue
+            key = name[:-len(".npy")]
+            if mmap and info.compress_type == zipfile.ZIP_STORED:
+                f.seek(_npz_member_offset(f, info))
+                shape, fortran_order, dtype = _read_npy_header(f)
+                array = _memmap_npy(filename, f.tell(), shape, fortran_order, dtype)
+                if array is not None:
+                    arrays[key] = array
+                    continue
+            with archive.open(info) as member:
+                arrays[key] = np.lib.format.read_array(member)
+    return arrays
+
+
+def read_npy(filename, mmap=True):
+    "Read an array from a .npy file, memory mapped when mmap is True."
+    return np.load(filename, mmap_mode="r" if mmap else None)
+
+
+def read_raw(filename, dtype, shape=None, offset=0):
+    """Memory map a raw binary array without header.
+
+    The shape defaults to a flat array of all remaining
+    items in the file, and may contain a single -1 entry.
+    """
+    dtype = np.dtype(dtype)
+    count = (os.path.getsize(filename) - offset) // dtype.itemsize
+    if shape is None:
+        shape = (count,)
+    shape = tuple(shape)
+    if -1 in shape:
+        known = int(np.prod([n for n in shape if n != -1]))
+        shape = tuple(count // known if n == -1 else n for n in shape)
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+
+
+def _split_arrays(arrays):
+    "Sort arrays into point and cell data by prefix, or by length."
+    cells = arrays.pop("cells")
+    points = arrays.pop("points")
+    point_data = {}
+    cell_data = {}
+    for name, array in arrays.items():
+        if name.startswith("point_data/"):
+            point_data[name[len("point_data/"):]] = array
+        elif name.startswith("cell_data/"):
+            cell_data[name[len("cell_data/"):]] = array
+        elif len(array) == len(points):
+            point_data[name] = array
+        elif len(array) == len(cells):
+            cell_data[name] = array
+    return _mesh_data(cells, points, point_data, cell_data)
+
+
+def read_npz(filename, mmap=True):
+    """Read a mesh from a .npz file.
+
+    The file must contain the arrays "cells" and "points".
+    Arrays named "point_data/<name>" or "cell_data/<name>" are
+    read as fields, as are other arrays with one entry per
+    point or per cell.
+    """
+    arrays = read_npz_arrays(filename, mmap=mmap)
+    if "cells" not in arrays or "points" not in arrays:
+        raise ValueError("Expecting arrays 'cells' and 'points' in %r." % (filename,))
+    return _split_arrays(arrays)
+
+
+# ------------------------------------------------------
+# VTK XML unstructured grid format
+
+
+def _vtu_array_shape(element, count):
+    components = int(element.get("NumberOfComponents", 1))
+    return (count, components) if components > 1 else (count,)
+
+
+class _VTUReader(object):
+    "Decoder for the data array encodings of a single .vtu file."
+
+    def __init__(self, filename, mmap):
+        self.filename = filename
+
+        with open(filename, "rb") as f:
+            if mmap:
+                content = memorymap.mmap(f.fileno(), 0, access=memorymap.ACCESS_READ)
+            else:
+                content = f.read()
+
+        # Raw appended data is not valid XML, cut it out before parsing
+        # and keep a view of it, such that uncompressed arrays can be
+        # read directly from the mapped file
+        self.appended = None
+        start = content.find(b"<AppendedData")
+        if start >= 0:
+            begin = content.find(b"_", content.find(b">", start)) + 1
+            end = content.rfind(b"</AppendedData>")
+            self.appended = memoryview(content)[begin:end]
+            content = content[:begin] + content[end:]
+        else:
+            content = content[:]
+        self.root = ElementTree.fromstring(content)
+
+        if self.root.get("type") != "UnstructuredGrid":
+            raise ValueError("Expecting an UnstructuredGrid in %r." % (filename,))
+        self.byte_order = "<" if self.root.get("byte_order", "LittleEndian") == "LittleEndian" else ">"
+        self.header_dtype = np.dtype(self.byte_order + _vtk_dtypes[self.root.get("header_type", "UInt32")])
+        self.compressed = self.root.get("compressor") is not None
+        if self.compressed and self.root.get("compressor") != "vtkZLibDataCompressor":
+            raise ValueError("Unsupported compressor %r in %r." % (self.root.get("compressor"), filename))
+
+        appended = self.root.find("AppendedData")
+        self.appended_encoding = appended.get("encoding", "raw") if appended is not None else None
+
+        # Base64 appended arrays are not delimited, find where each ends
+        offsets = sorted({int(e.get("offset")) for e in self.root.iter("DataArray")
+                          if e.get("format") == "appended"})
+        self.appended_ends = dict(zip(offsets, offsets[1:] + [None]))
+
+    def _header(self, data, count):
+        return np.frombuffer(data, dtype=self.header_dtype, count=count).astype(np.int64)
+
+    def _decompress(self, header, data):
+        "Decompress zlib blocks following a header of (num_blocks, block_size, last_size, sizes...)."
+        sizes = header[3:]
+        blocks = []
+        offset = 0
+        for size in sizes:
+            blocks.append(zlib.decompress(data[offset:offset + size]))
+            offset += size
+        return b"".join(blocks)
+
+    def _decode_base64(self, text):
+        "Decode base64 data, returning the decoded bytes of the array."
+        text = b"".join(bytes(text).split())
+        hsize = self.header_dtype.itemsize
+        if not self.compressed:
+            data = base64.b64decode(text)
+            nbytes = self._header(data, 1)[0]
+            return data[hsize:hsize + nbytes]
+        # The compression header is encoded separately from the data,
+        # decode its fixed part first to find its full length
+        fixed = base64.b64decode(text[:4 * ((3 * hsize + 2) // 3)])
+        num_blocks = self._header(fixed, 1)[0]
+        header_length = 4 * (((3 + num_blocks) * hsize + 2) // 3)
+        header = self._header(base64.b64decode(text[:header_length]), 3 + num_blocks)
+        return self._decompress(header, base64.b64decode(text[header_length:]))
+
+    def _read_appended(self, offset):
+        "Read raw appended data, as a view of the file if uncompressed."
+        hsize = self.header_dtype.itemsize
+        if not self.compressed:
+            nbytes = self._header(self.appended[offset:offset + hsize], 1)[0]
+            return self.appended[offset + hsize:offset + hsize + nbytes]
+        num_blocks = self._header(self.appended[offset:offset + hsize], 1)[0]
+        header = self._header(self.appended[offset:offset + (3 + num_blocks) * hsize], 3 + num_blocks)
+        start = offset + (3 + num_blocks) * hsize
+        return self._decompress(header, self.appended[start:start + int(header[3:].sum())])
+
+    def read_array(self, element, count=None):
+        "Read a DataArray element, with count tuples if known."
+        dtype = np.dtype(self.byte_order + _vtk_dtypes[element.get("type")])
+        fmt = element.get("format", "ascii")
+        if fmt == "ascii":
+            values = np.array((element.text or "").split(), dtype=dtype)
+        elif fmt == "binary":
+            values = np.frombuffer(self._decode_base64(element.text.encode("ascii")), dtype=dtype)
+        elif fmt == "appended":
+            offset = int(element.get("offset"))
+            if self.appended_encoding == "base64":
+                text = self.appended[offset:self.appended_ends[offset]]
+                values = np.frombuffer(self._decode_base64(text), dtype=dtype)
+            else:
+                values = np.frombuffer(self._read_appended(offset), dtype=dtype)
+        else:
+            raise ValueError("Unsupported DataArray format %r in %r." % (fmt, self.filename))
+        if count is None:
+            count = len(values) // int(element.get("NumberOfComponents", 1))
+        return values.reshape(_vtu_array_shape(element, count))
+
+    def read_piece(self, piece):
+        num_points = int(piece.get("NumberOfPoints"))
+        num_cells = int(piece.get("NumberOfCells"))
+
+        points = self.read_array(piece.find("Points/DataArray"), num_points)
+
+        cells = piece.find("Cells")
+        arrays = {e.get("Name"): e for e in cells.findall("DataArray")}
+        types = self.read_array(arrays["types"], num_cells)
+        if np.any(types != _vtk_tetra):
+            raise ValueError("Only tetrahedron cells are supported, found VTK cell types %s in %r."
+                % (sorted(set(np.unique(types)) - {_vtk_tetra}), self.filename))
+        offsets = self.read_array(arrays["offsets"], num_cells)
+        if np.any(offsets != 4 * np.arange(1, num_cells + 1)):
+            raise ValueError("Invalid cell offsets in %r." % (self.filename,))
+        connectivity = self.read_array(arrays["connectivity"], 4 * num_cells)
+
+        point_data = {}
+        for e in piece.findall("PointData/DataArray"):
+            point_data[e.get("Name")] = self.read_array(e, num_points)
+        cell_data = {}
+        for e in piece.findall("CellData/DataArray"):
+            cell_data[e.get("Name")] = self.read_array(e, num_cells)
+
+        return _mesh_data(connectivity.reshape((num_cells, 4)), points, point_data, cell_data)
+
+
+def _concatenate_pieces(pieces):
+    "Join pieces into a single mesh, renumbering vertices."
+    if len(pieces) == 1:
+        return pieces[0]
+    offsets = np.cumsum([0] + [len(p["points"]) for p in pieces[:-1]])
+    cells = np.concatenate([p["cells"] + offset for p, offset in zip(pieces, offsets)])
+    points = np.concatenate([p["points"] for p in pieces])
+    point_data = {}
+    cell_data = {}
+    for name in pieces[0]["point_data"]:
+        if all(name in p["point_data"] for p in pieces):
+            point_data[name] = np.concatenate([p["point_data"][name] for p in pieces])
+    for name in pieces[0]["cell_data"]:
+        if all(name in p["cell_data"] for p in pieces):
+            cell_data[name] = np.concatenate([p["cell_data"][name] for p in pieces])
+    return _mesh_data(cells, points, point_data, cell_data)
+
+
+def read_vtu(filename, mmap=True):
+    """Read a mesh with point and cell data from a .vtu file.
+
+    Handles ascii, inline binary and appended data arrays, with or
+    without zlib compression. Uncompressed raw appended arrays are
+    views of the memory mapped file when mmap is True. All cells must
+    be linear tetrahedra, files with multiple pieces are joined.
+    """
+    reader = _VTUReader(filename, mmap)
+    pieces = reader.root.findall("UnstructuredGrid/Piece")
+    return _concatenate_pieces([reader.read_piece(piece) for piece in pieces])
+
+
+# ------------------------------------------------------
+# dolfin XML format
+
+
+def read_dolfin_xml(filename):
+    """Read a tetrahedral mesh from a dolfin .xml or .xml.gz file.
+
+    This replaces the dolfin dependency of data/mesh2npz.py,
+    parsing the file incrementally without building a full XML tree.
+    """
+    opener = gzip.open if filename.endswith(".gz") else open
+    points = None
+    cells = None
+    with opener(filename, "rb") as f:
+        for event, element in ElementTree.iterparse(f, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == "mesh" and element.get("celltype", "tetrahedron") != "tetrahedron":
+                    raise ValueError("Only tetrahedron cells are supported, found %r in %r."
+                        % (element.get("celltype"), filename))
+                elif tag == "vertices":
+                    points = np.zeros((int(element.get("size")), 3), dtype=np.float64)
+                elif tag == "cells":
+                    cells = np.zeros((int(element.get("size")), 4), dtype=np.int32)
+            else:
+                if tag == "vertex":
+                    points[int(element.get("index"))] = [
+                        float(element.get(x, 0.0)) for x in ("x", "y", "z")]
+                    element.clear()
+                elif tag == "tetrahedron":
+                    cells[int(element.get("index"))] = [
+                        int(element.get(v)) for v in ("v0", "v1", "v2", "v3")]
+                    element.clear()
+    if points is None or cells is None:
+        raise ValueError("Expecting vertices and cells in %r." % (filename,))
+    return _mesh_data(cells, points)
+
+
+# ------------------------------------------------------
+# Native unray format
+
+
+def _aligned(offset):
+    return -(-offset // unray_alignment) * unray_alignment
+
+
+def write_unray(filename, cells, points, point_data=None, cell_data=None, chunk_size=1 << 20):
+    """Write a mesh with point and cell data to a native .unray file.
+
+    The file starts with a JSON header describing each array,
+    followed by the arrays in binary with aligned offsets such that
+    read_unray can memory map them directly. Cells are stored as
+    int32 and all other arrays as float32.
+
+    Arrays are converted and written in chunks of chunk_size rows,
+    so memory mapped or float64 inputs of any size can be written
+    without converting whole arrays in memory.
+    """
+    arrays = [("cells", cells), ("points", points)]
+    arrays += [("point_data/" + name, a) for name, a in sorted((point_data or {}).items())]
+    arrays += [("cell_data/" + name, a) for name, a in sorted((cell_data or {}).items())]
+
+    # Lay out arrays relative to the end of the header
+    entries = []
+    offset = 0
+    for name, array in arrays:
+        dtype = np.dtype(_unray_dtypes.get(name, np.float32))
+        shape = np.shape(array)
+        entries.append({"name": name, "dtype": dtype.str, "shape": list(shape), "offset": offset})
+        offset = _aligned(offset + dtype.itemsize * int(np.prod(shape)))
+
+    header = json.dumps({"version": unray_format_version, "arrays": entries}).encode("utf-8")
+    prefix_length = len(unray_magic) + 4
+    data_start = _aligned(prefix_length + len(header))
+    header = header.ljust(data_start - prefix_length, b" ")
+
+    with open(filename, "wb") as f:
+        f.write(unray_magic)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for (name, array), entry in zip(arrays, entries):
+            f.seek(data_start + entry["offset"])
+            dtype = np.dtype(entry["dtype"])
+            rows = max(1, chunk_size)
+            for i in range(0, len(array), rows):
+                chunk = np.ascontiguousarray(array[i:i + rows], dtype=dtype)
+                f.write(memoryview(chunk).cast("B"))
+        f.truncate(data_start + offset)
+
+
+def read_unray(filename, mmap=True):
+    "Read a mesh with point and cell data from a native .unray file."
+    with open(filename, "rb") as f:
+        if f.read(len(unray_magic)) != unray_magic:
+            raise ValueError("Not a .unray file: %r." % (filename,))
+        header_length, = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    if header["version"] > unray_format_version:
+        raise ValueError("Unsupported .unray format version %d in %r." % (header["version"], filename))
+    data_start = len(unray_magic) + 4 + header_length
+
+    arrays = {}
+    for entry in header["arrays"]:
+        dtype = np.dtype(entry["dtype"])
+        shape = tuple(entry["shape"])
+        offset = data_start + entry["offset"]
+        if int(np.prod(shape)) == 0:
+            array = np.empty(shape, dtype=dtype)
+        elif mmap:
+            array = np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape)
+        else:
+            array = np.fromfile(filename, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+        arrays[entry["name"]] = array
+    return _split_arrays(arrays)
+
+
+# ------------------------------------------------------
+# Dispatch by file suffix
+
+
+_readers = {
+    "npz": read_npz,
+    "vtu": read_vtu,
+    "xml": lambda filename, mmap=True: read_dolfin_xml(filename),
+    "unray": read_unray,
+}
+
+
+def _guess_format(filename):
+    name = filename[:-len(".gz")] if filename.endswith(".gz") else filename
+    return os.path.splitext(name)[1].lstrip(".").lower()
+
+
+def read(filename, format=None, mmap=True):
+    """Read mesh and field arrays from a file.
+
+    The format is guessed from the file suffix if not given,
+    one of "npz", "vtu", "xml" (dolfin) or "unray".
+    """
+    format = format or _guess_format(filename)
+    if format not in _readers:
+        raise ValueError("Unknown mesh format %r, expecting one of %s."
+            % (format, ", ".join(sorted(_readers))))
+    return _readers[format](filename, mmap=mmap)
+
+
+def load_mesh(filename, format=None, mmap=True):
+    "Read a Mesh from a file, ignoring any field data."
+    data = read(filename, format=format, mmap=mmap)
+    return Mesh(cells=data["cells"], points=data["points"])
+
+
+def load(filename, format=None, mmap=True):
+    """Read a Mesh and its scalar fields from a file.
+
+    Returns (mesh, fields) where fields is a dict of Field widgets,
+    with space "P1" for point data and "P0" for cell data.
+    Multicomponent arrays are skipped, use read() to access them.
+    """
+    data = read(filename, format=format, mmap=mmap)
+    mesh = Mesh(cells=data["cells"], points=data["points"])
+    fields = {}
+    for space, arrays in (("P1", data["point_data"]), ("P0", data["cell_data"])):
+        for name, values in arrays.items():
+            if np.ndim(values) == 1:
+                fields[name] = Field(mesh=mesh, values=values, space=space)
+    return mesh, fields
@@ -0,0 +1,108 @@
+"""Utilities for lookup tables."""
+
+import numpy as np
+
+
+def sample_lut(values, x):
+    """Evaluate a lookup table at x in [0, 1] the way
+    the frontend samples it from a linearly filtered texture.
+
+    Entry i of values is placed at the texel center (i + 0.5) / n,
+    and values are clamped to the first and last entries outside.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    centers = (np.arange(n) + 0.5) / n
+    if values.ndim == 1:
+        return np.interp(x, centers, values)
+    return np.stack([np.interp(x, centers, v) for v in values.T], axis=-1)
+
+
+def preintegrate_lut(values, size=128):
+    """Pre-integrate a lookup table over linear segments.
+
+    Returns a table with
+
+        table[j, i] = int_0^1 lut((1 - r) * f_i + r * f_j) dr
+
+    for f_i = (i + 0.5) / size, i.e. the mean of the lookup table along
+    a segment where the scaled function value varies linearly from f_i
+    to f_j. Laid out such that sampling a size x size texture of the
+    table at (f0, f1) gives the mean from f0 to f1.
+
+    The integrals are computed from cumulative sums of the lookup
+    table sampled with 4 times the resolution of the table.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    resolution = 4 * max(len(values), size)
+    x = np.linspace(0.0, 1.0, resolution + 1)
+    y = sample_lut(values, x)
+
+    # Antiderivative of the lookup table by the trapezoidal rule
+    antiderivative = np.zeros_like(y)
+    antiderivative[1:] = np.cumsum(0.5 * (y[1:] + y[:-1]), axis=0) / resolution
+
+    f = (np.arange(size) + 0.5) / size
+    if values.ndim == 1:
+        F = np.interp(f, x, antiderivative)
+    else:
+        F = np.stack([np.interp(f, x, a) for a in antiderivative.T], axis=-1)
+
+    # Mean value (F(f1) - F(f0)) / (f1 - f0), with the
+    # value of the lookup table itself on the diagonal
+    df = f[:, None] - f[None, :]
+    diagonal = df == 0
+    df[diagonal] = 1.0
+    if values.ndim > 1:
+        df = df[..., None]
+        diagonal = diagonal[..., None]
+    table = (F[:, None] - F[None, :]) / df
+    table = np.where(diagonal, sample_lut(values, f)[None, :], table)
+    return table.astype(np.float32)
+
+
+def isosurface_table(isovalues, value_range, lut=None, size=256):
+    """Tabulate the first isovalue along a segment between two values.
+
+    Returns a size x size x 4 table with table[j, i, 3] the first of the
+    isovalues, scaled to [0, 1] over value_range, found when moving from
+    a value in [i, i + 1] / size towards a value in [j, j + 1] / size,
+    or -1 if there is none. The colors lut(isovalue) are precomposed in
+    table[j, i, :3] if a color lookup table is given, otherwise zero.
+
+    Sampled with nearest filtering at the scaled (front, back) values,
+    the table gives the isosurface a ray segment hits first, unless
+    several isovalues are within 1 / size of each other.
+    """
+    lo, hi = value_range
+    scale = 1.0 / (hi - lo) if hi != lo else 1.0
+    scaled = np.unique((np.asarray(isovalues, dtype=np.float64) - lo) * scale)
+    scaled = scaled[(scaled >= 0.0) & (scaled <= 1.0)]
+    n = len(scaled)
+
+    # Bounds of the values in each texel
+    lower = np.arange(size) / size
+    upper = (np.arange(size) + 1) / size
+
+    # First isovalue above or below each front texel,
+    # padded with -1 where there is none
+    padded = np.concatenate((scaled, [-1.0]))
+    up = padded[np.minimum(np.searchsorted(scaled, lower, "left"), n)]
+    below = np.searchsorted(scaled, upper, "right") - 1
+    down = padded[np.where(below >= 0, below, n)]
+
+    # Pick by direction towards the back texel j and check
+    # that the isovalue is not beyond the back texel
+    front = np.arange(size)[None, :]
+    back = np.arange(size)[:, None]
+    increasing = back >= front
+    value = np.where(increasing, up[None, :], down[None, :])
+    inside = np.where(increasing, value <= upper[:, None], value >= lower[:, None])
+    value = np.where(inside & (value >= 0.0), value, -1.0)
+
+    table = np.zeros((size, size, 4), dtype=np.float32)
+    table[..., 3] = value
+    if lut is not None:
+        found = value >= 0.0
+        table[found, :3] = sample_lut(lut, value[found])
+    return table
@@ -0,0 +1,707 @@
+"""Vectorized utilities for tetrahedral mesh and field arrays.
+
+These are the Python side counterparts of js/src/meshutils.ts,
+operating on whole numpy arrays at once instead of looping over cells.
+"""
+
+import hashlib
+import warnings
+import numpy as np
+
+
+# Number of rows processed at a time by chunked operations,
+# bounding the size of temporary arrays independently of mesh size
+chunk_rows = 1 << 18
+
+
+def as_array(value, dtype, chunk_rows=chunk_rows):
+    """Convert value to an ndarray of the given dtype, sharing memory when possible.
+
+    Arrays of the right dtype, including memory maps and read-only
+    arrays, are returned as views without copying. So are objects
+    supporting the buffer protocol with a matching item type,
+    e.g. memoryviews or array.array. With a different dtype,
+    one array of the target dtype is allocated and filled
+    chunk_rows rows at a time, such that a memory mapped
+    input is never converted all at once.
+    """
+    dtype = np.dtype(dtype)
+    if not isinstance(value, np.ndarray):
+        try:
+            value = np.asarray(memoryview(value))
+        except TypeError:
+            return np.asarray(value, dtype=dtype)
+    if value.dtype == dtype:
+        return value.view(np.ndarray)
+    result = np.empty(value.shape, dtype=dtype)
+    if value.ndim == 0:
+        result[()] = value
+    for i in range(0, len(result) if value.ndim else 0, chunk_rows):
+        result[i:i + chunk_rows] = value[i:i + chunk_rows]
+    return result
+
+
+def content_hash(array, salt="", chunk_rows=chunk_rows):
+    """Compute a hex digest identifying the dtype, shape and contents of an array.
+
+    Uses blake2b over the array buffer, chunk_rows rows at a time
+    such that memory maps are hashed without being read all at once,
+    and copying only chunks of non-contiguous arrays.
+    The salt is mixed in, e.g. to distinguish encodings of equal arrays.
+    """
+    array = np.asarray(array)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(("%s %s %s" % (array.dtype.str, array.shape, salt)).encode("ascii"))
+    if array.ndim == 0:
+        h.update(array.tobytes())
+    for i in range(0, len(array) if array.ndim else 0, chunk_rows):
+        h.update(np.ascontiguousarray(array[i:i + chunk_rows]).data)
+    return h.hexdigest()
+
+
+def compute_tetrahedron_cell_orientations(cells, points, chunk_rows=chunk_rows):
+    """Compute orientation of tetrahedron cells.
+
+    Returns a boolean array which is True for each cell
+    with a negative Jacobian determinant, i.e. cells
+    that need reorientation.
+
+    Cells are processed chunk_rows at a time,
+    bounding the size of the temporary edge vectors.
+    """
+    cells = np.asarray(cells)
+    points = np.asarray(points)
+    reorient = np.empty(len(cells), dtype=bool)
+    for i in range(0, len(cells), chunk_rows):
+        c = cells[i:i + chunk_rows]
+        x0 = points[c[:, 0]]
+        e1 = points[c[:, 1]] - x0
+        e2 = points[c[:, 2]] - x0
+        e3 = points[c[:, 3]] - x0
+        det = np.einsum("ij,ij->i", e1, np.cross(e2, e3))
+        reorient[i:i + chunk_rows] = det < 0
+    return reorient
+
+
+def reorient_tetrahedron_cells(cells, reorient):
+    """Reorient tetrahedron cells such that det(J) is positive
+    by swapping the last two indices in each flagged cell.
+
+    NB! This happens in place.
+    """
+    flagged = cells[reorient]
+    cells[reorient, 2] = flagged[:, 3]
+    cells[reorient, 3] = flagged[:, 2]
+    return cells
+
+
+def oriented_tetrahedron_cells(cells, points):
+    """Return cells with positive Jacobian determinants.
+
+    The input array is returned as is if no cells need
+    reorientation, otherwise a reoriented copy is returned.
+    """
+    reorient = compute_tetrahedron_cell_orientations(cells, points)
+    if not reorient.any():
+        return cells
+    return reorient_tetrahedron_cells(np.array(cells), reorient)
+
+
+# Local vertices of the face opposite each local vertex,
+# ccw winded seen from outside a positively oriented cell
+tetrahedron_face_vertices = np.asarray([
+    [1, 2, 3],
+    [0, 3, 2],
+    [0, 1, 3],
+    [0, 2, 1],
+], dtype=np.int32)
+
+
+def compute_tetrahedron_faces(cells):
+    """Compute the vertices of all faces of tetrahedron cells.
+
+    Returns an array of shape (num_cells*4, 3) where row 4*i + j
+    holds the vertices of the face opposite local vertex j of cell i,
+    sorted in increasing order to identify faces shared by cells.
+    """
+    cells = np.asarray(cells)
+    faces = cells[:, tetrahedron_face_vertices].reshape(-1, 3)
+    faces.sort(axis=1)
+    return faces
+
+
+def face_keys(faces):
+    """Pack sorted face vertices into a single int64 key per face.
+
+    Sorting one key column is much faster than sorting rows
+    lexicographically. Returns None if vertex indices do not
+    fit in 21 bits, callers then fall back to sorting rows.
+    """
+    if len(faces) and faces.max() >= 1 << 21:
+        return None
+    faces = faces.astype(np.int64)
+    return (faces[:, 0] << 42) | (faces[:, 1] << 21) | faces[:, 2]
+
+
+def compute_cell_neighbors(cells):
+    """Compute cell adjacency of a tetrahedral mesh.
+
+    Returns an int32 array of shape (num_cells, 4) where entry (i, j)
+    is the cell sharing the face opposite local vertex j of cell i,
+    or -1 if the face is on the boundary.
+    """
+    faces = compute_tetrahedron_faces(cells)
+    neighbors = np.full(len(faces), -1, dtype=np.int32)
+    if len(faces):
+        # Sort faces such that shared faces become adjacent rows
+        keys = face_keys(faces)
+        if keys is not None:
+            order = np.argsort(keys, kind="stable")
+            sorted_keys = keys[order]
+            shared = np.nonzero(sorted_keys[1:] == sorted_keys[:-1])[0]
+        else:
+            order = np.lexsort(faces.T[::-1])
+            sorted_faces = faces[order]
+            shared = np.nonzero(np.all(sorted_faces[1:] == sorted_faces[:-1], axis=1))[0]
+        a = order[shared]
+        b = order[shared + 1]
+        neighbors[a] = b // 4
+        neighbors[b] = a // 4
+    return neighbors.reshape(-1, 4)
+
+
+def compute_boundary_cells(cells, indicators=None, neighbors=None):
+    """Find the cells that have a face on the visible surface of the mesh.
+
+    With indicators, faces between cells with different indicator
+    values count as surface faces as well, such that restricting a plot
+    to one indicator value shows the boundary of that region.
+    Neighbors from compute_cell_neighbors are computed if not given.
+
+    Returns the int32 indices of the boundary cells in increasing order.
+    For a mesh of N well shaped cells this is on the order of N^(2/3).
+    """
+    if neighbors is None:
+        neighbors = compute_cell_neighbors(cells)
+    neighbors = np.asarray(neighbors)
+    surface = neighbors < 0
+    if indicators is not None:
+        indicators = np.asarray(indicators)
+        neighbor_indicators = indicators[np.where(surface, 0, neighbors)]
+        surface |= neighbor_indicators != indicators[:, None]
+    return np.nonzero(surface.any(axis=1))[0].astype(np.int32)
+
+
+def compute_range(values, percentiles=(0.0, 100.0)):
+    """Compute the (min, max) range of field values, ignoring nans.
+
+    With percentiles other than (0, 100), the range is clipped
+    to the given percentiles for robustness against outliers.
+    Returns (0.0, 0.0) if there are no finite values.
+
+    The full range is computed without copying values,
+    while percentiles need a temporary copy.
+    """
+    values = np.asarray(values)
+    if values.size == 0:
+        return (0.0, 0.0)
+    lo, hi = percentiles
+    with warnings.catch_warnings():
+        # All nan values are handled below
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if lo <= 0.0 and hi >= 100.0:
+            lo, hi = np.nanmin(values), np.nanmax(values)
+        else:
+            lo, hi = np.nanpercentile(values, [lo, hi])
+    # Only scanning the values again if the range is suspicious
+    if not (np.isfinite(lo) and np.isfinite(hi)) and not np.isfinite(values).any():
+        return (0.0, 0.0)
+    return (float(lo), float(hi))
+
+
+def cluster_vertices(points, resolution):
+    """Cluster vertices by the cells of a uniform grid over their bounding box.
+
+    The grid has resolution cells along the longest axis
+    and about as wide cells along the other axes.
+    Returns (clusters, num_clusters) where clusters[i] is
+    the consecutively numbered cluster of vertex i.
+    """
+    points = np.asarray(points)
+    lo = points.min(axis=0)
+    extent = points.max(axis=0) - lo
+    h = max(float(extent.max()) / resolution, np.finfo(np.float32).tiny)
+    dims = np.maximum(np.ceil(extent / h), 1).astype(np.int64)
+    ijk = np.minimum(((points - lo) / h).astype(np.int64), dims - 1)
+    keys = (ijk[:, 0] * dims[1] + ijk[:, 1]) * dims[2] + ijk[:, 2]
+    _, clusters = np.unique(keys, return_inverse=True)
+    clusters = clusters.ravel().astype(np.int32)
+    return clusters, int(clusters.max()) + 1 if len(clusters) else 0
+
+
+def _cluster_cells(cells, clusters):
+    "Map cells to clusters, dropping collapsed and duplicate cells."
+    clustered = clusters[cells]
+    s = np.sort(clustered, axis=1)
+    valid = np.nonzero(np.all(s[:, 1:] != s[:, :-1], axis=1))[0]
+    _, first, inverse = np.unique(s[valid], axis=0, return_index=True, return_inverse=True)
+    cell_map = np.full(len(cells), -1, dtype=np.int32)
+    cell_map[valid] = inverse.ravel()
+    return clustered[valid[first]], cell_map
+
+
+def decimate_tetrahedra(cells, points, target_cells, max_iterations=8):
+    """Coarsen a tetrahedral mesh to about target_cells cells by vertex clustering.
+
+    Vertices are clustered on a uniform grid, with resolution adjusted
+    until the number of cells is at most target_cells. Each cluster is
+    replaced by the mean of its vertices, and cells with fewer than four
+    distinct clusters are dropped.
+
+    Returns (coarse_cells, coarse_points, vertex_map, cell_map), where
+    vertex_map[i] is the coarse vertex of vertex i and cell_map[i] the
+    coarse cell of cell i, or -1 if cell i collapsed. Coarse cells
+    may have negative orientation.
+    """
+    cells = np.asarray(cells)
+    points = np.asarray(points)
+    num_cells = len(cells)
+    if num_cells <= target_cells:
+        return (cells, points,
+            np.arange(len(points), dtype=np.int32), np.arange(num_cells, dtype=np.int32))
+
+    # Initial guess assuming roughly uniform cells filling the bounding box,
+    # then adjust resolution by the cube root of the cell count ratio
+    resolution = max(1.0, (num_cells / 6.0) ** (1.0 / 3.0) * (target_cells / num_cells) ** (1.0 / 3.0))
+    best = None
+    for i in range(max_iterations):
+        clusters, num_clusters = cluster_vertices(points, resolution)
+        coarse_cells, cell_map = _cluster_cells(cells, clusters)
+        count = len(coarse_cells)
+        if count <= target_cells and (best is None or count > len(best[0])):
+            best = (coarse_cells, cell_map, clusters, num_clusters)
+        if 0.9 * target_cells <= count <= target_cells:
+            break
+        resolution *= (target_cells / max(count, 1)) ** (1.0 / 3.0) * (0.97 if count > target_cells else 1.0)
+    if best is None:
+        # Fall back to a single cluster, leaving no cells
+        best = (np.zeros((0, 4), dtype=cells.dtype), np.full(num_cells, -1, dtype=np.int32),
+                np.zeros(len(points), dtype=np.int32), 1)
+    coarse_cells, cell_map, clusters, num_clusters = best
+
+    counts = np.bincount(clusters, minlength=num_clusters)
+    coarse_points = np.empty((num_clusters, points.shape[1]), dtype=points.dtype)
+    for k in range(points.shape[1]):
+        coarse_points[:, k] = np.bincount(clusters, weights=points[:, k], minlength=num_clusters) / counts
+
+    # Drop clusters not used by any remaining cell
+    used = np.zeros(num_clusters, dtype=bool)
+    used[coarse_cells.ravel()] = True
+    renumber = np.cumsum(used, dtype=np.int32) - 1
+    renumber[~used] = -1
+    coarse_cells = renumber[coarse_cells].astype(cells.dtype)
+    return coarse_cells, coarse_points[used], renumber[clusters], cell_map
+
+
+def _mean_by_index(index, values, size):
+    "Mean of values grouped by index, ignoring entries with negative index."
+    keep = index >= 0
+    index = index[keep]
+    values = values[keep]
+    counts = np.maximum(np.bincount(index, minlength=size), 1)
+    result = np.empty((size,) + values.shape[1:], dtype=np.float64)
+    flat = values.reshape(len(values), -1)
+    result.reshape(size, -1)[:] = np.stack([
+        np.bincount(index, weights=flat[:, k], minlength=size) / counts
+        for k in range(flat.shape[1])], axis=1)
+    return result
+
+
+def decimate_values(values, space, cells, coarse_cells, vertex_map, cell_map):
+    """Transfer field values to a mesh coarsened by decimate_tetrahedra.
+
+    P1 values are averaged over each vertex cluster and P0 values over
+    the cells merged into each coarse cell. D1 values are averaged per
+    vertex cluster, so discontinuities within a cluster are smoothed.
+    Indicator values per cell (I3) take the value of one of the merged
+    cells. Values may have trailing dimensions, e.g. components.
+    """
+    values = np.asarray(values)
+    if space == "P1":
+        result = _mean_by_index(vertex_map, values, int(vertex_map.max()) + 1 if len(vertex_map) else 0)
+    elif space == "P0":
+        result = _mean_by_index(cell_map, values, len(coarse_cells))
+    elif space == "D1":
+        num_coarse_vertices = int(vertex_map.max()) + 1 if len(vertex_map) else 0
+        index = vertex_map[np.asarray(cells)].ravel()
+        result = _mean_by_index(index, values, num_coarse_vertices)[coarse_cells.ravel()]
+    elif space == "I3":
+        result = np.zeros((len(coarse_cells),) + values.shape[1:], dtype=values.dtype)
+        keep = cell_map >= 0
+        result[cell_map[keep]] = values[keep]
+        return result
+    else:
+        raise ValueError("Cannot decimate values in space %r." % (space,))
+    return result.astype(values.dtype)
+
+
+def extract_cells(cells, selected):
+    """Extract a submesh of the selected cells, renumbering the used vertices.
+
+    Selected may be a boolean mask or indices of cells.
+    Returns (sub_cells, vertex_indices, cell_indices), where vertex i
+    and cell j of the submesh are vertex_indices[i] and cell_indices[j]
+    of the original mesh.
+    """
+    cells = np.asarray(cells)
+    selected = np.asarray(selected)
+    if selected.dtype == bool:
+        cell_indices = np.flatnonzero(selected).astype(np.int32)
+    else:
+        cell_indices = selected.astype(np.int32)
+    sub_cells = cells[cell_indices]
+    vertex_indices, renumbered = np.unique(sub_cells, return_inverse=True)
+    sub_cells = renumbered.reshape(sub_cells.shape).astype(cells.dtype)
+    return sub_cells, vertex_indices.astype(np.int32), cell_indices
+
+
+def extract_values(values, space, vertex_indices, cell_indices):
+    """Slice field values to a submesh from extract_cells.
+
+    Values per vertex (P1, I0) are indexed by vertex, values per cell
+    (P0, I3) by cell, and values per cell vertex or cell facet (D1, I2)
+    by cell in blocks of four.
+    """
+    values = np.asarray(values)
+    if space in ("P1", "I0"):
+        return values[vertex_indices]
+    elif space in ("P0", "I3"):
+        return values[cell_indices]
+    elif space in ("D1", "I2"):
+        blocks = values.reshape((-1, 4) + values.shape[1:])
+        return blocks[cell_indices].reshape((-1,) + values.shape[1:])
+    raise ValueError("Cannot extract values in space %r." % (space,))
+
+
+def _spread_bits(x):
+    "Spread the low 10 bits of x to every third bit."
+    x = x.astype(np.int64) & 0x3ff
+    x = (x | (x << 16)) & 0x30000ff
+    x = (x | (x << 8)) & 0x300f00f
+    x = (x | (x << 4)) & 0x30c30c3
+    x = (x | (x << 2)) & 0x9249249
+    return x
+
+
+def _morton_codes(x, lower, upper):
+    "Morton codes of points x quantized to 10 bits per axis within the box [lower, upper]."
+    extent = upper - lower
+    q = np.clip(np.floor(1023 * (x - lower) / np.where(extent > 0, extent, 1.0)), 0, 1023)
+    return _spread_bits(q[:, 0]) | (_spread_bits(q[:, 1]) << 1) | (_spread_bits(q[:, 2]) << 2)
+
+
+def _cell_bounds(cells, points, chunk_rows=chunk_rows):
+    "Bounding boxes of cells as (lower, upper) arrays of shape (num_cells, 3)."
+    lower = np.empty((len(cells), 3))
+    upper = np.empty((len(cells), 3))
+    for i in range(0, len(cells), chunk_rows):
+        x = points[cells[i:i + chunk_rows]]
+        lower[i:i + chunk_rows] = x.min(axis=1)
+        upper[i:i + chunk_rows] = x.max(axis=1)
+    return lower, upper
+
+
+def build_cell_tree(cells, points, leaf_size=4):
+    """Build a bounding volume hierarchy over tetrahedron cells.
+
+    Cells are sorted along a Morton curve through their bounding box
+    centers and grouped in leaves of leaf_size consecutive cells. The
+    leaves are padded to a power of two and merged pairwise into a
+    complete binary tree, stored as arrays without any pointers.
+
+    Returns (order, levels), where order lists the cells of each leaf
+    in blocks of leaf_size padded with -1, and levels holds the
+    (lower, upper) bounds of the nodes of each level from the root
+    down to the leaves. Node i of a level has children 2 * i and
+    2 * i + 1 in the next level.
+    """
+    cells = np.asarray(cells)
+    points = np.asarray(points, dtype=np.float64)
+    lower, upper = _cell_bounds(cells, points)
+
+    # Sort by Morton codes of bounding box centers
+    centers = 0.5 * (lower + upper)
+    if len(cells):
+        codes = _morton_codes(centers, centers.min(axis=0), centers.max(axis=0))
+    else:
+        codes = np.zeros(0, dtype=np.int64)
+    order = np.argsort(codes, kind="stable")
+
+    num_leaves = 1 << int(np.ceil(np.log2(max(1, -(-len(cells) // leaf_size)))))
+    size = num_leaves * leaf_size
+    padded = np.full(size, -1, dtype=np.int64)
+    padded[:len(cells)] = order
+    leaf_lower = np.full((size, 3), np.inf)
+    leaf_upper = np.full((size, 3), -np.inf)
+    leaf_lower[:len(cells)] = lower[order]
+    leaf_upper[:len(cells)] = upper[order]
+
+    levels = [(leaf_lower.reshape(num_leaves, leaf_size, 3).min(axis=1),
+               leaf_upper.reshape(num_leaves, leaf_size, 3).max(axis=1))]
+    while len(levels[0][0]) > 1:
+        lower, upper = levels[0]
+        levels.insert(0, (lower.reshape(-1, 2, 3).min(axis=1), upper.reshape(-1, 2, 3).max(axis=1)))
+    return padded, levels
+
+
+def tetrahedron_barycentric_coordinates(vertices, points):
+    """Compute barycentric coordinates of points in tetrahedra.
+
+    Takes vertices of shape (n, 4, 3) and points of shape (n, 3),
+    returns coordinates of shape (n, 4) relative to the local vertex
+    order. Coordinates in degenerate cells are not finite.
+    """
+    x0 = vertices[:, 0]
+    e1 = vertices[:, 1] - x0
+    e2 = vertices[:, 2] - x0
+    e3 = vertices[:, 3] - x0
+    r = points - x0
+    n1 = np.cross(e2, e3)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv = 1.0 / np.einsum("ij,ij->i", e1, n1)
+        l1 = np.einsum("ij,ij->i", r, n1) * inv
+        l2 = np.einsum("ij,ij->i", e1, np.cross(r, e3)) * inv
+        l3 = np.einsum("ij,ij->i", e1, np.cross(e2, r)) * inv
+    return np.stack([1.0 - l1 - l2 - l3, l1, l2, l3], axis=1)
+
+
+def locate_points(tree, cells, points, queries, tolerance=1e-10, chunk_rows=1 << 16):
+    """Find the cells containing query points.
+
+    Takes a tree from build_cell_tree over the same cells and points.
+    Returns (cell indices, barycentric coordinates) with -1 and zero
+    coordinates for queries outside the mesh. Points on a face shared
+    by several cells get the cell where they are furthest inside, and
+    points within tolerance outside a cell in barycentric coordinates
+    count as inside.
+
+    Queries are sorted along a Morton curve, and the tree is traversed
+    breadth first for chunk_rows neighbouring queries at a time, testing
+    the boxes of all candidate nodes of a level at once.
+    """
+    order, levels = tree
+    cells = np.asarray(cells)
+    points = np.asarray(points, dtype=np.float64)
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+    leaf_size = len(order) // len(levels[-1][0])
+    found = np.full(len(queries), -1, dtype=np.int32)
+    coordinates = np.zeros((len(queries), 4))
+    root_lower, root_upper = levels[0]
+    if not len(queries) or not (root_lower <= root_upper).all():
+        return found, coordinates
+    sorting = np.argsort(_morton_codes(queries, root_lower[0], root_upper[0]), kind="stable")
+
+    for start in range(0, len(queries), chunk_rows):
+        indices = sorting[start:start + chunk_rows]
+        p = np.take(queries, indices, axis=0)
+
+        # Candidate pairs of query and node, starting at the root
+        q = np.arange(len(p))
+        node = np.zeros(len(p), dtype=np.int64)
+        for i, (lower, upper) in enumerate(levels):
+            if i > 0:
+                q = np.repeat(q, 2)
+                node = (2 * node[:, None] + np.arange(2)).ravel()
+            # Using take, which gathers rows much faster than indexing
+            x = np.take(p, q, axis=0)
+            inside = (np.take(lower, node, axis=0) <= x) & (x <= np.take(upper, node, axis=0))
+            inside = inside[:, 0] & inside[:, 1] & inside[:, 2]
+            q = q[inside]
+            node = node[inside]
+
+        # Test each cell of candidate leaves
+        q = np.repeat(q, leaf_size)
+        c = np.take(order, (leaf_size * node[:, None] + np.arange(leaf_size)).ravel())
+        valid = c >= 0
+        q = q[valid]
+        c = c[valid]
+        vertices = np.take(points, np.take(cells, c, axis=0), axis=0)
+        lam = tetrahedron_barycentric_coordinates(vertices, np.take(p, q, axis=0))
+        margin = np.minimum(np.minimum(lam[:, 0], lam[:, 1]), np.minimum(lam[:, 2], lam[:, 3]))
+        hit = margin >= -tolerance
+        q, c, lam, margin = q[hit], c[hit], lam[hit], margin[hit]
+
+        # Keep the cell furthest inside for each query
+        best = np.lexsort((-margin, q))
+        q, c, lam = q[best], c[best], lam[best]
+        first = np.ones(len(q), dtype=bool)
+        first[1:] = q[1:] != q[:-1]
+        found[indices[q[first]]] = c[first]
+        coordinates[indices[q[first]]] = lam[first]
+    return found, coordinates
+
+
+def interpolate_values(values, space, cells, cell_indices, coordinates):
+    """Evaluate field values at points located in cells.
+
+    Takes cell indices and barycentric coordinates from locate_points,
+    and returns values as float64 with NaN for points outside the mesh
+    (cell index -1). Values per cell (P0) are constant in each cell,
+    while values per vertex (P1) and per cell vertex (D1) are
+    interpolated linearly, the latter in blocks of four per cell.
+    """
+    values = np.asarray(values)
+    cell_indices = np.asarray(cell_indices)
+    inside = cell_indices >= 0
+    c = np.where(inside, cell_indices, 0)
+    if space == "P0":
+        result = np.take(values, c).astype(np.float64)
+    elif space == "P1":
+        result = np.einsum("ij,ij->i", coordinates, np.take(values, np.take(cells, c, axis=0)))
+    elif space == "D1":
+        result = np.einsum("ij,ij->i", coordinates, np.take(values.reshape(-1, 4), c, axis=0))
+    else:
+        raise ValueError("Cannot interpolate values in space %r." % (space,))
+    result[~inside] = np.nan
+    return result
+
+
+def compute_cell_ranges(values, space, cells, chunk_rows=chunk_rows):
+    """Compute the minimum and maximum of field values in each cell.
+
+    Returns (lower, upper) arrays with one value per cell. Values per
+    cell (P0) are their own range, values per vertex (P1) are gathered
+    chunk_rows cells at a time, and values per cell vertex (D1) are
+    taken in blocks of four per cell.
+    """
+    values = np.asarray(values)
+    if space == "P0":
+        return values, values
+    elif space == "D1":
+        blocks = values.reshape(-1, 4)
+        return blocks.min(axis=1), blocks.max(axis=1)
+    elif space != "P1":
+        raise ValueError("Cannot compute cell ranges of values in space %r." % (space,))
+    cells = np.asarray(cells)
+    lower = np.empty(len(cells), dtype=values.dtype)
+    upper = np.empty(len(cells), dtype=values.dtype)
+    for i in range(0, len(cells), chunk_rows):
+        v = np.take(values, cells[i:i + chunk_rows])
+        lower[i:i + chunk_rows] = v.min(axis=1)
+        upper[i:i + chunk_rows] = v.max(axis=1)
+    return lower, upper
+
+
+def build_interval_index(lower, upper, num_classes=16):
+    """Index the intervals [lower[i], upper[i]] for finding those containing a value.
+
+    Intervals are split in num_classes classes by length, halving the
+    maximum length from one class to the next, with all shorter
+    intervals in the last class. Within each class the intervals are
+    sorted by lower bound, such that those containing a value are
+    found among the ones with lower bound at most one maximum length
+    below the value, of which at least about half contain it.
+
+    Returns a list of (max_length, indices, lower, upper) per class
+    with the sorted bounds and the indices of the intervals.
+    """
+    lower = np.asarray(lower, dtype=np.float64)
+    upper = np.asarray(upper, dtype=np.float64)
+    lengths = upper - lower
+    longest = lengths.max() if len(lengths) else 0.0
+    with np.errstate(divide="ignore"):
+        classes = np.floor(np.log2(longest / lengths)) if longest > 0 else np.zeros(len(lengths))
+    classes = np.clip(np.nan_to_num(classes, posinf=num_classes), 0, num_classes - 1).astype(np.int64)
+
+    index = []
+    order = np.argsort(classes, kind="stable")
+    bounds = np.searchsorted(classes[order], np.arange(num_classes + 1))
+    for k in range(num_classes):
+        indices = order[bounds[k]:bounds[k + 1]]
+        if not len(indices):
+            continue
+        indices = indices[np.argsort(lower[indices], kind="stable")]
+        index.append((longest / 2.0**k, indices, lower[indices], upper[indices]))
+    return index
+
+
+def query_interval_index(index, values):
+    """Find the intervals containing any of the given values.
+
+    Takes an index from build_interval_index and returns the sorted
+    indices of the intervals as int32.
+    """
+    found = []
+    for value in np.atleast_1d(np.asarray(values, dtype=np.float64)):
+        for max_length, indices, lower, upper in index:
+            start = np.searchsorted(lower, value - max_length, "left")
+            stop = np.searchsorted(lower, value, "right")
+            candidates = slice(start, stop)
+            found.append(indices[candidates][upper[candidates] >= value])
+    if not found:
+        return np.zeros(0, dtype=np.int32)
+    return np.unique(np.concatenate(found)).astype(np.int32)
+
+
+# Local vertices of the edges of a tetrahedron
+tetrahedron_edges = np.asarray([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+
+
+def _build_slice_cases():
+    # Edges crossed by the zero level set for each combination of
+    # positive vertices, in order around the polygon, padded with -1
+    edge_numbers = {tuple(e): i for i, e in enumerate(tetrahedron_edges.tolist())}
+    def edge(a, b):
+        return edge_numbers[(min(a, b), max(a, b))]
+    cases = np.full((16, 4), -1, dtype=np.int64)
+    for mask in range(1, 15):
+        positive = [i for i in range(4) if mask >> i & 1]
+        negative = [i for i in range(4) if not mask >> i & 1]
+        if len(positive) == 1 or len(negative) == 1:
+            v, others = (positive[0], negative) if len(positive) == 1 else (negative[0], positive)
+            cases[mask, :3] = [edge(v, o) for o in others]
+        else:
+            a, b = positive
+            c, d = negative
+            cases[mask] = [edge(a, c), edge(a, d), edge(b, d), edge(b, c)]
+    return cases
+
+_slice_cases = _build_slice_cases()
+
+
+def slice_tetrahedra(distances):
+    """Cut tetrahedra along the zero level set of a linear function.
+
+    Takes the values of the function at the vertices of each cell,
+    shape (num_cells, 4), and returns (cell indices, coordinates) of
+    the triangles of the cross section, with one or two triangles per
+    cell crossing zero. Coordinates of shape (num_triangles, 3, 4) are
+    the barycentric coordinates of the triangle vertices in their cell,
+    see interpolate_values. Vertices exactly at zero count as negative.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    mask = (distances > 0).astype(np.int64) @ np.asarray([1, 2, 4, 8])
+    polygons = _slice_cases[mask]
+
+    # Barycentric coordinates of the crossing point on every edge,
+    # only meaningful on edges between a positive and a negative vertex
+    i, j = tetrahedron_edges.T
+    di = distances[:, i]
+    dj = distances[:, j]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = di / (di - dj)
+    coordinates = np.zeros((len(distances), 6, 4))
+    edges = np.arange(6)
+    coordinates[:, edges, i] = 1.0 - t
+    coordinates[:, edges, j] = t
+
+    # First triangle of each polygon, and a second one for quads
+    triangles = []
+    for corners in ([0, 1, 2], [0, 2, 3]):
+        cells = np.flatnonzero(polygons[:, corners[-1]] >= 0)
+        local = polygons[cells][:, corners]
+        triangles.append((cells, coordinates[cells[:, None], local]))
+    cells = np.concatenate([c for c, _ in triangles]).astype(np.int32)
+    coordinates = np.concatenate([x for _, x in triangles])
+    order = np.argsort(cells, kind="stable")
+    return cells[order], coordinates[order]
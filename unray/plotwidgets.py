@@ -3,7 +3,7 @@ import numpy as np
 import ipywidgets as widgets
 from ipywidgets import widget_serialization, register, Color
 
-from ipydatawidgets import DataUnion
+from ipydatawidgets import DataUnion, data_union_serialization, shape_constraints, get_union_array
 
 # Hack to make basic construction of objects work in tests
 # on travis while pythreejs branch is hard to install
@@ -13,17 +13,95 @@ try:
 except:
     Blackbox = widgets.Widget
 
-from traitlets import Unicode, CFloat
-from traitlets import Instance
+from traitlets import Unicode, CFloat, CInt, CBool, Enum, Union, Tuple, observe, validate
+from traitlets import Instance, TraitError
 
 from ._version import widget_module_name, EXTENSION_SPEC_VERSION
+from .lututils import isosurface_table
+from .meshutils import (
+    compute_cell_ranges, build_interval_index, query_interval_index,
+    slice_tetrahedra, interpolate_values,
+)
 
 from .datawidgets import (
-    Mesh, Field, ScalarValued, ScalarIndicators,
-    ColorValued, ColorField, WireframeParams, IsovalueParams,
+    Mesh, Field, FieldSeries, ScalarValued, ScalarIndicators,
+    ColorValued, ColorField, WireframeParams, IsovalueParams, ArrayColorMap,
 )
 
-from .datawidgets import _gather_dashboards, _make_accordion
+from .datawidgets import _gather_dashboards, _make_accordion, _copy_with_data, SharedDataUnion
+
+
+def _observe_dependencies(handler, previous, dependencies):
+    "Move handler from the previous to the new (widget, trait names) dependencies."
+    dependencies = [(w, names) for w, names in dependencies if w is not None]
+    for w, names in previous:
+        w.unobserve(handler, list(names))
+    for w, names in dependencies:
+        w.observe(handler, list(names))
+    return dependencies
+
+
+def _field_values(field):
+    "Values of field, of the current frame for a series."
+    values = get_union_array(field.values)
+    if isinstance(field, FieldSeries):
+        values = values[field.frame]
+    return values
+
+
+def _level_set(mesh, distances, cut_cells, field=None):
+    """Compute the triangles where a function linear in cells crosses zero.
+
+    Takes the values of the function at the vertices of the cells
+    cut_cells, shape (len(cut_cells), 4), and returns (triangles, values)
+    like SlicePlot.cross_section, with the values of field at the
+    triangle vertices, or None without a field.
+    """
+    cells = get_union_array(mesh.cells)
+    points = get_union_array(mesh.points)
+    triangle_cells, coordinates = slice_tetrahedra(distances)
+    triangle_cells = cut_cells[triangle_cells]
+    triangles = np.einsum("tvk,tkx->tvx", coordinates, points[cells[triangle_cells]])
+
+    values = None
+    if field is not None:
+        values = interpolate_values(_field_values(field), field.space, cells,
+            np.repeat(triangle_cells, 3), coordinates.reshape(-1, 4))
+        values = values.reshape(-1, 3)
+    return triangles, values
+
+
+def _isovalues(params, values):
+    """List the isovalues of params like the isosurface shader.
+
+    Modes "linear" and "log" give the levels spaced from params.value by
+    a fixed distance or ratio, within the range of values. Mode "sweep" depends on the time in the
+    browser and "power" has no spacing defined yet, so both are rejected.
+    """
+    value, spacing = params.value, params.spacing
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if params.mode == "single":
+        return [value]
+    elif params.mode == "list":
+        return list(params.values)
+    elif params.mode == "linear":
+        if spacing == 0.0 or not len(values):
+            return []
+        spacing = abs(spacing)
+        n = np.arange(np.ceil((values.min() - value) / spacing), np.floor((values.max() - value) / spacing) + 1)
+        return list(value + n * spacing)
+    elif params.mode == "log":
+        # Levels have the sign of value and accumulate towards zero,
+        # so only levels from the smallest ratio of any value count
+        ratios = values / value if value != 0.0 else values[:0]
+        ratios = ratios[ratios > 0.0]
+        if spacing <= 0.0 or spacing == 1.0 or not len(ratios):
+            return []
+        bounds = np.log([ratios.min(), ratios.max()]) / np.log(spacing)
+        n = np.arange(np.ceil(bounds.min()), np.floor(bounds.max()) + 1)
+        return list(value * spacing ** n)
+    raise NotImplementedError("Isovalues of mode %r are not supported." % (params.mode,))
 
 
 @register
@@ -39,6 +117,30 @@ class Plot(Blackbox):
     # TODO: Validate IndicatorField spaces: ["I3", "I2"]
     restrict = Instance(ScalarIndicators, allow_none=True).tag(sync=True, **widget_serialization)
 
+    def decimate(self, target_cells):
+        """Create a preview copy of this plot on meshes decimated to at most target_cells cells.
+
+        All meshes and fields referenced by the plot are replaced by
+        their decimated versions, while constants, lookup tables and
+        parameters are shared with this plot.
+        """
+        return _copy_with_data(self, lambda data: data.decimate(target_cells), Blackbox)
+
+    def compact(self):
+        """Create a copy of this plot with restrict applied on the Python side.
+
+        The mesh and all fields are replaced by their restriction to the
+        selected cells, such that only those are sent to the frontend and
+        drawn, instead of discarding the other cells while rendering.
+        Requires restrict to use cell indicators (I3), submeshes are
+        cached such that plots with the same restriction share them.
+        """
+        if self.restrict is None:
+            return self
+        indicators = self.restrict.field
+        value = self.restrict.value
+        return _copy_with_data(self, lambda data: data.extract(indicators, value), Blackbox, restrict=None)
+
 
 @register
 class SurfacePlot(Plot):
@@ -51,6 +153,39 @@ class SurfacePlot(Plot):
     # Wireframe parameters are packed in their own model, None means disabled
     wireframe = Instance(WireframeParams, allow_none=True).tag(sync=True, **widget_serialization)
 
+    # Only draw cells with a face on the surface, which are the only
+    # ones visible in an opaque surface plot. Set to False to draw all
+    # cells, e.g. when restricting to facet indicators (I2).
+    boundary_only = CBool(True)
+
+    # Indices of cells to draw, computed from mesh and restrict,
+    # None means all cells
+    boundary_cells = SharedDataUnion(None, dtype=np.int32, shape_constraint=shape_constraints(None),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    # Widgets and traits observed to keep the boundary up to date
+    _boundary_dependencies = ()
+
+    @observe("mesh", "restrict", "boundary_only")
+    def _update_boundary_cells(self, change):
+        # Keep boundary up to date when the cells of the mesh or the indicators change
+        indicators = self.restrict.field if self.restrict is not None else None
+        dependencies = [
+            (self.mesh, ("cells",)),
+            (self.restrict, ("field", "value")),
+            (indicators, ("values",)),
+        ]
+        self._boundary_dependencies = _observe_dependencies(
+            self._update_boundary_cells, self._boundary_dependencies, dependencies)
+
+        boundary_cells = None
+        if self.boundary_only and self.mesh is not None:
+            if indicators is None:
+                boundary_cells = self.mesh.compute_boundary_cells()
+            elif indicators.space == "I3" and indicators.mesh is self.mesh:
+                boundary_cells = self.mesh.compute_boundary_cells(indicators)
+        self.set_trait("boundary_cells", boundary_cells)
+
     def dashboard(self):
         "Create a combined dashboard for this plot."
         names = ["restrict", "color", "wireframe"]
@@ -67,11 +202,129 @@ class IsosurfacePlot(Plot):
     color = Instance(ColorValued, allow_none=False).tag(sync=True, **widget_serialization)
 
     # Scalar field to produce isosurfaces of, if different from color field
-    field = Instance(Field, allow_none=True).tag(sync=True, **widget_serialization)
+    field = Union([Instance(Field), Instance(FieldSeries)], allow_none=True).tag(sync=True, **widget_serialization)
 
     # Configuration of values to show
     values = Instance(IsovalueParams, allow_none=False).tag(sync=True, **widget_serialization)
 
+    # Size along each axis of the table of isovalues for values.mode "list"
+    isosurface_table_size = CInt(256)
+
+    # First isovalue between the front and back values of a ray segment,
+    # with precomposed colors if color has an ArrayColorMap lut, see
+    # lututils.isosurface_table. Computed for values.mode "list" only.
+    isosurface_table = SharedDataUnion(None, dtype=np.float32, shape_constraint=shape_constraints(None, None, 4),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    # Widgets and traits observed to keep the table up to date
+    _isosurface_dependencies = ()
+
+    @observe("values", "field", "color", "isosurface_table_size")
+    def _update_isosurface_table(self, change):
+        # Observe the isovalues, the range of the field and the lut of the color
+        color_field = getattr(self.color, "field", None)
+        lut = getattr(self.color, "lut", None)
+        dependencies = [
+            (self.values, ("mode", "values")),
+            (self.color, ("field", "lut")),
+            (self.field, ("range",)),
+            (color_field if color_field is not self.field else None, ("range",)),
+            (lut, ("values",)),
+        ]
+        self._isosurface_dependencies = _observe_dependencies(
+            self._update_isosurface_table, self._isosurface_dependencies, dependencies)
+
+        table = None
+        field = self.field if self.field is not None else color_field
+        params = self.values
+        if (params is not None and params.mode == "list" and self.isosurface_table_size > 0
+                and field is not None and field.range is not None):
+            # Precomposed colors are only valid when the isovalues
+            # are values of the color field
+            colors = None
+            if isinstance(lut, ArrayColorMap) and field is color_field:
+                colors = get_union_array(lut.values)
+            table = isosurface_table(params.values, field.range, colors, self.isosurface_table_size)
+        self.set_trait("isosurface_table", table)
+
+    # Indices of cells where the field takes one of the isovalues for
+    # values.mode "single" and "list", None means all cells
+    active_cells = SharedDataUnion(None, dtype=np.int32, shape_constraint=shape_constraints(None),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    # Widgets and traits observed to keep the active cells up to date
+    _active_cells_dependencies = ()
+
+    @observe("mesh", "values", "field", "color", "restrict")
+    def _update_active_cells(self, change):
+        # Observe the isovalues and the values of the field, moving an
+        # isovalue only looks up the cells in the interval index of the field
+        color_field = getattr(self.color, "field", None)
+        field = self.field if self.field is not None else color_field
+        indicators = self.restrict.field if self.restrict is not None else None
+        dependencies = [
+            (self.values, ("mode", "value", "values")),
+            (self.color, ("field",)),
+            (field, ("values", "space")),
+            (self.mesh, ("cells",)),
+            (self.restrict, ("field", "value")),
+            (indicators, ("values",)),
+        ]
+        self._active_cells_dependencies = _observe_dependencies(
+            self._update_active_cells, self._active_cells_dependencies, dependencies)
+
+        active_cells = None
+        params = self.values
+        if params is not None and isinstance(field, Field) and field.mesh is self.mesh:
+            if params.mode == "single":
+                active_cells = field.find_cells(params.value)
+            elif params.mode == "list":
+                active_cells = field.find_cells(params.values)
+        if (active_cells is not None and indicators is not None
+                and indicators.space == "I3" and indicators.mesh is self.mesh):
+            selected = get_union_array(indicators.values)[active_cells] == self.restrict.value
+            active_cells = active_cells[selected]
+        self.set_trait("active_cells", active_cells)
+
+    def isosurfaces(self):
+        """Compute the triangles of the isosurfaces on the Python side.
+
+        Returns (triangles, values) like SlicePlot.cross_section, with the
+        isosurfaces of all isovalues together. Only the cells in
+        active_cells are cut when these are known. Isosurfaces of values
+        per cell (P0) are not supported, as these are constant in cells.
+        """
+        color_field = getattr(self.color, "field", None)
+        field = self.field if self.field is not None else color_field
+        if field is None:
+            raise ValueError("Expecting a field to compute isosurfaces of.")
+        if field.space == "P0":
+            raise NotImplementedError("Isosurfaces of P0 fields are not supported.")
+
+        cells = get_union_array(self.mesh.cells)
+        if self.active_cells is not None:
+            cut_cells = get_union_array(self.active_cells)
+        else:
+            cut_cells = np.arange(len(cells), dtype=np.int32)
+            indicators = self.restrict.field if self.restrict is not None else None
+            if indicators is not None and indicators.space == "I3" and indicators.mesh is self.mesh:
+                cut_cells = np.flatnonzero(get_union_array(indicators.values) == self.restrict.value)
+
+        values = _field_values(field)
+        if field.space == "P1":
+            cell_values = np.take(values, cells[cut_cells])
+        else:
+            cell_values = np.take(np.asarray(values).reshape(-1, 4), cut_cells, axis=0)
+        cell_values = np.asarray(cell_values, dtype=np.float64)
+
+        surfaces = [_level_set(self.mesh, cell_values - isovalue, cut_cells, color_field)
+            for isovalue in _isovalues(self.values, cell_values)]
+        triangles = np.concatenate([np.empty((0, 3, 3))] + [t for t, _ in surfaces])
+        values = None
+        if color_field is not None:
+            values = np.concatenate([np.empty((0, 3))] + [v for _, v in surfaces])
+        return triangles, values
+
     def dashboard(self):
         "Create a combined dashboard for this plot."
         names = ["restrict", "color", "field", "values"]
@@ -79,6 +332,115 @@ class IsosurfacePlot(Plot):
         return _make_accordion(children, titles)
 
 
+@register
+class SlicePlot(Plot):
+    """A plot widget showing a planar cross section of the mesh."""
+    _model_name = Unicode('SlicePlotModel').tag(sync=True)
+
+    # Color can be a constant or a field with color mapping
+    color = Instance(ColorValued, allow_none=False).tag(sync=True, **widget_serialization)
+
+    # The plane is the points x with dot(normal, x) == offset,
+    # normal is normalized before use
+    normal = Tuple(CFloat(), CFloat(), CFloat(), default_value=(0.0, 0.0, 1.0))
+    offset = CFloat(0.0).tag(sync=True)
+
+    # Distance along normal of each mesh vertex, the frontend
+    # draws the plane as the isosurface of these at offset
+    plane_distances = SharedDataUnion(None, dtype=np.float32, shape_constraint=shape_constraints(None),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    # Indices of cells crossing the plane, computed from mesh, normal,
+    # offset and restrict
+    slice_cells = SharedDataUnion(None, dtype=np.int32, shape_constraint=shape_constraints(None),
+        allow_none=True, read_only=True).tag(sync=True, **data_union_serialization)
+
+    # Interval index of the range of distances in each cell, such that
+    # moving the plane only looks up the cells crossing it
+    _plane_index = None
+
+    @validate("normal")
+    def _validate_normal(self, proposal):
+        normal = proposal["value"]
+        if not np.linalg.norm(normal) > 0.0:
+            raise TraitError("The normal of a SlicePlot must have a nonzero length, got %r." % (normal,))
+        return normal
+
+    @observe("mesh", "normal")
+    def _update_plane(self, change):
+        # Keep distances up to date when the cells or points of the mesh change
+        if change["name"] == "mesh":
+            if isinstance(change["old"], Mesh):
+                change["old"].unobserve(self._update_plane, ["cells", "points"])
+            if change["new"] is not None:
+                change["new"].observe(self._update_plane, ["cells", "points"])
+        distances = None
+        self._plane_index = None
+        if self.mesh is not None:
+            normal = np.asarray(self.normal, dtype=np.float64)
+            points = get_union_array(self.mesh.points)
+            distances = (points @ (normal / np.linalg.norm(normal))).astype(np.float32)
+            lower, upper = compute_cell_ranges(distances, "P1", get_union_array(self.mesh.cells))
+            self._plane_index = build_interval_index(lower, upper)
+        self.set_trait("plane_distances", distances)
+        self._update_slice_cells(change)
+
+    # Widgets and traits observed to keep the slice cells up to date
+    _slice_dependencies = ()
+
+    @observe("offset", "restrict")
+    def _update_slice_cells(self, change):
+        # Keep slice cells up to date when the indicators change
+        indicators = self.restrict.field if self.restrict is not None else None
+        dependencies = [
+            (self.restrict, ("field", "value")),
+            (indicators, ("values",)),
+        ]
+        self._slice_dependencies = _observe_dependencies(
+            self._update_slice_cells, self._slice_dependencies, dependencies)
+
+        slice_cells = None
+        if self._plane_index is not None:
+            slice_cells = query_interval_index(self._plane_index, self.offset)
+            if indicators is not None and indicators.space == "I3" and indicators.mesh is self.mesh:
+                selected = get_union_array(indicators.values)[slice_cells] == self.restrict.value
+                slice_cells = slice_cells[selected]
+        self.set_trait("slice_cells", slice_cells)
+
+    def cross_section(self):
+        """Compute the triangles of the cross section on the Python side.
+
+        Returns (triangles, values) with triangles of shape
+        (num_triangles, 3, 3) and the values of the color field at their
+        vertices, of shape (num_triangles, 3), or None for a constant color.
+        """
+        cells = get_union_array(self.mesh.cells)
+        distances = get_union_array(self.plane_distances).astype(np.float64) - self.offset
+        slice_cells = get_union_array(self.slice_cells)
+        return _level_set(self.mesh, np.take(distances, cells[slice_cells]), slice_cells,
+            getattr(self.color, "field", None))
+
+    def dashboard(self):
+        "Create a combined dashboard for this plot."
+        children, titles = _gather_dashboards(self, ["restrict", "color"])
+
+        # Offsets from the lowest to the highest distance of a vertex,
+        # or around the current offset while there are no vertices
+        distances = self.plane_distances
+        if distances is not None and get_union_array(distances).size > 0:
+            distances = get_union_array(distances)
+            lo, hi = float(distances.min()), float(distances.max())
+        else:
+            lo, hi = self.offset - 1.0, self.offset + 1.0
+        w = widgets.FloatSlider(value=self.offset, min=lo, max=hi, step=(hi - lo) / 100 or 0.1,
+            description="Offset")
+        widgets.jslink((w, "value"), (self, "offset"))
+        children.append(w)
+        titles.append("Offset")
+
+        return _make_accordion(children, titles)
+
+
 @register
 class XrayPlot(Plot):
     """An xray plot widget"""
@@ -185,6 +547,16 @@ class VolumePlot(Plot):
     # TODO: Validate in range [-10, 10]
     exposure = CFloat(0.0).tag(sync=True)
 
+    # How to order cells back to front, by cell centroid depth
+    # or exactly by a topological sort using cell adjacency
+    ordering = Enum(["depth", "topological"], "depth").tag(sync=True)
+
+    @observe("mesh", "ordering")
+    def _request_neighbors(self, change):
+        # Cell adjacency is computed once per mesh and shared by plots
+        if self.ordering == "topological" and self.mesh is not None:
+            self.mesh.compute_neighbors()
+
     def dashboard(self):
         "Create a combined dashboard for this plot."
         children, titles = _gather_dashboards(self, ["restrict", "color"])
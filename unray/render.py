@@ -0,0 +1,464 @@
+"""Offscreen rendering of plots to images without a browser.
+
+Plots are rendered on the CPU with vectorized NumPy, following the
+conventions of the frontend: a three.js style perspective camera,
+lookup tables sampled like linearly filtered textures, and the same
+emission and light model as the shaders. This allows batch jobs to
+produce images on machines without a browser or GPU:
+
+    image = render(plot, Camera(position=(3, 2, 1)), width=800, height=600)
+    write_png("plot.png", image)
+
+Many plots, e.g. one per timestep, are rendered in parallel by
+render_batch, which prepares the plot data in this process and
+rasterizes in a pool of worker processes.
+
+SurfacePlot, the cross sections of SlicePlot and the isosurfaces of
+IsosurfacePlot are rasterized here, while the volumetric plots XrayPlot,
+MinPlot, MaxPlot, SumPlot and VolumePlot are integrated along pixel
+rays by unray.cpu.
+"""
+
+import re
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from ipydatawidgets import get_union_array
+
+from .meshutils import tetrahedron_face_vertices
+from .lututils import sample_lut
+from .datawidgets import (
+    FieldSeries, ColorConstant, ColorField, ArrayColorMap,
+)
+from .plotwidgets import SurfacePlot, SlicePlot, IsosurfacePlot
+
+
+# Named colors accepted in addition to hex, rgb() and hsl() colors
+_named_colors = {
+    "black": "#000000", "white": "#ffffff", "gray": "#808080", "grey": "#808080",
+    "red": "#ff0000", "green": "#008000", "blue": "#0000ff",
+    "yellow": "#ffff00", "cyan": "#00ffff", "magenta": "#ff00ff",
+}
+
+
+def parse_color(color):
+    """Convert a CSS color string to an RGB array with components in [0, 1].
+
+    Supports hex colors (#rgb, #rrggbb), rgb(r, g, b), hsl(h, s%, l%)
+    and a few named colors.
+    """
+    text = _named_colors.get(color.strip().lower(), color.strip().lower())
+    if text.startswith("#"):
+        digits = text[1:]
+        if len(digits) == 3:
+            digits = "".join(2 * d for d in digits)
+        if len(digits) == 6:
+            return np.asarray([int(digits[i:i + 2], 16) for i in (0, 2, 4)]) / 255.0
+    match = re.match(r"(rgb|hsl)a?\(([^)]*)\)$", text)
+    if match:
+        args = [a.strip() for a in match.group(2).split(",")]
+        if match.group(1) == "rgb":
+            return np.asarray([float(a.rstrip("%")) * (2.55 if a.endswith("%") else 1.0) for a in args[:3]]) / 255.0
+        h = float(args[0]) / 360.0 % 1.0
+        s = float(args[1].rstrip("%")) / 100.0
+        l = float(args[2].rstrip("%")) / 100.0
+        # Same conversion as three.js Color.setHSL
+        q = l * (1.0 + s) if l <= 0.5 else l + s - l * s
+        p = 2.0 * l - q
+        def hue(t):
+            t %= 1.0
+            if t < 1.0 / 6.0:
+                return p + (q - p) * 6.0 * t
+            if t < 0.5:
+                return q
+            if t < 2.0 / 3.0:
+                return p + (q - p) * 6.0 * (2.0 / 3.0 - t)
+            return p
+        return np.asarray([hue(h + 1.0 / 3.0), hue(h), hue(h - 1.0 / 3.0)])
+    raise ValueError("Invalid color %r." % (color,))
+
+
+class Camera(object):
+    """Perspective camera looking from position towards target.
+
+    Like a three.js PerspectiveCamera, fov is the vertical field of
+    view in degrees. Without a position, the camera is placed along
+    direction from target at a distance where the whole mesh fits in
+    view, and without a target it looks at the center of the mesh.
+    """
+
+    def __init__(self, position=None, target=None, up=(0.0, 0.0, 1.0), fov=50.0,
+                 direction=(1.0, 1.0, 1.0)):
+        self.position = position
+        self.target = target
+        self.up = up
+        self.fov = fov
+        self.direction = direction
+
+    def fit(self, points):
+        """Create a copy of this camera with position and target set,
+        using the bounding sphere of points for missing values."""
+        points = np.asarray(points, dtype=np.float64)
+        lo = points.min(axis=0)
+        hi = points.max(axis=0)
+        center = 0.5 * (lo + hi)
+        radius = 0.5 * np.linalg.norm(hi - lo)
+        target = center if self.target is None else np.asarray(self.target, dtype=np.float64)
+        position = self.position
+        if position is None:
+            direction = np.asarray(self.direction, dtype=np.float64)
+            direction = direction / np.linalg.norm(direction)
+            distance = radius / np.sin(np.radians(0.5 * self.fov))
+            position = target + distance * direction
+        return Camera(position=np.asarray(position, dtype=np.float64), target=target,
+            up=self.up, fov=self.fov, direction=self.direction)
+
+    def basis(self):
+        """Return (right, up, forward) unit vectors of the camera."""
+        forward = np.asarray(self.target, dtype=np.float64) - np.asarray(self.position, dtype=np.float64)
+        forward /= np.linalg.norm(forward)
+        right = np.cross(forward, np.asarray(self.up, dtype=np.float64))
+        if np.linalg.norm(right) < 1e-12:
+            # Looking along up, pick any perpendicular direction
+            right = np.cross(forward, np.eye(3)[np.argmin(np.abs(forward))])
+        right /= np.linalg.norm(right)
+        up = np.cross(right, forward)
+        return right, up, forward
+
+    def project(self, points, width, height):
+        """Project points to pixel coordinates.
+
+        Returns (xy, depth) where xy are pixel coordinates with the
+        origin in the top left corner of the image, and depth is the
+        distance from the camera along the view direction.
+        """
+        right, up, forward = self.basis()
+        d = np.asarray(points, dtype=np.float64) - np.asarray(self.position, dtype=np.float64)
+        depth = d @ forward
+        scale = 1.0 / np.tan(np.radians(0.5 * self.fov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = (d @ right) * scale / (depth * width / height)
+            y = (d @ up) * scale / depth
+        xy = np.stack([0.5 * (x + 1.0) * width, 0.5 * (1.0 - y) * height], axis=-1)
+        return xy, depth
+
+
+def _scaled_values(field, values):
+    lo, hi = field.range
+    scale = 1.0 / (hi - lo) if hi != lo else 1.0
+    return (np.asarray(values, dtype=np.float64) - lo) * scale
+
+
+def _field_values(field):
+    values = get_union_array(field.values)
+    if isinstance(field, FieldSeries):
+        values = values[field.frame]
+    return values
+
+
+def _face_values(field, cells, face_cells, face_index):
+    "Values of field at the vertices of the given faces, shape (num_faces, 3)."
+    values = _field_values(field)
+    local = tetrahedron_face_vertices[face_index]
+    if field.space == "P0":
+        return np.repeat(np.asarray(values)[face_cells, None], 3, axis=1)
+    elif field.space == "P1":
+        return np.asarray(values)[cells[face_cells[:, None], local]]
+    elif field.space == "D1":
+        return np.asarray(values)[4 * face_cells[:, None] + local]
+    raise ValueError("Invalid field space %r." % (field.space,))
+
+
+def _surface_faces(plot):
+    "Find (cells, local faces) drawn by a surface plot."
+    mesh = plot.mesh
+    cells = get_union_array(mesh.cells)
+    neighbors = mesh._cell_neighbors()
+    restrict = plot.restrict
+    if restrict is None:
+        drawn = neighbors < 0
+    elif restrict.field.space == "I3":
+        # Faces of selected cells not shared with other selected cells
+        selected = get_union_array(restrict.field.values) == restrict.value
+        drawn = selected[:, None] & ((neighbors < 0) | ~selected[neighbors])
+    elif restrict.field.space == "I2":
+        # Marked facets of any cell
+        drawn = get_union_array(restrict.field.values).reshape(-1, 4) == restrict.value
+    else:
+        raise NotImplementedError("Restriction to %s indicators is not supported." % (restrict.field.space,))
+    face_cells, face_index = np.nonzero(drawn)
+    return cells, face_cells, face_index
+
+
+def _color_values(color, num_triangles, field_values):
+    """Map the color of a plot to values at triangle vertices like the shaders.
+
+    Returns (values, lut, rgb), a constant color is its intensity times
+    its color, a field is mapped from values scaled by its range, given
+    by field_values(field) of shape (num_triangles, 3).
+    """
+    lut = None
+    rgb = np.ones(3)
+    values = np.ones((num_triangles, 3))
+    if isinstance(color, ColorConstant):
+        rgb = parse_color(color.color)
+        values *= color.intensity
+    elif isinstance(color, ColorField):
+        values = _scaled_values(color.field, field_values(color.field))
+        if isinstance(color.lut, ArrayColorMap):
+            lut = np.asarray(get_union_array(color.lut.values), dtype=np.float64)
+        elif color.lut is not None:
+            raise NotImplementedError("Only ArrayColorMap lookup tables are supported.")
+    elif color is not None:
+        raise NotImplementedError("Color %r is not supported." % (color,))
+    return values, lut, rgb
+
+
+def prepare_surface(plot):
+    """Gather the data needed to render a SurfacePlot.
+
+    Returns a dict of plain arrays, which is cheap to pass to
+    worker processes, unlike the widgets themselves.
+    """
+    cells, face_cells, face_index = _surface_faces(plot)
+    points = get_union_array(plot.mesh.points)
+    local = tetrahedron_face_vertices[face_index]
+    triangles = np.asarray(points, dtype=np.float64)[cells[face_cells[:, None], local]]
+    values, lut, rgb = _color_values(plot.color, len(face_cells),
+        lambda field: _face_values(field, cells, face_cells, face_index))
+    return dict(method="surface", triangles=triangles, values=values, lut=lut, color=rgb,
+        points=np.asarray(points, dtype=np.float64))
+
+
+def prepare_slice(plot):
+    """Gather the data needed to render a SlicePlot.
+
+    The cross section is drawn like a surface, see prepare_surface.
+    """
+    triangles, field_values = plot.cross_section()
+    points = get_union_array(plot.mesh.points)
+    values, lut, rgb = _color_values(plot.color, len(triangles), lambda field: field_values)
+    return dict(method="surface", triangles=triangles, values=values, lut=lut, color=rgb,
+        points=np.asarray(points, dtype=np.float64))
+
+
+def prepare_isosurface(plot):
+    """Gather the data needed to render an IsosurfacePlot.
+
+    The isosurfaces are computed by IsosurfacePlot.isosurfaces and
+    drawn like a surface, see prepare_slice.
+    """
+    triangles, field_values = plot.isosurfaces()
+    points = get_union_array(plot.mesh.points)
+    values, lut, rgb = _color_values(plot.color, len(triangles), lambda field: field_values)
+    return dict(method="surface", triangles=triangles, values=values, lut=lut, color=rgb,
+        points=np.asarray(points, dtype=np.float64))
+
+
+def prepare(plot):
+    "Gather the data needed to render plot, see render_prepared."
+    from . import cpu
+    if isinstance(plot, SurfacePlot):
+        return prepare_surface(plot)
+    if isinstance(plot, SlicePlot):
+        return prepare_slice(plot)
+    if isinstance(plot, IsosurfacePlot):
+        return prepare_isosurface(plot)
+    if type(plot) in cpu._plot_methods:
+        return cpu.prepare(plot)
+    raise NotImplementedError("Rendering %s is not supported." % (type(plot).__name__,))
+
+
+def rasterize(xy, depth, width, height, chunk_size=1 << 22):
+    """Find the closest triangle covering the center of each pixel.
+
+    Takes pixel coordinates xy of shape (num_triangles, 3, 2) and
+    camera depths of shape (num_triangles, 3). Returns (triangles,
+    weights, depths) with the index of the closest triangle for each
+    pixel or -1, the perspective correct barycentric coordinates of the
+    pixel center in it, and its depth. Triangles crossing the near
+    plane of the camera are skipped.
+
+    Candidate pixels in the bounding box of each triangle are tested
+    at once for up to chunk_size pixels at a time.
+    """
+    triangles = np.full(height * width, -1, dtype=np.int64)
+    weights = np.zeros((height * width, 3))
+    depths = np.full(height * width, np.inf)
+
+    a, b, c = xy[:, 0], xy[:, 1], xy[:, 2]
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+    x0 = np.clip(np.ceil(xy[..., 0].min(axis=1) - 0.5), 0, width)
+    x1 = np.clip(np.floor(xy[..., 0].max(axis=1) - 0.5) + 1, 0, width)
+    y0 = np.clip(np.ceil(xy[..., 1].min(axis=1) - 0.5), 0, height)
+    y1 = np.clip(np.floor(xy[..., 1].max(axis=1) - 0.5) + 1, 0, height)
+    visible = (depth > 0).all(axis=1) & (area != 0) & (x1 > x0) & (y1 > y0)
+    ids = np.flatnonzero(visible)
+    nx = (x1 - x0)[ids].astype(np.int64)
+    counts = nx * (y1 - y0)[ids].astype(np.int64)
+
+    # Split triangles in chunks of about chunk_size candidate pixels
+    ends = np.cumsum(counts)
+    bounds = np.searchsorted(ends, np.arange(chunk_size, ends[-1] if len(ends) else 0, chunk_size))
+    for chunk in np.split(np.arange(len(ids)), np.unique(bounds)):
+        if not len(chunk):
+            continue
+        t = np.repeat(ids[chunk], counts[chunk])
+        starts = np.repeat(np.cumsum(counts[chunk]) - counts[chunk], counts[chunk])
+        k = np.arange(len(t)) - starts
+        n = np.repeat(nx[chunk], counts[chunk])
+        px = x0[t].astype(np.int64) + k % n
+        py = y0[t].astype(np.int64) + k // n
+
+        # Screen space barycentric coordinates of pixel centers
+        cx = px + 0.5
+        cy = py + 0.5
+        def edge(p, q):
+            return ((q[t, 0] - p[t, 0]) * (cy - p[t, 1]) - (q[t, 1] - p[t, 1]) * (cx - p[t, 0])) / area[t]
+        l = np.stack([edge(b, c), edge(c, a), edge(a, b)], axis=1)
+        inside = (l >= 0).all(axis=1)
+        t, l, px, py = t[inside], l[inside], px[inside], py[inside]
+
+        # Perspective correct interpolation, 1/depth is linear in screen space
+        inv = l / depth[t]
+        inv_depth = inv.sum(axis=1)
+        z = 1.0 / inv_depth
+        w = inv * z[:, None]
+
+        # Closest candidate per pixel, then compare with earlier chunks
+        pixel = py * width + px
+        order = np.lexsort((z, pixel))
+        pixel = pixel[order]
+        first = np.ones(len(pixel), dtype=bool)
+        first[1:] = pixel[1:] != pixel[:-1]
+        order = order[first]
+        pixel = pixel[first]
+        closer = z[order] < depths[pixel]
+        order = order[closer]
+        pixel = pixel[closer]
+        triangles[pixel] = t[order]
+        weights[pixel] = w[order]
+        depths[pixel] = z[order]
+
+    shape = (height, width)
+    return triangles.reshape(shape), weights.reshape(shape + (3,)), depths.reshape(shape)
+
+
+def _render_surface(scene, camera, width, height):
+    "Render prepared surface data, returns RGB colors and coverage."
+    triangles = scene["triangles"]
+    xy, depth = camera.project(triangles, width, height)
+    tri, weights, _ = rasterize(xy, depth, width, height)
+    covered = tri >= 0
+    t = tri[covered]
+    w = weights[covered]
+
+    # Interpolate scaled values and map through lut
+    values = (w * scene["values"][t]).sum(axis=1)
+    if scene["lut"] is not None:
+        colors = sample_lut(scene["lut"], values)
+    else:
+        colors = values[:, None] * scene["color"][None, :]
+
+    # Light model of fragment-surface.glsl with the default
+    # emission intensity range, using abs to light both sides
+    a, b, c = triangles[t, 0], triangles[t, 1], triangles[t, 2]
+    normals = np.cross(b - a, c - a)
+    normals /= np.linalg.norm(normals, axis=1)[:, None]
+    positions = (w[:, :, None] * triangles[t]).sum(axis=1)
+    view = positions - np.asarray(camera.position)[None, :]
+    view /= np.linalg.norm(view, axis=1)[:, None]
+    cos_v_n = np.abs((normals * view).sum(axis=1))
+    k = 0.5 + 0.5 * cos_v_n
+
+    image = np.zeros((height, width, 3))
+    image[covered] = k[:, None] * colors
+    return image, covered
+
+
+def render_prepared(scene, camera=None, width=640, height=480, background=None, steps=1, processes=1):
+    """Render data from prepare(plot) to an image.
+
+    Returns an array of shape (height, width, 4) with RGBA colors as
+    uint8. Pixels not covered by the plot get the background color,
+    or are transparent if background is None.
+
+    Volumetric plots are integrated by unray.cpu.render_prepared with
+    steps pieces per ray segment, splitting the image in tiles over
+    processes worker processes.
+    """
+    from . import cpu
+    if scene["method"] in cpu.methods:
+        return cpu.render_prepared(scene, camera, width, height, background,
+            steps=steps, processes=processes)
+    camera = (camera or Camera()).fit(scene["points"])
+    if scene["method"] == "surface":
+        rgb, alpha = _render_surface(scene, camera, width, height)
+    else:
+        raise NotImplementedError("Rendering method %r is not supported." % (scene["method"],))
+    alpha = np.asarray(alpha, dtype=np.float64)
+    if background is not None:
+        # Composite over an opaque background
+        rgb = rgb + (1.0 - alpha)[..., None] * parse_color(background)[None, None, :]
+        alpha = np.ones_like(alpha)
+    image = np.concatenate([rgb, alpha[..., None]], axis=-1)
+    return np.round(255.0 * np.clip(image, 0.0, 1.0)).astype(np.uint8)
+
+
+def render(plot, camera=None, width=640, height=480, background=None, steps=1, processes=1):
+    """Render plot to an image on the CPU, without a browser.
+
+    The camera defaults to a view of the whole mesh, see Camera.
+    Returns an array of shape (height, width, 4) with RGBA colors as uint8.
+    """
+    return render_prepared(prepare(plot), camera, width, height, background, steps, processes)
+
+
+def encode_png(image):
+    "Encode an RGBA or RGB image array of uint8 as PNG."
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width, channels = image.shape
+    color_type = {3: 2, 4: 6}[channels]
+    # Each row starts with filter type 0 (none)
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, -1)], axis=1)
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+    header = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b""))
+
+
+def write_png(filename, image):
+    "Write an RGBA or RGB image array of uint8 to a PNG file."
+    with open(filename, "wb") as f:
+        f.write(encode_png(image))
+
+
+def _render_task(args):
+    scene, filename, kwargs = args
+    image = render_prepared(scene, **kwargs)
+    if filename is None:
+        return image
+    write_png(filename, image)
+    return filename
+
+
+def render_batch(plots, filenames=None, processes=None, **kwargs):
+    """Render many plots in parallel in a pool of processes.
+
+    Plot data is gathered in this process and passed to the workers
+    as plain arrays. With filenames, the workers write the images to
+    PNG files and the filenames are returned, otherwise the images.
+    Keyword arguments are passed on to render for each plot, and
+    processes is the number of workers, by default one per core.
+    """
+    scenes = [prepare(plot) for plot in plots]
+    if filenames is None:
+        filenames = [None] * len(scenes)
+    tasks = [(scene, filename, kwargs) for scene, filename in zip(scenes, filenames)]
+    if processes == 1:
+        return [_render_task(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(_render_task, tasks))